@@ -6,15 +6,13 @@ def count_brands_by_group():
     data_dir = Path('data')
     counts = {}
 
-    # A-Z
-    ae_count = 0
+    # A-Z（文字ごとの件数。累計ではない）
     for letter in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ':
         file_path = data_dir / f'fragrantica_brands_{letter}.json'
         if file_path.exists():
             with open(file_path, 'r') as f:
                 brands = json.load(f)
-                ae_count += len(brands)
-        counts[letter] = ae_count
+                counts[letter] = len(brands)
 
     return counts
 
@@ -16,3 +16,202 @@ SCRAPING_CONFIG = {
 
 # 出力設定
 OUTPUT_DIR = Path('/app/data')
+
+# レート制限設定（ホスト単位のトークンバケット + AIMD）
+# バケットはホスト単位でプロセス内の全ワーカーが共有する。レートはワーカーごとではなくホスト全体の値で、
+# ワーカーを増やしても上限はmax_rate×ワーカー数（host_max_rateで頭打ち）を超えない（scale_rate_config）
+RATE_LIMIT_CONFIG = {
+    'initial_rate': 0.1,            # 秒あたりのリクエスト数（約10秒に1回）
+    'min_rate': 0.01,
+    'max_rate': 1.0,                # 1ワーカーあたりの上限（ワーカー数倍したものがホストの上限）
+    'host_max_rate': 2.0,           # ワーカー数によらないホスト全体の上限
+    'burst': 2,                     # バケット容量
+    'additive_increase': 0.005,     # 200応答ごとの加算
+    'multiplicative_decrease': 0.5,  # 429/403/チャレンジ時の乗数
+    'jitter': 0.3,                  # 待機時間に加えるランダム幅（割合）
+    'cooldown': {                   # 状態ごとのホスト全体の停止時間（秒）
+        429: 60,
+        403: 45,
+        'challenge': 30,
+        'error': 10,
+    },
+    # 同じホストの全プロセスでレートを共有する調整役（python -m scraper.rate_coordinator）
+    # 指定した場合、上記のレートはプロセスごとではなく全体の値になる
+    'coordinator_socket': None,     # UNIXソケットのパス
+    'coordinator_reconnect': 5.0,   # 秒（接続できない間はこの間隔で再接続を試みる）
+}
+
+# リソースブロック設定（context.routeで適用）
+RESOURCE_BLOCKING_CONFIG = {
+    'enabled': True,
+    # 種類で遮断するリソース
+    'block_resource_types': ['image', 'media', 'font'],
+    # 常に許可するドメイン（Cloudflareチャレンジを含む）
+    'allow_domains': [
+        'fragrantica.com',
+        'fimgs.net',
+        'cloudflare.com',
+    ],
+    # 種類に関係なく遮断するドメイン（広告・計測）
+    'deny_domains': [
+        'doubleclick.net',
+        'googletagmanager.com',
+        'google-analytics.com',
+        'googlesyndication.com',
+        'amazon-adsystem.com',
+        'a.pub.network',
+        'primis.tech',
+        'criteo.net',
+        'quantserve.com',
+        'quantcount.com',
+        'crwdcntrl.net',
+        'fastclick.net',
+        'hadron.ad.gt',
+        'hadronid.net',
+        'id5-sync.com',
+        'edkt.io',
+        '33across.com',
+        'pubmatic.com',
+        'punmiris.com',
+    ],
+    # 許可ドメイン以外のスクリプト・XHR・iframeを遮断
+    'block_third_party': True,
+}
+
+# ブラウザプール設定
+BROWSER_POOL_CONFIG = {
+    'size': 1,                      # 稼働させるブラウザ数
+    'warm_spares': 1,               # 入れ替え用に事前起動しておくブラウザ数
+    'contexts_per_browser': 1,
+    'max_pages_per_context': 4,     # 1コンテキストを同時に貸し出せる数
+    'max_age': 1800,                # 秒（これを超えたら退役）
+    'min_health': 0.3,              # これを下回ったら退役
+    'min_requests_for_error_rate': 5,
+    'throttle_penalty': 0.25,       # 429/403 1回あたりの減点
+    'challenge_penalty': 0.15,      # チャレンジ1回あたりの減点
+    'max_rss_mb': 3072,             # プロセスツリー全体のRSS上限
+    'maintenance_interval': 30,     # 秒
+    'proxy': None,                  # コンテキストのプロキシ（例: socks5://127.0.0.1:9050）
+    'tor_identities': 0,            # 0より大きければ分離したTor回路をコンテキストごとに割り当てる
+}
+
+# Tor設定（torrcのSocksPortにIsolateSOCKSAuthが必要）
+TOR_CONFIG = {
+    'host': '127.0.0.1',
+    'control_port': 9051,
+    'socks_port': 9050,
+    'password': None,               # HashedControlPasswordのパスワード
+    'cookie_path': None,            # CookieAuthenticationのCookieファイル
+    'min_health': 0.3,              # これを下回った回路は切り替える
+    'min_requests_for_error_rate': 5,
+    'throttle_penalty': 0.25,
+    'challenge_penalty': 0.15,
+    'newnym_interval': 10,          # SIGNAL NEWNYMの最短間隔（秒）
+}
+
+# Cloudflare通過状態（storage_state）のキャッシュ設定
+CLEARANCE_CACHE_CONFIG = {
+    'enabled': True,
+    'path': OUTPUT_DIR / 'clearance',
+    'cookie_name': 'cf_clearance',
+    'max_age': 12 * 3600,           # Cookieの期限より短ければこちらを優先（秒）
+    'expiry_margin': 60,            # Cookieの期限のこの秒数前に失効扱い
+    'save_interval': 60,            # 同じブラウザで保存を試みる間隔（秒）
+}
+
+# クロールフロンティア設定
+FRONTIER_CONFIG = {
+    'filename': 'frontier.sqlite3',  # brand_data_dir直下に作成
+    'max_attempts': 5,               # これを超えたURLはfailedとして残す
+    'base_backoff': 60,              # 秒（失敗ごとに倍増）
+    'max_backoff': 3600,             # 秒
+    # ジャーナルモード（'auto': ローカルはWAL、NFS等のネットワークボリューム上はDELETE）
+    # どちらでも共有できるのは同じホストのコンテナ間のみ（複数ノードからは使わない）
+    'journal_mode': 'auto',
+    # 同じホストの複数コンテナで共有する場合のリース
+    'lease_ttl': 300,                # 秒（ハートビートが途絶えてからこの時間で他のワーカーが奪う）
+    'heartbeat_interval': 60,        # 秒
+    'owner': None,                   # リースの所有者（Noneならホスト名:PID）
+    # 取り出し順（'priority': 期待される新規レコード・鮮度・失敗率の点数順 / 'fifo': 追加順）
+    'scheduler': 'priority',
+    'staleness_weight': 1.0,         # 未取得・鮮度切れのURLへの加点
+    'staleness_horizon': 30 * 24 * 3600,  # 秒（前回完了からこの時間で鮮度切れ度が最大）
+    'failure_weight': 0.8,           # 失敗率1.0での減点の割合
+    'aging_per_hour': 0.5,           # 実行可能になってから1時間ごとの加点（飢餓を防ぐ）
+}
+
+# レコード保存設定（segmentバックエンド）
+STORAGE_CONFIG = {
+    'compression': 'none',              # 'none' | 'zstd'（zstandardが必要）
+    'segment_max_bytes': 64 * 1024 * 1024,
+    'group_commit_records': 500,        # この件数でコミット
+    'group_commit_bytes': 1024 * 1024,  # このサイズでコミット
+    'commit_interval': 5.0,             # 秒（件数に達しなくてもコミット）
+    'fsync': 'interval',                # 'always' | 'interval' | 'never'
+    'fsync_interval': 30.0,             # 秒
+}
+
+# カタログDB設定（sqliteバックエンド）
+CATALOG_CONFIG = {
+    'filename': 'catalog.sqlite3',  # brand_data_dir直下に作成
+}
+
+# HTMLアーカイブ設定
+ARCHIVE_CONFIG = {
+    'enabled': True,
+    'dirname': 'archive',                  # brand_data_dir直下に作成
+    'segment_max_bytes': 256 * 1024 * 1024,
+    'compression_level': 10,
+    'dict_size': 112 * 1024,               # zstd辞書のサイズ
+    'dict_training_samples': 200,          # この件数の新規ページで辞書を学習
+    'dict_sample_bytes': 32 * 1024,        # 学習に使うページ先頭・末尾のバイト数
+}
+
+# 差分クロール設定（INCREMENTAL=1で有効）
+INCREMENTAL_CONFIG = {
+    'perfume_ttl': 30 * 24 * 3600,  # 詳細ページを再取得するまでの鮮度（秒）
+}
+
+# パイプライン設定（TASK_NAME=pipelineでブランド→基本情報→詳細を1プロセスで実行）
+PIPELINE_CONFIG = {
+    'brand_channel_size': 200,      # ブランド→基本情報のチャネルの上限（件）
+    'perfume_channel_size': 1000,   # 基本情報→詳細のチャネルの上限（件）
+}
+
+# シャード計画設定（python -m utils.shard_plannerで全ブランドを所要時間の均等なシャードに分割）
+SHARD_PLANNER_CONFIG = {
+    'dirname': OUTPUT_DIR / 'shards',   # マニフェストの出力先
+    # トレースに履歴がない場合の見積もり（秒）
+    'brand_seconds': 20.0,              # ブランドページ1件
+    'perfume_seconds': 12.0,            # 詳細ページ1件
+    'min_samples': 3,                   # ブランド別の履歴を使う最小スパン数
+}
+
+# メトリクス設定（GET /metricsでPrometheus形式を公開）
+METRICS_CONFIG = {
+    'enabled': True,
+    'host': '0.0.0.0',              # コンテナ外のPrometheusから取得できるよう全IFで待ち受け（METRICS_HOSTで変更）
+    'port': 9108,                   # 0で公開しない
+    # 取得フェーズの所要時間のバケット（秒）
+    'latency_buckets': (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+}
+
+# トレース設定（スパンをJSONLに書き出し、python -m utils.tracingでタイムラインを表示）
+TRACING_CONFIG = {
+    'enabled': True,
+    'dirname': OUTPUT_DIR / 'traces',
+}
+
+# ロギング設定（QueueHandler経由で別スレッドから出力）
+LOGGING_CONFIG = {
+    'format': 'text',               # 'text'（色付き） | 'json'（1行1レコード）
+    'level': 'INFO',
+    # 同じ呼び出し箇所からのWARNING未満のログの間引き
+    'sample_window': 10.0,          # 秒
+    'sample_burst': 20,             # ウィンドウ内でそのまま出力する件数
+    'sample_every': 50,             # 超えた分はこの件数に1件だけ出力
+    # ロガーごとのWARNING未満のログの上限（トークンバケット）
+    'logger_rate': 200.0,           # 件/秒
+    'logger_burst': 500,
+    'capture_prints': False,        # print()の出力もロギングに流す
+}
@@ -0,0 +1,97 @@
+# src/core/channel.py
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+
+class ChannelClosed(Exception):
+    """閉じたチャネルに送信した"""
+    pass
+
+
+class Channel:
+    """
+    ステージ間で記録を受け渡す上限付きの非同期チャネル
+    満杯の間は送信側を待たせ（背圧）、送信側がclose()した後は残りを受け取り終えると終端になる
+    """
+
+    def __init__(self, maxsize: int = 100, name: str = 'channel'):
+        self.name = name
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, maxsize))
+        self._closed = asyncio.Event()
+        self.sent = 0
+        self.received = 0
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    @property
+    def exhausted(self) -> bool:
+        """閉じられ、かつ全件を受け取り終えた"""
+        return self.closed and self._queue.empty()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    async def send(self, item: Any) -> None:
+        """1件送信（満杯なら空くまで待つ）"""
+        if self.closed:
+            raise ChannelClosed(f"{self.name} is closed")
+        await self._queue.put(item)
+        self.sent += 1
+
+    def close(self) -> None:
+        """これ以上送信しないことを通知（受信待ちは起こされる）"""
+        self._closed.set()
+
+    def receive_nowait(self, max_items: int) -> List[Any]:
+        """待たずに受け取れる分だけ受け取る（最大max_items件）"""
+        items = []
+        while len(items) < max_items and not self._queue.empty():
+            items.append(self._queue.get_nowait())
+        self.received += len(items)
+        return items
+
+    async def receive_batch(self, max_items: int, timeout: Optional[float] = None) -> List[Any]:
+        """
+        1件以上届くまで待ち、その時点で届いている分をまとめて受け取る
+        タイムアウトした場合と、終端に達した場合は空のリスト
+        """
+        items = self.receive_nowait(max_items)
+        if items or self.closed:
+            return items
+        getter = asyncio.ensure_future(self._queue.get())
+        closer = asyncio.ensure_future(self._closed.wait())
+        try:
+            await asyncio.wait(
+                {getter, closer}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closer.cancel()
+            if not getter.done():
+                getter.cancel()
+        if getter.done() and not getter.cancelled():
+            self.received += 1
+            return [getter.result()] + self.receive_nowait(max_items - 1)
+        # 待機中に閉じられた場合も、閉じる前に送られた分は受け取る
+        return self.receive_nowait(max_items)
+
+    async def receive(self) -> Optional[Any]:
+        """1件受け取る（終端に達したらNone）"""
+        items = await self.receive_batch(1)
+        return items[0] if items else None
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        while True:
+            item = await self.receive()
+            if item is None:
+                return
+            yield item
+
+    def get_stats(self) -> Dict:
+        return {
+            'name': self.name,
+            'sent': self.sent,
+            'received': self.received,
+            'buffered': self.qsize(),
+            'closed': self.closed,
+        }
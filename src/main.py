@@ -2,53 +2,151 @@
 import asyncio
 import logging
 import os
+from pathlib import Path
 
+from config.constants import LETTER_GROUPS
+from config.settings import METRICS_CONFIG, RATE_LIMIT_CONFIG, TRACING_CONFIG
+from scraper.rate_coordinator import RateCoordinatorClient
+from scraper.rate_limiter import (HostRateLimiter, get_rate_limiter, scale_rate_config,
+                                  set_rate_limiter)
 from tasks.brand_scraping import BrandScrapingTask
 from tasks.fragrance_basic_scraping import FragranceBasicScrapingTask
 from tasks.perfume_detail_scraping import PerfumeDetailScrapingTask
+from tasks.pipeline import PipelineTask
+from utils.logger import log_stats as log_logging_stats
 from utils.logger import setup_logger
+from utils.metrics import MetricsServer, get_metrics
+from utils.tracing import get_tracer, trace_path
+
+
+def parse_letter_groups(value: str) -> list:
+    """単一グループ（1）、複数グループ（1,3）、または全グループ（all）"""
+    return list(LETTER_GROUPS) if value == 'all' else [int(group) for group in value.split(',')]
 
 
 async def main():
     """メインエントリーポイント"""
     try:
-        # ロギングの設定
-        setup_logger()
+        # ロギングの設定（LOG_FORMAT=jsonで1行1レコードのJSON、LOG_CAPTURE_PRINTS=1でprint()も流す）
+        setup_logger({
+            'format': os.getenv('LOG_FORMAT', 'text'),
+            'level': os.getenv('LOG_LEVEL', 'INFO'),
+            'capture_prints': os.getenv('LOG_CAPTURE_PRINTS') == '1',
+        })
         logger = logging.getLogger(__name__)
 
+        # 同じホストのコンテナ間でレートとクールダウンを共有（タスクの生成前に設定）
+        coordinator_socket = os.getenv(
+            'RATE_COORDINATOR_SOCKET', RATE_LIMIT_CONFIG['coordinator_socket'])
+        if coordinator_socket:
+            set_rate_limiter(RateCoordinatorClient(coordinator_socket))
+        else:
+            # 全ワーカーが1つのホストバケットを共有するため、上限レートをワーカー数に合わせる
+            set_rate_limiter(HostRateLimiter(
+                scale_rate_config(int(os.getenv('WORKER_COUNT', 1)))))
+
         # タスクの種類を環境変数から取得
         task_name = os.getenv('TASK_NAME', 'brand_scraping')
         logger.info(f"Starting task: {task_name}")
 
         # タスクの初期化
         if task_name == 'brand_scraping':
-            letter_group = int(os.getenv('LETTER_GROUP', 1))
-            task = BrandScrapingTask(letter_group)
+            task = BrandScrapingTask(
+                parse_letter_groups(os.getenv('LETTER_GROUP', '1')),
+                storage_backend=os.getenv('STORAGE_BACKEND'),
+                incremental=os.getenv('INCREMENTAL') == '1',
+                # 異なるデザイナー一覧ページを並行に処理するコンテキスト数
+                context_count=int(os.getenv('CONTEXT_COUNT', 1))
+            )
         elif task_name == 'perfume_detail_scraping':  # タスク名を修正
             task = PerfumeDetailScrapingTask(
                 delay_min=float(os.getenv('SCRAPING_DELAY_MIN', 2)),
                 delay_max=float(os.getenv('SCRAPING_DELAY_MAX', 4)),
-                max_retries=int(os.getenv('MAX_RETRIES', 3))
+                max_retries=int(os.getenv('MAX_RETRIES', 3)),
+                # archive: 取得せずアーカイブ済みの詳細ページから再抽出
+                fetch_mode=os.getenv('FETCH_MODE', 'browser'),
+                storage_backend=os.getenv('STORAGE_BACKEND', 'segment'),
+                # 1: 香水数が変わったブランドと新規・鮮度切れの香水のみ取得
+                incremental=os.getenv('INCREMENTAL') == '1',
+                # python -m utils.shard_plannerで作ったマニフェスト（全ブランドの代わりに処理）
+                shard_manifest=os.getenv('SHARD_MANIFEST')
             )
         elif task_name == 'fragrance_basic_scraping':
-            letter = os.getenv('LETTER')  # 環境変数から単一のアルファベットを取得
-            if not letter:
-                raise ValueError("LETTER environment variable is required")
+            # 環境変数から単一のアルファベットを取得
+            # all: 全ブランドを共有フロンティアに登録し、同じ設定の全コンテナでリースを取り合って分担
+            letter = os.getenv('LETTER')
+            # SHARD_MANIFEST: python -m utils.shard_plannerで作ったマニフェストを文字の代わりに使う
+            shard_manifest = os.getenv('SHARD_MANIFEST')
+            if not letter and not shard_manifest:
+                raise ValueError("LETTER or SHARD_MANIFEST environment variable is required")
 
             task = FragranceBasicScrapingTask(
                 delay_min=float(os.getenv('SCRAPING_DELAY_MIN', 1)),
                 delay_max=float(os.getenv('SCRAPING_DELAY_MAX', 2)),
                 max_retries=int(os.getenv('MAX_RETRIES', 3)),
                 letter=letter,
-                batch_size=int(os.getenv('BATCH_SIZE', 50))
+                batch_size=int(os.getenv('BATCH_SIZE', 50)),
+                # ワーカープールの設定
+                worker_count=int(os.getenv('WORKER_COUNT', 1)),
+                context_count=int(os.getenv('CONTEXT_COUNT', 1)),
+                queue_size=int(os.getenv('QUEUE_SIZE', 0)) or None,
+                max_inflight_pages=int(os.getenv('MAX_INFLIGHT_PAGES', 0)) or None,
+                # browser: 常にChromiumで描画 / http: HTTP取得しチャレンジ時のみブラウザ
+                fetch_mode=os.getenv('FETCH_MODE', 'browser'),
+                # segment: JSONLセグメントにまとめて保存 / files: 従来の1香水1ファイル
+                # sqlite: カタログDBにupsert
+                storage_backend=os.getenv('STORAGE_BACKEND', 'segment'),
+                # 1: 香水数が変わったブランドのみ取得
+                incremental=os.getenv('INCREMENTAL') == '1',
+                shard_manifest=shard_manifest
+            )
+        elif task_name == 'pipeline':
+            # ブランド→基本情報→詳細をチャネルでつなぎ、1プロセスで並行に実行
+            task = PipelineTask(
+                parse_letter_groups(os.getenv('LETTER_GROUP', '1')),
+                worker_count=int(os.getenv('WORKER_COUNT', 1)),
+                context_count=int(os.getenv('CONTEXT_COUNT', 1)),
+                fetch_mode=os.getenv('FETCH_MODE', 'browser'),
+                storage_backend=os.getenv('STORAGE_BACKEND', 'segment'),
+                incremental=os.getenv('INCREMENTAL') == '1',
+                config={
+                    key: int(os.getenv(env))
+                    for key, env in (('brand_channel_size', 'BRAND_CHANNEL_SIZE'),
+                                     ('perfume_channel_size', 'PERFUME_CHANNEL_SIZE'))
+                    if os.getenv(env)
+                }
             )
         else:
             raise ValueError(f"Unknown task: {task_name}")
 
+        # 全メトリクスにタスク名と文字（グループ）のラベルを付け、/metricsで公開
+        shard_manifest = os.getenv('SHARD_MANIFEST')
+        letter_label = os.getenv('LETTER') or os.getenv('LETTER_GROUP') or \
+            (Path(shard_manifest).stem if shard_manifest else None)
+        metrics = get_metrics()
+        metrics.set_labels(task=task_name, letter=letter_label)
+        metrics_server = None
+        metrics_port = int(os.getenv('METRICS_PORT', METRICS_CONFIG['port']))
+        if METRICS_CONFIG['enabled'] and metrics_port:
+            metrics_server = MetricsServer(
+                metrics, host=os.getenv('METRICS_HOST'), port=metrics_port)
+            await metrics_server.start()
+
+        # ブランド・香水ごとのスパンを実行単位のJSONLに記録（TRACING=0で無効）
+        tracer = get_tracer()
+        if TRACING_CONFIG['enabled'] and os.getenv('TRACING', '1') != '0':
+            tracer.open(trace_path(task_name, letter_label))
+
         try:
             await task.run()
         finally:
             await task.cleanup()
+            metrics.log_stats()
+            tracer.close()
+            await get_rate_limiter().close()
+            log_logging_stats()
+            if metrics_server:
+                await metrics_server.close()
 
     except Exception as e:
         logging.error(f"Application error: {e}", exc_info=True)
@@ -70,6 +70,7 @@ class Perfume:
     main_accords: List[Accord]
     seasons: Season
     time_of_day: TimeOfDay
+    url: Optional[str] = None
 
     @classmethod
     def from_dict(cls, data: Dict) -> 'Perfume':
@@ -81,6 +82,7 @@ class Perfume:
                           for accord in data['main_accords']],
             seasons=Season.from_dict(data['seasons']),
             time_of_day=TimeOfDay.from_dict(data['time_of_day']),
+            url=data.get('url'),
         )
 
     def to_dict(self) -> Dict:
@@ -91,4 +93,5 @@ class Perfume:
             'main_accords': [accord.to_dict() for accord in self.main_accords],
             'seasons': self.seasons.to_dict(),
             'time_of_day': self.time_of_day.to_dict(),
+            'url': self.url,
         }
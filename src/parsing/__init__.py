@@ -0,0 +1,19 @@
+from .backends import BACKEND_DOM, BACKEND_LXML, available_backends, load_document
+from .html_dom import Element, parse_html
+from .perfume_parser import (extract_concentration, extract_volumes,
+                             parse_directory, parse_perfume_file,
+                             parse_perfume_page)
+
+__all__ = [
+    'BACKEND_DOM',
+    'BACKEND_LXML',
+    'available_backends',
+    'load_document',
+    'Element',
+    'parse_html',
+    'extract_concentration',
+    'extract_volumes',
+    'parse_directory',
+    'parse_perfume_file',
+    'parse_perfume_page',
+]
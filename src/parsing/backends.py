@@ -0,0 +1,82 @@
+# parsing/backends.py
+from functools import lru_cache
+from typing import List, Optional
+
+from .html_dom import RAW_TEXT_ELEMENTS, is_hidden, parse_html
+
+try:
+    import lxml.html
+    from lxml.cssselect import CSSSelector
+except ImportError:  # lxml（とcssselect）は任意、なければ標準ライブラリのパーサーを使う
+    lxml = None
+
+BACKEND_LXML = 'lxml'
+BACKEND_DOM = 'dom'
+
+
+def available_backends() -> List[str]:
+    """利用可能なバックエンド（高速な順）"""
+    return ([BACKEND_LXML] if lxml is not None else []) + [BACKEND_DOM]
+
+
+@lru_cache(maxsize=128)
+def _compile(selector: str) -> 'CSSSelector':
+    return CSSSelector(selector)
+
+
+class LxmlNode:
+    """lxmlの要素をhtml_dom.Elementと同じインターフェースで扱うラッパー"""
+
+    __slots__ = ('element',)
+
+    def __init__(self, element):
+        self.element = element
+
+    @property
+    def tag(self) -> str:
+        return self.element.tag
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        return self.element.get(name, default)
+
+    def text(self) -> str:
+        """html_dom.Element.text()と同じく、スクリプト等と非表示の子孫を除いたテキスト"""
+        parts: List[str] = []
+        _collect_text(self.element, parts, root=True)
+        return ''.join(parts)
+
+    def select(self, selector: str) -> List['LxmlNode']:
+        return [LxmlNode(el) for el in _compile(selector)(self.element)]
+
+    def select_one(self, selector: str) -> Optional['LxmlNode']:
+        matches = _compile(selector)(self.element)
+        return LxmlNode(matches[0]) if matches else None
+
+
+def _collect_text(element, parts: List[str], root: bool = False) -> None:
+    # コメント等（tagが文字列でないノード）は本文を持たず、tailのみ親側で拾う
+    if not isinstance(element.tag, str) or element.tag in RAW_TEXT_ELEMENTS:
+        return
+    if not root and is_hidden(element):
+        return
+    if element.text:
+        parts.append(element.text)
+    for child in element:
+        _collect_text(child, parts)
+        if child.tail:
+            parts.append(child.tail)
+
+
+def load_document(html: str, backend: Optional[str] = None):
+    """
+    HTMLを解析し、select/select_one/get/textを持つルートノードを返す
+    backend省略時は利用可能な最速のものを使う
+    """
+    backend = backend or available_backends()[0]
+    if backend == BACKEND_LXML:
+        if lxml is None:
+            raise RuntimeError("lxml and cssselect are required for the lxml backend")
+        return LxmlNode(lxml.html.document_fromstring(html))
+    if backend == BACKEND_DOM:
+        return parse_html(html)
+    raise ValueError(f"Unknown parser backend: {backend}")
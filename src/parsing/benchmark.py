@@ -0,0 +1,59 @@
+# parsing/benchmark.py
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from .backends import available_backends
+from .perfume_parser import parse_directory, parse_perfume_page
+
+
+def benchmark_backend(html: str, backend: str, iterations: int) -> float:
+    """1プロセスでの解析速度（ページ/秒）"""
+    parse_perfume_page(html, backend=backend)  # ウォームアップ
+    started = time.perf_counter()
+    for _ in range(iterations):
+        parse_perfume_page(html, backend=backend)
+    return iterations / (time.perf_counter() - started)
+
+
+def benchmark_pool(path: Path, backend: str, pages: int, processes: Optional[int]) -> float:
+    """同じページをpages件複製したディレクトリをプロセスプールで解析する速度（ページ/秒）"""
+    directory = Path(tempfile.mkdtemp(prefix='parse-bench-'))
+    try:
+        for i in range(pages):
+            shutil.copyfile(path, directory / f"page-{i:05d}.html")
+        started = time.perf_counter()
+        count = sum(1 for _ in parse_directory(directory, '*.html', processes, backend))
+        return count / (time.perf_counter() - started)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def run(path: Path, iterations: int, pool_pages: int, processes: Optional[int]) -> Dict[str, float]:
+    html = path.read_text(encoding='utf-8')
+    results = {}
+    for backend in available_backends():
+        results[f"{backend} (1 process)"] = benchmark_backend(html, backend, iterations)
+        if pool_pages:
+            workers = processes or os.cpu_count()
+            results[f"{backend} (pool of {workers})"] = \
+                benchmark_pool(path, backend, pool_pages, processes)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='香水ページ解析のスループット（ページ/秒）を計測')
+    parser.add_argument('html', nargs='?', default='../perfume_page.html')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--pool-pages', type=int, default=200, help='0でプール計測を省略')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    path = Path(args.html)
+    print(f"{path} ({path.stat().st_size / 1024:.0f} KB)")
+    for label, pages_per_sec in run(path, args.iterations, args.pool_pages, args.processes).items():
+        print(f"  {label:<24} {pages_per_sec:8.1f} pages/sec")
@@ -0,0 +1,209 @@
+# parsing/html_dom.py
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple, Union
+
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr'
+}
+# テキストとして扱わない要素
+RAW_TEXT_ELEMENTS = {'script', 'style', 'template', 'noscript'}
+# 表示されない要素のインラインスタイル（innerTextと同様にテキストから除く）
+_HIDDEN_STYLE_RE = re.compile(r'display\s*:\s*none|visibility\s*:\s*hidden', re.IGNORECASE)
+
+_COMPOUND_RE = re.compile(r'([a-zA-Z][\w-]*|\*)?((?:[.#][\w-]+|\[[^\]]+\])*)')
+_PART_RE = re.compile(r'([.#])([\w-]+)|\[\s*([\w-]+)\s*(?:([~^$*]?=)\s*["\']?([^"\'\]]*)["\']?)?\s*\]')
+
+
+def is_hidden(element) -> bool:
+    """hidden属性・インラインスタイルで非表示の要素か（getを持つ要素ならバックエンドを問わない）"""
+    return element.get('hidden') is not None or \
+        bool(_HIDDEN_STYLE_RE.search(element.get('style') or ''))
+
+
+class Element:
+    """静的HTMLの要素ノード"""
+
+    __slots__ = ('tag', 'attrs', 'children', 'parent')
+
+    def __init__(self, tag: str, attrs: Dict[str, str], parent: Optional['Element'] = None):
+        self.tag = tag
+        self.attrs = attrs
+        self.children: List[Union['Element', str]] = []
+        self.parent = parent
+
+    @property
+    def classes(self) -> List[str]:
+        return self.attrs.get('class', '').split()
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        """属性値を取得"""
+        return self.attrs.get(name, default)
+
+    def iter(self):
+        """子孫要素を文書順に列挙"""
+        stack = list(reversed([c for c in self.children if isinstance(c, Element)]))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed([c for c in node.children if isinstance(c, Element)]))
+
+    def text(self) -> str:
+        """スクリプト等と非表示の子孫を除いたテキスト内容（ブラウザのinnerTextに相当）"""
+        parts = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                parts.append(node)
+            elif node.tag not in RAW_TEXT_ELEMENTS and (node is self or not is_hidden(node)):
+                stack.extend(reversed(node.children))
+        return ''.join(parts)
+
+    def select(self, selector: str) -> List['Element']:
+        """CSSセレクター（子孫・子・隣接結合子、タグ・クラス・ID・属性）で検索"""
+        results = []
+        for group in selector.split(','):
+            steps = _parse_selector(group)
+            results.extend(el for el in self.iter() if _matches_chain(el, steps))
+        if ',' in selector:
+            # 文書順を維持して重複を除去
+            order = {id(el): i for i, el in enumerate(self.iter())}
+            results = sorted({id(el): el for el in results}.values(),
+                             key=lambda el: order[id(el)])
+        return results
+
+    def select_one(self, selector: str) -> Optional['Element']:
+        """最初に一致する要素を取得"""
+        matches = self.select(selector)
+        return matches[0] if matches else None
+
+    def previous_element(self) -> Optional['Element']:
+        """直前の兄弟要素"""
+        if self.parent is None:
+            return None
+        previous = None
+        for child in self.parent.children:
+            if child is self:
+                return previous
+            if isinstance(child, Element):
+                previous = child
+        return None
+
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Element('#document', {})
+        self.stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        element = Element(tag, {k: v or '' for k, v in attrs}, self.stack[-1])
+        self.stack[-1].children.append(element)
+        if tag not in VOID_ELEMENTS:
+            self.stack.append(element)
+
+    def handle_startendtag(self, tag, attrs):
+        element = Element(tag, {k: v or '' for k, v in attrs}, self.stack[-1])
+        self.stack[-1].children.append(element)
+
+    def handle_endtag(self, tag):
+        # 閉じ忘れのタグは対応する開始タグまでまとめて閉じる
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                del self.stack[i:]
+                return
+
+    def handle_data(self, data):
+        self.stack[-1].children.append(data)
+
+
+def parse_html(html: str) -> Element:
+    """HTML文字列を要素ツリーに変換"""
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+
+def _parse_selector(selector: str) -> List[Tuple[str, Tuple]]:
+    """セレクターを(結合子, 条件)のリストに分解"""
+    tokens = re.sub(r'\s*([>+])\s*', r' \1 ', selector.strip()).split()
+    steps = []
+    combinator = ' '
+    for token in tokens:
+        if token in ('>', '+'):
+            combinator = token
+            continue
+        match = _COMPOUND_RE.fullmatch(token)
+        if not match:
+            raise ValueError(f"Unsupported selector: {selector}")
+        tag = match.group(1)
+        conditions = []
+        for part in _PART_RE.finditer(match.group(2)):
+            if part.group(1) == '.':
+                conditions.append(('class', part.group(2), None))
+            elif part.group(1) == '#':
+                conditions.append(('attr', 'id', ('=', part.group(2))))
+            else:
+                op = part.group(4)
+                conditions.append(
+                    ('attr', part.group(3), (op, part.group(5)) if op else None))
+        steps.append((combinator, (tag if tag != '*' else None, conditions)))
+        combinator = ' '
+    return steps
+
+
+def _matches_compound(element: Element, compound: Tuple) -> bool:
+    tag, conditions = compound
+    if tag and element.tag != tag.lower():
+        return False
+    for kind, name, test in conditions:
+        if kind == 'class':
+            if name not in element.classes:
+                return False
+            continue
+        if name not in element.attrs:
+            return False
+        if test:
+            op, expected = test
+            value = element.attrs[name]
+            if op == '=' and value != expected:
+                return False
+            if op == '~=' and expected not in value.split():
+                return False
+            if op == '^=' and not value.startswith(expected):
+                return False
+            if op == '$=' and not value.endswith(expected):
+                return False
+            if op == '*=' and expected not in value:
+                return False
+    return True
+
+
+def _matches_chain(element: Element, steps: List[Tuple[str, Tuple]]) -> bool:
+    """右端の条件から結合子を辿って一致判定"""
+    if not steps or not _matches_compound(element, steps[-1][1]):
+        return False
+    return _matches_ancestors(element, steps, len(steps) - 1)
+
+
+def _matches_ancestors(element: Element, steps: List[Tuple[str, Tuple]], index: int) -> bool:
+    if index == 0:
+        return True
+    combinator = steps[index][0]
+    compound = steps[index - 1][1]
+    if combinator == '+':
+        node = element.previous_element()
+        return (node is not None and _matches_compound(node, compound)
+                and _matches_ancestors(node, steps, index - 1))
+    node = element.parent
+    if combinator == '>':
+        return (node is not None and _matches_compound(node, compound)
+                and _matches_ancestors(node, steps, index - 1))
+    while node is not None:
+        if _matches_compound(node, compound) and _matches_ancestors(node, steps, index - 1):
+            return True
+        node = node.parent
+    return False
@@ -0,0 +1,216 @@
+# parsing/perfume_parser.py
+import argparse
+import json
+import logging
+import re
+import sys
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+from models.perfume import Accord, Perfume, Season, TimeOfDay
+
+from .backends import load_document
+
+logger = logging.getLogger(__name__)
+
+# 長い表記から順に照合する（'eau de parfum'を'parfum'より先に）
+CONCENTRATIONS = (
+    ('extrait de parfum', 'Extrait de Parfum'),
+    ('eau de parfum', 'Eau de Parfum'),
+    ('eau de toilette', 'Eau de Toilette'),
+    ('eau de cologne', 'Cologne'),
+    ('eau fraiche', 'Eau Fraiche'),
+    ('parfum', 'Parfum'),
+    ('cologne', 'Cologne'),
+    ('edp', 'Eau de Parfum'),
+    ('edt', 'Eau de Toilette'),
+    ('edc', 'Cologne'),
+)
+_CONCENTRATION_RE = re.compile(
+    r'\b(' + '|'.join(re.escape(pattern) for pattern, _ in CONCENTRATIONS) + r')\b')
+_CONCENTRATION_NAMES = dict(CONCENTRATIONS)
+
+_LAUNCH_YEAR_RE = re.compile(r'launched in ((?:19|20)\d{2})')
+_YEAR_RE = re.compile(r'\b((?:19|20)\d{2})\b')
+_NOSE_RE = re.compile(r'The noses? behind this fragrance (?:is|are) ([^.]+)')
+# 「30 and 100ml」のような列挙にも対応
+_VOLUME_RE = re.compile(
+    r'((?:\d+(?:\.\d+)?\s*(?:,|and|or|&|/)\s*)*\d+(?:\.\d+)?)\s*(ml|oz)\b', re.IGNORECASE)
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+_WIDTH_RE = re.compile(r'width:\s*([\d.]+)%')
+_NOSE_HREF_RE = re.compile(r'/noses/[^/]+\.html$')
+
+ML_PER_OZ = 29.5735
+
+
+def _clean(text: Optional[str]) -> str:
+    return ' '.join((text or '').split())
+
+
+def _first_text(root, selector: str) -> Optional[str]:
+    node = root.select_one(selector)
+    return _clean(node.text()) if node is not None else None
+
+
+def _votes(node) -> int:
+    match = _NUMBER_RE.search(node.text())
+    return int(float(match.group())) if match else 0
+
+
+def extract_concentration(*texts: Optional[str]) -> Optional[str]:
+    """製品タイプを優先度順のテキスト（タイトル→説明文）から判定"""
+    for text in texts:
+        if not text:
+            continue
+        matches = _CONCENTRATION_RE.findall(text.lower())
+        if matches:
+            return _CONCENTRATION_NAMES[max(matches, key=len)]
+    return None
+
+
+def extract_volumes(text: str) -> List[str]:
+    """容量（ml換算）を抽出"""
+    volumes = set()
+    for match in _VOLUME_RE.finditer(text):
+        for number in _NUMBER_RE.findall(match.group(1)):
+            value = float(number)
+            if match.group(2).lower() == 'oz':
+                value = round(value * ML_PER_OZ)
+            volumes.add(value)
+    return [f"{value:g}ml" for value in sorted(volumes)]
+
+
+def parse_perfume_page(html: str, url: Optional[str] = None, backend: Optional[str] = None) -> Dict:
+    """
+    保存済みの香水詳細ページを解析
+    Perfumeの内容に発売年・調香師・容量・製品タイプを加えた辞書を返す
+    検索は商品ブロック・説明文などの該当ノードに限定する
+    """
+    root = load_document(html, backend)
+
+    title = _first_text(root, 'h1')
+    brand = _first_text(root, '[itemprop=brand] [itemprop=name]')
+    if url is None:
+        canonical = root.select_one('link[rel=canonical]')
+        url = canonical.get('href') if canonical is not None else None
+
+    description_node = root.select_one('[itemprop=description]')
+    description = _clean(description_node.text()) if description_node is not None else ''
+    name_node = description_node.select_one('b') if description_node is not None else None
+    name = _clean(name_node.text()) if name_node is not None else None
+    if not name and title:
+        # 説明文がなければ見出しからブランド名と性別を除く
+        name = _clean(title.split(' for ')[0].replace(brand or '', ''))
+
+    target_gender = []
+    lowered_title = (title or '').lower()
+    if 'for women' in lowered_title:
+        target_gender.append('women')
+    if 'for men' in lowered_title:
+        target_gender.append('men')
+
+    accords = []
+    for bar in root.select('.accord-bar'):
+        width = _WIDTH_RE.search(bar.get('style') or '')
+        accord_name = _clean(bar.text())
+        if width and accord_name:
+            accords.append(Accord(name=accord_name, strength=int(float(width.group(1)))))
+
+    seasons = Season()
+    for node in root.select('.vote-season'):
+        season = node.get('data-season')
+        if season in ('spring', 'summer', 'fall', 'winter'):
+            setattr(seasons, season, _votes(node) > 50)
+
+    time_of_day = TimeOfDay()
+    for node in root.select('.vote-time-of-day'):
+        time = node.get('data-time')
+        if time in ('day', 'night'):
+            setattr(time_of_day, time, _votes(node) > 50)
+
+    perfumers = []
+    for link in root.select('a[href*="/noses/"]'):
+        perfumer = _clean(link.text())
+        if _NOSE_HREF_RE.search(link.get('href') or '') and perfumer not in perfumers:
+            perfumers.append(perfumer)
+    if not perfumers and (nose := _NOSE_RE.search(description)):
+        perfumers = [_clean(p) for p in re.split(r',| and ', nose.group(1)) if _clean(p)]
+
+    year_match = _LAUNCH_YEAR_RE.search(description) or _YEAR_RE.search(description)
+
+    perfume = Perfume(
+        name=name,
+        brand=brand,
+        target_gender=target_gender,
+        main_accords=accords,
+        seasons=seasons,
+        time_of_day=time_of_day,
+        url=url
+    )
+    return {
+        **perfume.to_dict(),
+        'year': int(year_match.group(1)) if year_match else None,
+        'perfumers': perfumers,
+        'volumes': extract_volumes(description),
+        'concentration': extract_concentration(title, description),
+    }
+
+
+def parse_perfume_file(path: Union[str, Path], backend: Optional[str] = None) -> Dict:
+    """HTMLファイルを解析（読み込み元のパスをsourceに記録）"""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        html = f.read()
+    return {**parse_perfume_page(html, backend=backend), 'source': str(path)}
+
+
+def _parse_file_safe(args) -> Dict:
+    path, backend = args
+    try:
+        return parse_perfume_file(path, backend)
+    except Exception as e:
+        return {'source': str(path), 'error': str(e)}
+
+
+def parse_directory(
+    directory: Union[str, Path],
+    pattern: str = '**/*.html',
+    processes: Optional[int] = None,
+    backend: Optional[str] = None,
+    chunksize: int = 8
+) -> Iterator[Dict]:
+    """
+    ディレクトリ内のHTMLをプロセスプールで並列に解析
+    失敗したファイルは{'source', 'error'}として返す（順序は不定）
+    """
+    paths = sorted(Path(directory).glob(pattern))
+    if processes == 1:
+        for path in paths:
+            yield _parse_file_safe((path, backend))
+        return
+    with Pool(processes) as pool:
+        yield from pool.imap_unordered(
+            _parse_file_safe, [(path, backend) for path in paths], chunksize)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='保存済みの香水ページを解析してJSONLで出力')
+    parser.add_argument('directory', help='HTMLファイルのディレクトリ')
+    parser.add_argument('--pattern', default='**/*.html')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--backend', default=None)
+    parser.add_argument('--output', '-o', help='出力先（省略時は標準出力）')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        failed = 0
+        for record in parse_directory(args.directory, args.pattern, args.processes, args.backend):
+            failed += 'error' in record
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        if failed:
+            logger.warning(f"{failed} files failed to parse")
+    finally:
+        if out is not sys.stdout:
+            out.close()
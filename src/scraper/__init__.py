@@ -1,19 +1,35 @@
 # scraper/__init__.py
 from .brand_scraper import BrandScraper
-from .browser import setup_browser
+from .browser import create_context, launch_browser, setup_browser
+from .browser_pool import BrowserPool
 from .cloudflare_handler import CloudflareHandler
-from .extractor import extract_brands_data
+from .extraction_spec import ExtractionSpec, Field
+from .extractor import (extract_brands_data, extract_perfume_detail,
+                        extract_perfume_list, parse_perfume_detail,
+                        parse_perfume_list)
+from .http_fetcher import HttpFetcher
 from .page_handler import get_page_with_retry
 from .retry_decorator import with_retry
-from .utils import get_random_delay, normalize_url
+from .utils import get_random_delay, normalize_url, perfume_urls
 
 __all__ = [
     'setup_browser',
+    'create_context',
+    'launch_browser',
+    'BrowserPool',
     'BrandScraper',
     'CloudflareHandler',
     'with_retry',
     'get_page_with_retry',
     'extract_brands_data',
+    'extract_perfume_list',
+    'extract_perfume_detail',
+    'ExtractionSpec',
+    'Field',
+    'parse_perfume_list',
+    'parse_perfume_detail',
+    'HttpFetcher',
     'get_random_delay',
-    'normalize_url'
+    'normalize_url',
+    'perfume_urls'
 ]
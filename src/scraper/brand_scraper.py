@@ -1,24 +1,41 @@
 # scraper/brand_scraper.py
-import asyncio
-from typing import List, Optional
+import logging
+from typing import Dict, List, Optional
 
 from playwright.async_api import Browser, BrowserContext, Page
 
 from models.brand import Brand
+from utils.metrics import PHASE_EXTRACT, get_metrics
 
+from .browser_pool import BrowserPool
 from .extractor import extract_brands_data
 from .page_handler import get_page_with_retry
+from .resource_blocker import get_resource_blocker
 from .utils import get_random_delay, normalize_url
 
+logger = logging.getLogger(__name__)
+
 
 class BrandScraper:
-    def __init__(self, browser: Browser):
+    def __init__(
+        self,
+        browser: Optional[Browser] = None,
+        context: Optional[BrowserContext] = None,
+        pool: Optional[BrowserPool] = None
+    ):
+        """contextを渡した場合（プールから借りたもの等）はそれを使い、閉じない"""
         self.browser = browser
-        self.context: Optional[BrowserContext] = None
+        self.context: Optional[BrowserContext] = context
+        self.owns_context = context is None
+        self.pool = pool
         self.page: Optional[Page] = None
 
     async def setup_context(self):
         """ブラウザコンテキストの設定"""
+        if not self.owns_context:
+            self.page = await self.context.new_page()
+            return
+
         self.context = await self.browser.new_context(
             viewport={'width': 1920, 'height': 1080},
             java_script_enabled=True,
@@ -43,13 +60,16 @@ class BrandScraper:
             }
         """)
 
+        # 画像・フォント・広告などの読み込みを遮断
+        await get_resource_blocker().install(self.context)
+
         self.page = await self.context.new_page()
 
     async def cleanup(self):
         """リソースのクリーンアップ"""
         if self.page:
             await self.page.close()
-        if self.context:
+        if self.context and self.owns_context:
             await self.context.close()
 
     async def _process_brand_data(self, brand_data: dict, page_num: str) -> Optional[Brand]:
@@ -62,79 +82,86 @@ class BrandScraper:
                 page_number=page_num
             )
         except Exception as e:
-            print(f"Error processing brand data: {e}")
+            logger.error(f"Error processing brand data: {e}")
             return None
 
-    async def _extract_brands_from_page(self, letter: str, page_num: str) -> List[Brand]:
-        """1ページからブランド情報を抽出"""
-        brands = []
+    @staticmethod
+    def designer_page_url(page_num: str) -> str:
+        return f"https://www.fragrantica.com/designers-{page_num}/"
+
+    async def scrape_page(self, page_num: str, letters: List[str]) -> Dict[str, List[Brand]]:
+        """
+        デザイナー一覧ページを1回だけ読み込み、含まれる文字の見出しごとにブランドを抽出
+        全ての文字の見出しを確認できなければ再試行し、失敗時は空の辞書を返す
+        """
+        if not self.page:
+            await self.setup_context()
+
         max_retries = 3
-        url = f"https://www.fragrantica.com/designers-{page_num}/#{letter}"
-        print(f"\naccessing {url}")
+        url = self.designer_page_url(page_num)
+        logger.info(f"Accessing {url} for letters {', '.join(letters)}")
 
         for attempt in range(max_retries):
+            if attempt:
+                get_metrics().retries.inc(operation='designer_page')
             try:
-                print(
-                    f"\nFetching brands starting with '{letter}' from page {page_num} (attempt {attempt + 1})")
-
-                if not await get_page_with_retry(self.page, url):
-                    print(
+                if not await get_page_with_retry(self.page, url, browser_pool=self.pool):
+                    logger.warning(
                         f"Failed to load page {page_num} after {max_retries} attempts")
                     continue
 
-                if not await self._verify_page_content(letter):
-                    continue
-
-                brands_data = await self._get_brands_data(letter)
-                if brands_data:
-                    brands = [
-                        brand for brand_data in brands_data
+                results = {}
+                for letter in letters:
+                    if not await self._verify_page_content(letter):
+                        break
+                    results[letter] = [
+                        brand for brand_data in await self._get_brands_data(letter)
                         if (brand := await self._process_brand_data(brand_data, page_num))
                     ]
-                    print(
-                        f"Successfully collected {len(brands)} brands for letter {letter} on page {page_num}")
-                    break
-                elif attempt < max_retries - 1:
-                    await asyncio.sleep(get_random_delay(5, 10))
+                    logger.info(
+                        f"Collected {len(results[letter])} brands for letter {letter} on page {page_num}")
+
+                # 見出しが揃っていても全て空なら描画途中とみなして再試行
+                if len(results) == len(letters) and any(results.values()):
+                    get_metrics().record_page('designer_page')
+                    return results
 
             except Exception as e:
-                print(
+                # 再試行の間隔はget_page_with_retry内のレートリミッターが制御
+                logger.warning(
                     f"Error on attempt {attempt + 1} for page {page_num}: {str(e)}")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(get_random_delay(5, 10))
 
-        return brands
+        get_metrics().record_page('designer_page', 'failed')
+        return {}
 
     async def _verify_page_content(self, letter: str) -> bool:
         """ページコンテンツの検証"""
         header = await self.page.wait_for_selector(f"h2[id='{letter}']", timeout=30000)
         if not header:
-            print(f"Header for letter {letter} not found")
+            logger.warning(f"Header for letter {letter} not found")
             return False
 
         await header.scroll_into_view_if_needed()
-        await asyncio.sleep(get_random_delay(1, 2))
+        await get_metrics().sleep(get_random_delay(1, 2), 'delay')
         return True
 
     async def _get_brands_data(self, letter: str) -> List[dict]:
         """ブランドデータの取得"""
         grid_selector = f"h2[id='{letter}']+div.grid-x"
-        brands_data = await extract_brands_data(self.page, grid_selector)
-        print(f"Found {len(brands_data)} brand elements")
+        with get_metrics().phase(PHASE_EXTRACT):
+            brands_data = await extract_brands_data(self.page, grid_selector)
+        logger.debug(f"Found {len(brands_data)} brand elements")
         return brands_data
 
     async def scrape_letter(self, letter: str, page_nums: List[str]) -> List[Brand]:
         """指定した文字のブランド情報を取得"""
-        if not self.page:
-            await self.setup_context()
-
         all_brands = []
         for page_num in page_nums:
-            brands = await self._extract_brands_from_page(letter, page_num)
-            all_brands.extend(brands)
+            brands = await self.scrape_page(page_num, [letter])
+            all_brands.extend(brands.get(letter, []))
 
         # 重複を除去
         unique_brands = {brand.url: brand for brand in all_brands}.values()
-        print(
+        logger.info(
             f"Total unique brands found for letter {letter}: {len(unique_brands)}")
         return list(unique_brands)
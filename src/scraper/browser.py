@@ -1,13 +1,29 @@
 # scraper/browser.py
+from typing import Dict, Optional
+
 from fake_useragent import UserAgent
-from playwright.async_api import async_playwright
+from playwright.async_api import (Browser, BrowserContext, Playwright,
+                                  async_playwright)
+
+from .clearance_cache import get_clearance_cache
+from .resource_blocker import get_resource_blocker
 
 
 async def setup_browser():
     """ブラウザセットアップ（高度なステルス設定）"""
-    ua = UserAgent()
+    # 通過済みのUser-AgentがあればそのCookieを引き継ぐ
+    cache = get_clearance_cache()
+    user_agent = (cache and cache.preferred_user_agent(None)) or UserAgent().random
     playwright = await async_playwright().start()
+    browser = await launch_browser(playwright, user_agent)
+    context = await create_context(
+        browser, user_agent, storage_state=cache.load(None, user_agent) if cache else None)
+
+    return playwright, browser, context  # contextも返すように変更
+
 
+async def launch_browser(playwright: Playwright, user_agent: Optional[str] = None) -> Browser:
+    """ステルス用の引数でChromiumを起動"""
     # より詳細なブラウザ引数
     browser = await playwright.chromium.launch(
         headless=True,
@@ -32,7 +48,7 @@ async def setup_browser():
             '--disable-features=AutomationControlled',
             '--allow-running-insecure-content',
             '--disable-blink-features=AutomationControlled',
-            f'--user-agent={ua.random}',  # シンタックスエラーを修正
+            f'--user-agent={user_agent or UserAgent().random}',  # シンタックスエラーを修正
             '--disable-extensions',
             # プロキシ設定は context で行うため削除
             '--flag-switches-begin',
@@ -40,10 +56,25 @@ async def setup_browser():
         ]
     )
 
+    return browser
+
+
+async def create_context(
+    browser: Browser,
+    user_agent: Optional[str] = None,
+    storage_state: Optional[Dict] = None,
+    proxy: Optional[str] = None
+) -> BrowserContext:
+    """
+    ステルス設定済みのブラウザコンテキストを作成
+    storage_stateを渡すと保存済みのCookie（cf_clearance等）を引き継ぐ
+    """
     # コンテキストの詳細な設定
     context = await browser.new_context(
         viewport={'width': 1920, 'height': 1080},
-        user_agent=ua.random,
+        user_agent=user_agent or UserAgent().random,
+        storage_state=storage_state,
+        proxy={'server': proxy} if proxy else None,
         java_script_enabled=True,
         bypass_csp=True,
         extra_http_headers={
@@ -201,4 +232,7 @@ async def setup_browser():
         }
     """)
 
-    return playwright, browser, context  # contextも返すように変更
+    # 画像・フォント・広告などの読み込みを遮断
+    await get_resource_blocker().install(context)
+
+    return context
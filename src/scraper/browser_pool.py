@@ -0,0 +1,412 @@
+# scraper/browser_pool.py
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional
+
+from fake_useragent import UserAgent
+from playwright.async_api import Browser, BrowserContext, Playwright, async_playwright
+
+from config.settings import BROWSER_POOL_CONFIG, CLEARANCE_CACHE_CONFIG
+
+from .browser import create_context, launch_browser
+from .clearance_cache import get_clearance_cache
+from .proxy_handler import TorCircuitPool, TorIdentity
+
+
+@dataclass
+class PooledBrowser:
+    """プール内のブラウザと健全性の集計"""
+    browser_id: int
+    browser: Browser
+    contexts: List[BrowserContext]
+    created_at: float = field(default_factory=time.monotonic)
+    requests: int = 0
+    errors: int = 0
+    throttles: int = 0
+    challenges: int = 0
+    active_leases: int = 0
+    retiring: bool = False
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+    def activate(self) -> None:
+        """予備から稼働に昇格（待機中の経過時間と集計は数えない）"""
+        self.created_at = time.monotonic()
+        self.requests = self.errors = self.throttles = self.challenges = 0
+
+
+@dataclass
+class ContextIdentity:
+    """コンテキストの出口（プロキシ・Tor回路）とUser-Agent"""
+    user_agent: str
+    proxy: Optional[str] = None
+    tor: Optional[TorIdentity] = None
+    clearance_checked_at: float = 0.0
+
+    @property
+    def cache_key(self) -> Optional[str]:
+        """通過状態キャッシュのキー（出口IPの単位）"""
+        return self.tor.cache_key if self.tor else self.proxy
+
+
+@dataclass
+class ContextLease:
+    """プールから貸し出したコンテキスト"""
+    context: BrowserContext
+    owner: PooledBrowser
+
+    @property
+    def stale(self) -> bool:
+        """退役が決まっており、返却して借り直すべきか"""
+        return self.owner.retiring
+
+
+class BrowserPool:
+    """
+    事前起動したブラウザ・コンテキストのプール
+    健全性が下がったブラウザは作業を止めずに退役させ、予備と入れ替える
+    新しいブラウザは通過済みのUser-Agentとstorage_stateを引き継いで起動する
+    tor_identitiesを設定するとコンテキストごとに分離したTor回路を割り当て、
+    回路の健全性が下がれば回路を切り替えてそのブラウザを退役させる
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = {**BROWSER_POOL_CONFIG, **(config or {})}
+        self.logger = logging.getLogger(__name__)
+        self.playwright: Optional[Playwright] = None
+        self.active: List[PooledBrowser] = []
+        self.spares: List[PooledBrowser] = []
+        self.retired: List[PooledBrowser] = []
+        self._by_context: Dict[BrowserContext, PooledBrowser] = {}
+        self._context_leases: Dict[BrowserContext, int] = {}
+        self._identity_by_context: Dict[BrowserContext, ContextIdentity] = {}
+        self._condition: Optional[asyncio.Condition] = None
+        self._background: List[asyncio.Task] = []
+        self._maintenance: Optional[asyncio.Task] = None
+        self._next_id = 0
+        self._closed = False
+        self.clearance_cache = get_clearance_cache()
+        self.circuits = TorCircuitPool(self.config['tor_identities']) \
+            if self.config['tor_identities'] > 0 else None
+
+    async def start(self) -> None:
+        """プールを起動（稼働分と予備を起動）"""
+        self._condition = asyncio.Condition()
+        if self.circuits:
+            await self.circuits.start()
+        self.playwright = await async_playwright().start()
+        launched = await asyncio.gather(*[
+            self._launch() for _ in range(self.config['size'] + self.config['warm_spares'])
+        ])
+        self.active = list(launched[:self.config['size']])
+        self.spares = list(launched[self.config['size']:])
+        self._maintenance = asyncio.create_task(self._maintenance_loop())
+        self.logger.info(
+            f"Browser pool started: {len(self.active)} active, {len(self.spares)} spare")
+
+    def _new_identity(self) -> ContextIdentity:
+        """コンテキストの出口を決め、同じ出口で通過済みのUser-Agentがあればそれを使う"""
+        tor = self.circuits.assign() if self.circuits else None
+        identity = ContextIdentity(
+            user_agent='', proxy=tor.proxy_url if tor else self.config['proxy'], tor=tor)
+        cache = self.clearance_cache
+        identity.user_agent = (
+            cache and cache.preferred_user_agent(identity.cache_key)) or UserAgent().random
+        return identity
+
+    async def _launch(self) -> PooledBrowser:
+        identities = [self._new_identity() for _ in range(self.config['contexts_per_browser'])]
+        cache = self.clearance_cache
+        try:
+            browser = await launch_browser(self.playwright, identities[0].user_agent)
+            contexts = []
+            for identity in identities:
+                # 通過済みのCookieでチャレンジを省く
+                storage_state = cache.load(identity.cache_key, identity.user_agent) \
+                    if cache else None
+                contexts.append(await create_context(
+                    browser, identity.user_agent,
+                    storage_state=storage_state, proxy=identity.proxy))
+        except Exception:
+            self._release_identities(identities)
+            raise
+        pooled = PooledBrowser(self._next_id, browser, contexts)
+        self._next_id += 1
+        for context, identity in zip(contexts, identities):
+            self._by_context[context] = pooled
+            self._context_leases[context] = 0
+            self._identity_by_context[context] = identity
+        return pooled
+
+    def _release_identities(self, identities: List[ContextIdentity]) -> None:
+        if self.circuits:
+            for identity in identities:
+                if identity.tor:
+                    self.circuits.release(identity.tor)
+
+    async def acquire(self) -> ContextLease:
+        """空きのある最も健全なコンテキストを借りる"""
+        async with self._condition:
+            while True:
+                context = self._pick_context()
+                if context is not None:
+                    owner = self._by_context[context]
+                    owner.active_leases += 1
+                    self._context_leases[context] += 1
+                    return ContextLease(context, owner)
+                await self._condition.wait()
+
+    def _pick_context(self) -> Optional[BrowserContext]:
+        candidates = [
+            context
+            for pooled in self.active if not pooled.retiring
+            for context in pooled.contexts
+            if self._context_leases[context] < self.config['max_pages_per_context']
+        ]
+        if not candidates:
+            return None
+        return min(
+            candidates,
+            key=lambda c: (self._context_leases[c], -self.health(self._by_context[c]))
+        )
+
+    async def release(self, lease: ContextLease) -> None:
+        """コンテキストを返却"""
+        async with self._condition:
+            lease.owner.active_leases -= 1
+            self._context_leases[lease.context] -= 1
+            self._condition.notify_all()
+        if lease.owner.retiring and lease.owner.active_leases == 0:
+            await self._close_browser(lease.owner)
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[ContextLease]:
+        """with文で使う貸し出し"""
+        lease = await self.acquire()
+        try:
+            yield lease
+        finally:
+            await self.release(lease)
+
+    def report(
+        self,
+        context: BrowserContext,
+        status: Optional[int] = None,
+        challenge: bool = False,
+        error: bool = False
+    ) -> None:
+        """リクエスト結果を記録し、必要なら退役させる"""
+        pooled = self._by_context.get(context)
+        if pooled is None:
+            return
+        pooled.requests += 1
+        if error:
+            pooled.errors += 1
+        if status in (403, 429):
+            pooled.throttles += 1
+        if challenge:
+            pooled.challenges += 1
+        identity = self._identity_by_context.get(context)
+        if identity:
+            self._update_clearance(identity, context, status, challenge)
+            # 回路を切り替えた場合、Cookieは前の出口IPのものなのでブラウザごと入れ替える
+            if identity.tor and self.circuits.report(identity.tor, status, challenge, error):
+                if not pooled.retiring:
+                    self._spawn(self.retire(pooled, "tor circuit rotated"))
+                return
+        if not pooled.retiring and self.health(pooled) < self.config['min_health']:
+            self._spawn(self.retire(pooled, f"health {self.health(pooled):.2f}"))
+
+    def _update_clearance(
+        self,
+        identity: ContextIdentity,
+        context: BrowserContext,
+        status: Optional[int],
+        challenge: bool
+    ) -> None:
+        """403・チャレンジでキャッシュを破棄し、成功時は一定間隔で通過状態を保存"""
+        if self.clearance_cache is None:
+            return
+        if status == 403 or challenge:
+            self.clearance_cache.invalidate(identity.cache_key, identity.user_agent)
+            # 再び通過したら次の成功時に保存し直す
+            identity.clearance_checked_at = 0.0
+        elif status is not None and 200 <= status < 400:
+            now = time.monotonic()
+            if now - identity.clearance_checked_at >= CLEARANCE_CACHE_CONFIG['save_interval']:
+                identity.clearance_checked_at = now
+                self._spawn(self._save_clearance(identity, context))
+
+    async def _save_clearance(self, identity: ContextIdentity, context: BrowserContext) -> None:
+        try:
+            await self.clearance_cache.save(context, identity.cache_key, identity.user_agent)
+        except Exception as e:
+            # 保存中にコンテキストが閉じられた場合など
+            self.logger.debug(f"Failed to save clearance state: {e}")
+
+    def health(self, pooled: PooledBrowser) -> float:
+        """エラー率・429・チャレンジ・経過時間から0〜1の健全性を算出"""
+        if pooled.age > self.config['max_age']:
+            return 0.0
+        score = 1.0
+        if pooled.requests >= self.config['min_requests_for_error_rate']:
+            score -= pooled.errors / pooled.requests
+        score -= pooled.throttles * self.config['throttle_penalty']
+        score -= pooled.challenges * self.config['challenge_penalty']
+        # 寿命に近づくほど緩やかに減点
+        score -= 0.2 * pooled.age / self.config['max_age']
+        return max(0.0, score)
+
+    async def retire(self, pooled: PooledBrowser, reason: str) -> None:
+        """ブラウザを退役させ、予備を昇格し新しい予備を起動"""
+        if pooled.retiring or pooled not in self.active:
+            return
+        pooled.retiring = True
+        self.logger.info(
+            f"Retiring browser {pooled.browser_id} ({reason}, age {pooled.age:.0f}s, "
+            f"{pooled.requests} requests, {pooled.errors} errors, "
+            f"{pooled.throttles} throttles, {pooled.challenges} challenges)")
+
+        async with self._condition:
+            self.active.remove(pooled)
+            self.retired.append(pooled)
+            if self.spares:
+                spare = self.spares.pop(0)
+                spare.activate()
+                self.active.append(spare)
+            self._condition.notify_all()
+
+        # 予備がなければ貸し出しは補充まで待機する
+        self._spawn(self._replenish())
+        if pooled.active_leases == 0:
+            await self._close_browser(pooled)
+
+    async def recycle(self, reason: str = "recycle") -> None:
+        """稼働中の全ブラウザを順に入れ替える"""
+        for pooled in list(self.active):
+            await self.retire(pooled, reason)
+
+    async def _replenish(self) -> None:
+        """稼働数と予備数を設定値まで補充"""
+        try:
+            pooled = await self._launch()
+        except Exception as e:
+            self.logger.error(f"Failed to launch replacement browser: {e}")
+            return
+        async with self._condition:
+            if len(self.active) < self.config['size']:
+                self.active.append(pooled)
+            else:
+                self.spares.append(pooled)
+            self._condition.notify_all()
+
+    async def _close_browser(self, pooled: PooledBrowser) -> None:
+        if pooled not in self.retired:
+            return
+        self.retired.remove(pooled)
+        for context in pooled.contexts:
+            self._by_context.pop(context, None)
+            self._context_leases.pop(context, None)
+            identity = self._identity_by_context.pop(context, None)
+            if identity:
+                self._release_identities([identity])
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            self.logger.error(f"Error closing retired browser: {e}")
+
+    async def _maintenance_loop(self) -> None:
+        """経過時間とメモリ使用量を定期的に確認"""
+        while not self._closed:
+            await asyncio.sleep(self.config['maintenance_interval'])
+            for pooled in list(self.active):
+                if pooled.age > self.config['max_age']:
+                    await self.retire(pooled, "max age")
+
+            # /procの走査はイベントループを止めないようスレッドで行う
+            rss_mb = await asyncio.to_thread(process_tree_rss) / (1024 * 1024)
+            if rss_mb > self.config['max_rss_mb'] and self.active:
+                oldest = max(self.active, key=lambda p: p.age)
+                await self.retire(oldest, f"RSS {rss_mb:.0f} MB")
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._background.append(task)
+        task.add_done_callback(self._background.remove)
+
+    def get_stats(self) -> List[Dict]:
+        """稼働中ブラウザの健全性"""
+        return [
+            {
+                'browser_id': pooled.browser_id,
+                'health': self.health(pooled),
+                'age': pooled.age,
+                'requests': pooled.requests,
+                'errors': pooled.errors,
+                'throttles': pooled.throttles,
+                'challenges': pooled.challenges,
+                'active_leases': pooled.active_leases,
+            }
+            for pooled in self.active
+        ]
+
+    async def close(self) -> None:
+        """全ブラウザとPlaywrightを停止"""
+        self._closed = True
+        if self._maintenance:
+            self._maintenance.cancel()
+        for task in list(self._background):
+            task.cancel()
+        for pooled in self.active + self.spares + self.retired:
+            try:
+                await pooled.browser.close()
+            except Exception as e:
+                self.logger.error(f"Error closing browser: {e}")
+        self.active, self.spares, self.retired = [], [], []
+        if self.clearance_cache:
+            self.logger.info(f"Clearance cache: {self.clearance_cache.get_stats()}")
+        if self.circuits:
+            self.logger.info(
+                f"Tor circuits: {self.circuits.rotations} rotations, {self.circuits.get_stats()}")
+            await self.circuits.close()
+            self.circuits = None
+        if self.playwright:
+            await self.playwright.stop()
+            self.playwright = None
+
+
+def process_tree_rss(root_pid: Optional[int] = None) -> int:
+    """自プロセス配下（ドライバー・Chromium）のRSS合計（Linuxのみ、他は0）"""
+    root_pid = root_pid or os.getpid()
+    try:
+        children: Dict[int, List[int]] = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # commに空白が含まれる場合があるため末尾の')'以降を解析
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+
+        total = 0
+        stack = [root_pid]
+        while stack:
+            pid = stack.pop()
+            stack.extend(children.get(pid, []))
+            try:
+                with open(f'/proc/{pid}/statm') as f:
+                    total += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+            except (OSError, IndexError, ValueError):
+                continue
+        return total
+    except OSError:
+        return 0
@@ -0,0 +1,142 @@
+# scraper/clearance_cache.py
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Union
+
+from playwright.async_api import BrowserContext
+
+from config.settings import CLEARANCE_CACHE_CONFIG
+
+
+class ClearanceCache:
+    """
+    Cloudflare通過済みコンテキストのstorage_state（cf_clearance等のCookie）を
+    プロキシ（出口IP）とUser-Agentの組ごとにディスクへ保存するキャッシュ
+    cf_clearanceはIPとUAに紐づくため、同じ組で作るコンテキストにのみ読み込む
+    """
+
+    def __init__(
+        self,
+        root: Union[str, Path, None] = None,
+        config: Optional[Dict] = None,
+        clock: Callable[[], float] = time.time
+    ):
+        self.config = {**CLEARANCE_CACHE_CONFIG, **(config or {})}
+        self.root = Path(root or self.config['path'])
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.clock = clock
+        self.logger = logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+        self.saves = 0
+        self.invalidations = 0
+
+    def _path(self, proxy: Optional[str], user_agent: str) -> Path:
+        digest = hashlib.sha256(f"{proxy or 'direct'}\n{user_agent}".encode('utf-8')).hexdigest()
+        return self.root / f"{digest[:32]}.json"
+
+    def _read(self, path: Path) -> Optional[Dict]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _valid(self, entry: Optional[Dict]) -> bool:
+        return bool(entry) and entry.get('expires_at', 0) > self.clock()
+
+    def load(self, proxy: Optional[str], user_agent: str) -> Optional[Dict]:
+        """有効期限内のstorage_stateを返す（なければNone）"""
+        path = self._path(proxy, user_agent)
+        entry = self._read(path)
+        if not self._valid(entry):
+            self.misses += 1
+            if entry:
+                path.unlink(missing_ok=True)
+            return None
+        self.hits += 1
+        return entry['state']
+
+    def preferred_user_agent(self, proxy: Optional[str]) -> Optional[str]:
+        """同じプロキシで有効なキャッシュがあるUser-Agent（最も期限の長いもの）"""
+        best = None
+        for path in self.root.glob('*.json'):
+            entry = self._read(path)
+            if not self._valid(entry) or entry.get('proxy') != proxy:
+                continue
+            if best is None or entry['expires_at'] > best['expires_at']:
+                best = entry
+        return best['user_agent'] if best else None
+
+    async def save(self, context: BrowserContext, proxy: Optional[str], user_agent: str) -> bool:
+        """
+        コンテキストのstorage_stateを保存
+        通過済みを示すCookieがなければ保存しない。保存した場合True
+        """
+        state = await context.storage_state()
+        now = self.clock()
+        clearance = [
+            cookie for cookie in state.get('cookies', [])
+            if cookie.get('name') == self.config['cookie_name']
+        ]
+        if not clearance:
+            return False
+
+        expires_at = now + self.config['max_age']
+        cookie_expires = min(cookie.get('expires', -1) for cookie in clearance)
+        if cookie_expires > 0:
+            expires_at = min(expires_at, cookie_expires - self.config['expiry_margin'])
+        if expires_at <= now:
+            return False
+
+        entry = {
+            'proxy': proxy,
+            'user_agent': user_agent,
+            'saved_at': now,
+            'expires_at': expires_at,
+            'state': state,
+        }
+        # 他のプロセスが読み込み途中のファイルを壊さないよう置き換えで書く
+        path = self._path(proxy, user_agent)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self.saves += 1
+        self.logger.info(
+            f"Saved clearance state for {proxy or 'direct'} "
+            f"(valid for {expires_at - now:.0f}s)")
+        return True
+
+    def invalidate(self, proxy: Optional[str], user_agent: str) -> None:
+        """403・チャレンジを受けた組のキャッシュを破棄"""
+        path = self._path(proxy, user_agent)
+        if path.exists():
+            path.unlink(missing_ok=True)
+            self.invalidations += 1
+            self.logger.info(f"Invalidated clearance state for {proxy or 'direct'}")
+
+    def get_stats(self) -> Dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'saves': self.saves,
+            'invalidations': self.invalidations,
+        }
+
+
+_default_cache: Optional[ClearanceCache] = None
+
+
+def get_clearance_cache() -> Optional[ClearanceCache]:
+    """プロセス共通のキャッシュ（無効化されていればNone）"""
+    global _default_cache
+    if not CLEARANCE_CACHE_CONFIG['enabled']:
+        return None
+    if _default_cache is None:
+        _default_cache = ClearanceCache()
+    return _default_cache
@@ -1,51 +1,225 @@
-import asyncio
+# scraper/cloudflare.py
+import logging
+import statistics
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Sequence
 
-from playwright.async_api import Page
+from playwright.async_api import Error as PlaywrightError
+from playwright.async_api import Page, Response
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 
+from utils.metrics import PHASE_CHALLENGE, get_metrics
+from utils.tracing import get_tracer
 
-async def verify_cloudflare_passed(page: Page) -> bool:
-    """Cloudflareチェック通過の確認"""
-    try:
-        for _ in range(30):  # 30秒待機
+PAGE_OK = 'ok'
+PAGE_CHALLENGE = 'challenge'
+PAGE_BLOCKED = 'blocked'
+
+# サイトのコンテンツが表示されたと判断する要素
+DEFAULT_CONTENT_SELECTORS = ('div.accord-bar', 'div.grid-x', 'h1')
+
+# チャレンジ中のページにだけ存在する要素（通常ページに埋め込まれるjsdスクリプトは対象外）
+CHALLENGE_SELECTORS = (
+    '#challenge-form',
+    '#challenge-running',
+    '#challenge-stage',
+    '#cf-challenge-running',
+    '#turnstile-wrapper',
+)
+CHALLENGE_TITLES = ('just a moment', 'checking your browser', 'please wait')
+# Cloudflareのブロックページ（Error 1020等）
+BLOCK_SELECTORS = ('#cf-error-details', '.cf-error-details')
+BLOCK_TITLES = ('access denied', 'attention required')
+
+# ページの状態を判定する関数（コンテンツが揃えば'ok'、ブロックなら'blocked'、それ以外は待機）
+_PAGE_STATE_JS = """
+({contentSelectors, challengeSelectors, challengeTitles, blockSelectors, blockTitles}) => {
+    const title = (document.title || '').toLowerCase();
+    if (blockSelectors.some(s => document.querySelector(s))
+            || blockTitles.some(t => title.includes(t))) {
+        return 'blocked';
+    }
+    if (challengeSelectors.some(s => document.querySelector(s))
+            || challengeTitles.some(t => title.includes(t))) {
+        return false;
+    }
+    return contentSelectors.some(s => document.querySelector(s)) ? 'ok' : false;
+}
+"""
+
+_CHALLENGE_PRESENT_JS = """
+({challengeSelectors, challengeTitles}) => {
+    const title = (document.title || '').toLowerCase();
+    return challengeSelectors.some(s => document.querySelector(s))
+        || challengeTitles.some(t => title.includes(t));
+}
+"""
+
+
+def classify_response(status: Optional[int], headers: Mapping[str, str]) -> str:
+    """最初の応答のステータスとヘッダーからページを分類"""
+    if headers.get('cf-mitigated') == 'challenge':
+        return PAGE_CHALLENGE
+    is_cloudflare = headers.get('server', '').lower() == 'cloudflare'
+    if status == 503 and is_cloudflare:
+        return PAGE_CHALLENGE
+    if status in (403, 429):
+        return PAGE_BLOCKED
+    return PAGE_OK
+
+
+@dataclass
+class DetectionResult:
+    """1ページのチャレンジ判定結果"""
+    url: str
+    state: str
+    http_status: Optional[int]
+    challenged: bool
+    time_to_clear: float
+
+    @property
+    def ok(self) -> bool:
+        return self.state == PAGE_OK
+
+
+class ChallengeDetector:
+    """
+    ナビゲーション・応答・DOM変更のイベントでCloudflareチャレンジの通過を検知
+    ポーリングせず、MutationObserverで監視する関数がコンテンツの出現時点で解決する
+    ページごとのチャレンジ通過までの時間を集計する
+    """
+
+    def __init__(self, content_selectors: Sequence[str] = DEFAULT_CONTENT_SELECTORS):
+        self.content_selectors = list(content_selectors)
+        self.logger = logging.getLogger(__name__)
+        self.results_by_state: Counter = Counter()
+        self.challenged_pages = 0
+        self.clear_times: List[float] = []
+
+    def _arg(self, content_selectors: Optional[Sequence[str]]) -> Dict:
+        return {
+            'contentSelectors': list(content_selectors or self.content_selectors),
+            'challengeSelectors': list(CHALLENGE_SELECTORS),
+            'challengeTitles': list(CHALLENGE_TITLES),
+            'blockSelectors': list(BLOCK_SELECTORS),
+            'blockTitles': list(BLOCK_TITLES),
+        }
+
+    async def wait(
+        self,
+        page: Page,
+        response: Optional[Response] = None,
+        timeout: int = 30000,
+        content_selectors: Optional[Sequence[str]] = None
+    ) -> DetectionResult:
+        """
+        コンテンツが表示されるか、ブロック・タイムアウトになるまで待機
+        responseを渡すと最初の応答で明らかなブロックを即座に判定する
+        """
+        started = time.monotonic()
+        http_status = response.status if response else None
+        initial = classify_response(http_status, response.headers) if response else PAGE_OK
+        if initial == PAGE_BLOCKED:
+            return self._record(page.url, PAGE_BLOCKED, http_status, False, started)
+
+        arg = self._arg(content_selectors)
+        challenged = initial == PAGE_CHALLENGE
+        state = PAGE_CHALLENGE
+        deadline = started + timeout / 1000
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
             try:
-                page_text = await page.evaluate('document.body.innerText')
-
-                # Cloudflareの検出文字列
-                cf_texts = [
-                    'checking your browser',
-                    'cloudflare',
-                    'please wait',
-                    'please enable javascript',
-                    'please enable cookies',
-                    'security check',
-                    'just a moment'  # これも追加
-                ]
-
-                if not any(text.lower() in page_text.lower() for text in cf_texts):
-                    # サイトのコンテンツを確認
-                    content_selectors = [
-                        'div.accord-bar',
-                        'h6:text("main accords")',
-                        'div.grid-x',
-                        'h1'
-                    ]
-
-                    for selector in content_selectors:
-                        element = await page.query_selector(selector)
-                        if element:
-                            print("Content detected, Cloudflare check passed")
-                            return True
-
-                print("Waiting for content to load...")
-                await asyncio.sleep(1)
-
-            except Exception as e:
-                print(f"Error during verification: {e}")
-                await asyncio.sleep(1)
-
-        print("Content verification timed out")
-        return False
-
-    except Exception as e:
-        print(f"Error in verify_cloudflare_passed: {str(e)}")
-        return False
+                if not challenged:
+                    challenged = await page.evaluate(_CHALLENGE_PRESENT_JS, arg)
+                handle = await page.wait_for_function(
+                    _PAGE_STATE_JS, arg=arg, polling='mutation', timeout=remaining * 1000)
+                state = await handle.json_value()
+                break
+            except PlaywrightTimeoutError:
+                break
+            except PlaywrightError as e:
+                # チャレンジ通過後のリロードで実行コンテキストが破棄された場合は次のページで待ち直す
+                if 'context was destroyed' not in str(e) and 'navigat' not in str(e):
+                    raise
+                try:
+                    await page.wait_for_load_state(
+                        'domcontentloaded', timeout=max(remaining * 1000, 1))
+                except PlaywrightTimeoutError:
+                    break
+
+        return self._record(page.url, state, http_status, challenged, started)
+
+    def _record(
+        self,
+        url: str,
+        state: str,
+        http_status: Optional[int],
+        challenged: bool,
+        started: float
+    ) -> DetectionResult:
+        elapsed = time.monotonic() - started
+        get_metrics().phase_seconds.observe(elapsed, phase=PHASE_CHALLENGE)
+        get_tracer().add_span(
+            PHASE_CHALLENGE, elapsed, state=state, http_status=http_status,
+            challenged=bool(challenged))
+        self.results_by_state[state] += 1
+        if challenged:
+            self.challenged_pages += 1
+            if state == PAGE_OK:
+                self.clear_times.append(elapsed)
+                self.logger.info(f"Cloudflare challenge cleared in {elapsed:.2f}s: {url}")
+        if state != PAGE_OK:
+            self.logger.warning(
+                f"Page not cleared ({state}, HTTP {http_status}) after {elapsed:.2f}s: {url}")
+        return DetectionResult(
+            url=url,
+            state=state,
+            http_status=http_status,
+            challenged=bool(challenged),
+            time_to_clear=elapsed
+        )
+
+    def get_stats(self) -> Dict:
+        """今回の実行での判定結果とチャレンジ通過時間の集計"""
+        times = sorted(self.clear_times)
+        return {
+            'pages': sum(self.results_by_state.values()),
+            'by_state': dict(self.results_by_state),
+            'challenged_pages': self.challenged_pages,
+            'time_to_clear_median': statistics.median(times) if times else None,
+            'time_to_clear_max': times[-1] if times else None,
+        }
+
+    def log_stats(self) -> None:
+        """集計をログに出力"""
+        stats = self.get_stats()
+        median = stats['time_to_clear_median']
+        self.logger.info(
+            f"Cloudflare: {stats['pages']} pages {stats['by_state']}, "
+            f"{stats['challenged_pages']} challenged"
+            + (f", time to clear median {median:.2f}s max {stats['time_to_clear_max']:.2f}s"
+               if median is not None else ""))
+
+
+_default_detector: Optional[ChallengeDetector] = None
+
+
+def get_challenge_detector() -> ChallengeDetector:
+    """プロセス共通の検知器（実行単位の集計を共有）"""
+    global _default_detector
+    if _default_detector is None:
+        _default_detector = ChallengeDetector()
+    return _default_detector
+
+
+async def verify_cloudflare_passed(
+    page: Page,
+    response: Optional[Response] = None,
+    timeout: int = 30000
+) -> bool:
+    """Cloudflareチェック通過の確認"""
+    return (await get_challenge_detector().wait(page, response, timeout)).ok
@@ -0,0 +1,186 @@
+# scraper/extraction_spec.py
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Union
+from urllib.parse import urljoin
+
+from playwright.async_api import Page
+
+from parsing.backends import load_document
+from parsing.html_dom import Element
+
+COERCIONS = ('text', 'int', 'float', 'width', 'url', 'exists')
+
+
+@dataclass(frozen=True)
+class Field:
+    """
+    抽出フィールドの定義
+    selector: 対象要素（Noneなら現在の要素）
+    attr: 取得する属性（Noneなら表示されているテキスト。ブラウザのinnerTextに相当）
+    coerce: 'text' | 'int' | 'float' | 'width'（style中のwidth%）|
+            'url'（ページのURLを基準に絶対URLへ解決。ブラウザのlink.hrefに相当）| 'exists'
+    many: 一致する全要素をリストで返す
+    fields: 要素ごとのネストしたレコード
+    required: ネストしたレコードでこの値がNoneなら、そのレコードを除外
+    """
+    selector: Optional[str] = None
+    attr: Optional[str] = None
+    coerce: str = 'text'
+    many: bool = False
+    fields: Optional[Dict[str, 'Field']] = None
+    required: bool = False
+
+    def __post_init__(self):
+        if self.coerce not in COERCIONS:
+            raise ValueError(f"Unknown coercion: {self.coerce}")
+
+    def to_dict(self) -> Dict:
+        return {
+            'selector': self.selector,
+            'attr': self.attr,
+            'coerce': self.coerce,
+            'many': self.many,
+            'fields': ({name: f.to_dict() for name, f in self.fields.items()}
+                       if self.fields else None),
+            'required': self.required,
+        }
+
+
+# ページ内で仕様を解釈する汎用スクリプト（__SPEC__に仕様のJSONを埋め込む）
+_JS_TEMPLATE = """
+(scope) => {
+    const spec = __SPEC__;
+    const clean = (s) => (s || '').replace(/\\s+/g, ' ').trim();
+    const coerce = (v, type) => {
+        if (v === null || v === undefined) return null;
+        if (type === 'int') { const n = parseInt(v, 10); return isNaN(n) ? null : n; }
+        if (type === 'float') { const n = parseFloat(v); return isNaN(n) ? null : n; }
+        if (type === 'width') {
+            const m = /width:\\s*([\\d.]+)%/.exec(v);
+            return m ? parseFloat(m[1]) : null;
+        }
+        if (type === 'url') {
+            try { return new URL(v, document.baseURI).href; } catch (e) { return null; }
+        }
+        return v;
+    };
+    const value = (el, f) => {
+        if (f.fields) return record(el, f.fields);
+        if (f.coerce === 'exists') return true;
+        const raw = f.attr ? el.getAttribute(f.attr) : clean(el.innerText ?? el.textContent);
+        return coerce(raw, f.coerce);
+    };
+    const record = (root, fields) => {
+        const out = {};
+        for (const [name, f] of Object.entries(fields)) {
+            if (f.many) {
+                const els = f.selector ? Array.from(root.querySelectorAll(f.selector)) : [root];
+                out[name] = els.map(el => value(el, f)).filter(v => v !== null);
+            } else {
+                const el = f.selector ? root.querySelector(f.selector) : root;
+                out[name] = el ? value(el, f) : (f.coerce === 'exists' ? false : null);
+            }
+            if (f.required && out[name] === null) return null;
+        }
+        return out;
+    };
+    const root = scope ? document.querySelector(scope) : document;
+    return root ? record(root, spec) : null;
+}
+"""
+
+
+class ExtractionSpec:
+    """
+    セレクター→フィールドの宣言的な抽出仕様
+    ブラウザでは1回のpage.evaluateで、静的HTMLではPython側で同じ仕様を評価する
+    """
+
+    def __init__(self, fields: Dict[str, Field]):
+        self.fields = fields
+        self._script: Optional[str] = None
+
+    @property
+    def script(self) -> str:
+        """ページ内で実行するスクリプト（初回のみ生成）"""
+        if self._script is None:
+            spec_json = json.dumps(
+                {name: f.to_dict() for name, f in self.fields.items()})
+            self._script = _JS_TEMPLATE.replace('__SPEC__', spec_json)
+        return self._script
+
+    async def extract(self, page: Page, scope: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """ページから1回のCDP呼び出しでレコード全体を取得"""
+        return await page.evaluate(self.script, scope)
+
+    def extract_html(
+        self,
+        html: Union[str, Element],
+        scope: Optional[str] = None,
+        base_url: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        静的HTML（または解析済みツリー）から同じ仕様で抽出
+        文字列はload_documentで解析する（lxmlがあればlxml、なければ標準ライブラリ）
+        base_url: 'url'のフィールドを解決する基準（取得したページのURL）
+        """
+        root = load_document(html) if isinstance(html, str) else html
+        if scope:
+            root = root.select_one(scope)
+            if root is None:
+                return None
+        return _record(root, self.fields, base_url)
+
+
+def _clean(text: Optional[str]) -> str:
+    return ' '.join((text or '').split())
+
+
+def _coerce(value: Optional[str], coerce: str, base_url: Optional[str] = None):
+    if value is None:
+        return None
+    if coerce == 'url':
+        return urljoin(base_url, value.strip()) if base_url else value.strip()
+    if coerce == 'int':
+        match = re.match(r'\s*([+-]?\d+)', value)
+        return int(match.group(1)) if match else None
+    if coerce == 'float':
+        match = re.match(r'\s*([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)', value)
+        return float(match.group(1)) if match else None
+    if coerce == 'width':
+        match = re.search(r'width:\s*([\d.]+)%', value)
+        return float(match.group(1)) if match else None
+    return value
+
+
+def _value(element: Element, spec: Field, base_url: Optional[str]):
+    if spec.fields:
+        return _record(element, spec.fields, base_url)
+    if spec.coerce == 'exists':
+        return True
+    raw = element.get(spec.attr) if spec.attr else _clean(element.text())
+    return _coerce(raw, spec.coerce, base_url)
+
+
+def _record(
+    root: Element,
+    fields: Dict[str, Field],
+    base_url: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    out = {}
+    for name, spec in fields.items():
+        if spec.many:
+            elements = root.select(spec.selector) if spec.selector else [root]
+            out[name] = [v for v in (_value(el, spec, base_url) for el in elements)
+                         if v is not None]
+        else:
+            element = root.select_one(spec.selector) if spec.selector else root
+            if element is not None:
+                out[name] = _value(element, spec, base_url)
+            else:
+                out[name] = False if spec.coerce == 'exists' else None
+        if spec.required and out[name] is None:
+            return None
+    return out
@@ -1,24 +1,68 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from playwright.async_api import Page
 
+from .extraction_spec import ExtractionSpec, Field
+
+# デザイナー一覧ページ（文字ごとのグリッド内）
+BRAND_LIST_SPEC = ExtractionSpec({
+    'brands': Field('div.designerlist', many=True, fields={
+        'name': Field('a', required=True),
+        'url': Field('a', attr='href', coerce='url', required=True),
+        'perfume_count': Field('.badge', coerce='int', required=True),
+    }),
+})
+
+# ブランドページの香水一覧
+PERFUME_LIST_SPEC = ExtractionSpec({
+    'perfumes': Field('.cell.text-left.prefumeHbox', many=True, fields={
+        'name': Field('h3 > a', required=True),
+        'url': Field('h3 > a', attr='href', coerce='url', required=True),
+    }),
+})
+
+# 香水一覧が表示されたと判断する要素
+PERFUME_LIST_SELECTORS = ('.cell.text-left.prefumeHbox',)
+
+# 香水詳細ページ
+PERFUME_DETAIL_SPEC = ExtractionSpec({
+    'title': Field('h1'),
+    'accords': Field('.accord-bar', many=True, fields={
+        'name': Field(),
+        'strength': Field(attr='style', coerce='width', required=True),
+    }),
+    'seasons': Field('.vote-season', many=True, fields={
+        'season': Field(attr='data-season'),
+        'votes': Field(coerce='int'),
+    }),
+    'time_of_day': Field('.vote-time-of-day', many=True, fields={
+        'time': Field(attr='data-time'),
+        'votes': Field(coerce='int'),
+    }),
+})
+
 
 async def extract_brands_data(page: Page, grid_selector: str) -> List[Dict]:
     """ブランドデータの抽出"""
-    js_code = """
-    (selector) => {
-        return Array.from(document.querySelectorAll(selector + ' div.designerlist')).map(el => {
-            const link = el.querySelector('a');
-            const badge = el.querySelector('.badge');
-            if (link && badge) {
-                return {
-                    name: link.textContent.trim(),
-                    url: link.href,
-                    perfume_count: parseInt(badge.textContent)
-                };
-            }
-            return null;
-        }).filter(item => item !== null);
-    }
-    """
-    return await page.evaluate(js_code, grid_selector)
+    data = await BRAND_LIST_SPEC.extract(page, grid_selector)
+    return data['brands'] if data else []
+
+
+async def extract_perfume_list(page: Page) -> List[Dict]:
+    """ブランドページから香水一覧を抽出"""
+    return (await PERFUME_LIST_SPEC.extract(page))['perfumes']
+
+
+async def extract_perfume_detail(page: Page) -> Dict:
+    """香水詳細ページから生データを抽出"""
+    return await PERFUME_DETAIL_SPEC.extract(page)
+
+
+def parse_perfume_list(html: str, base_url: Optional[str] = None) -> List[Dict]:
+    """ブランドページのHTMLから香水一覧を抽出（ブラウザ不要）。URLはbase_urlを基準に解決"""
+    return PERFUME_LIST_SPEC.extract_html(html, base_url=base_url)['perfumes']
+
+
+def parse_perfume_detail(html: str) -> Dict:
+    """香水詳細ページのHTMLから生データを抽出（ブラウザ不要）"""
+    return PERFUME_DETAIL_SPEC.extract_html(html)
@@ -0,0 +1,165 @@
+# scraper/http_fetcher.py
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from playwright.async_api import BrowserContext
+
+from storage.crawl_state import CrawlStateStore, PendingFetch
+from utils.metrics import PHASE_GOTO, PHASE_LOAD, get_metrics
+
+from .rate_limiter import HostRateLimiter, get_rate_limiter, parse_retry_after
+
+FETCH_MODE_BROWSER = 'browser'
+FETCH_MODE_HTTP = 'http'
+FETCH_MODES = (FETCH_MODE_BROWSER, FETCH_MODE_HTTP)
+# ネットワークに出ずアーカイブ済みのHTMLから再抽出する
+FETCH_MODE_ARCHIVE = 'archive'
+
+CHALLENGE_MARKERS = (
+    'just a moment',
+    'checking your browser',
+    'cf-chl-',
+    '_cf_chl_opt',
+    'security challenge',
+    'access denied',
+)
+
+
+@dataclass
+class FetchResult:
+    """HTTP取得結果"""
+    url: str
+    status: int
+    html: str
+    headers: Dict[str, str] = field(default_factory=dict)
+    challenge: bool = False
+    unchanged: bool = False
+    # 変化のあったページの未記録の検証情報（保存が確定してからcommit_fetchで記録する）
+    pending: Optional[PendingFetch] = None
+    # fetch_if_changedのextractで抽出したデータ（変化の判定に使ったもの）
+    data: Any = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200 and not self.challenge
+
+    @property
+    def not_modified(self) -> bool:
+        """条件付きリクエストに対する304応答"""
+        return self.status == 304
+
+
+def is_challenge_response(status: int, headers: Dict[str, str], body: str) -> bool:
+    """Cloudflareチャレンジ・ブロックページかどうかを判定"""
+    if headers.get('cf-mitigated') == 'challenge':
+        return True
+    if status in (403, 503) and headers.get('server', '').lower() == 'cloudflare':
+        return True
+    # 本文の先頭（<head>付近）だけを確認すれば十分
+    head = body[:5000].lower()
+    return any(marker in head for marker in CHALLENGE_MARKERS)
+
+
+class HttpFetcher:
+    """
+    ブラウザコンテキストのAPIリクエストで軽量にHTMLを取得
+    context.requestはコンテキストとCookie（cf_clearance等）を共有し、
+    接続も再利用されるためChromiumでの描画を省略できる
+    """
+
+    def __init__(
+        self,
+        context: BrowserContext,
+        rate_limiter: Optional[HostRateLimiter] = None,
+        timeout: int = 30000
+    ):
+        self.context = context
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.timeout = timeout
+        self.logger = logging.getLogger(__name__)
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        """URLを取得しチャレンジ判定結果と共に返す（headersで条件付きリクエストも可能）"""
+        await self.rate_limiter.acquire(url)
+        metrics = get_metrics()
+        try:
+            with metrics.phase(PHASE_GOTO):
+                response = await self.context.request.get(
+                    url,
+                    headers=headers,
+                    timeout=self.timeout,
+                    fail_on_status_code=False
+                )
+        except Exception:
+            self.rate_limiter.record_error(url)
+            raise
+
+        try:
+            headers = response.headers
+            with metrics.phase(PHASE_LOAD):
+                body = await response.body()
+        finally:
+            await response.dispose()
+        metrics.bytes.inc(len(body), source='http')
+        html = body.decode('utf-8', errors='replace')
+
+        challenge = is_challenge_response(response.status, headers, html)
+        self.rate_limiter.record_response(
+            url,
+            response.status,
+            challenge=challenge,
+            retry_after=parse_retry_after(headers.get('retry-after'))
+        )
+        return FetchResult(
+            url=url,
+            status=response.status,
+            html=html,
+            headers=headers,
+            challenge=challenge
+        )
+
+    async def fetch_html(self, url: str) -> Optional[str]:
+        """取得に成功した場合のみHTMLを返す（失敗時はブラウザにフォールバック）"""
+        try:
+            result = await self.fetch(url)
+        except Exception as e:
+            self.logger.warning(f"HTTP fetch failed for {url}: {e}")
+            return None
+
+        if not result.ok:
+            self.logger.info(
+                f"HTTP fetch not usable for {url} (status {result.status}, "
+                f"challenge={result.challenge}), falling back to browser")
+            return None
+        return result.html
+
+    async def fetch_if_changed(
+        self,
+        url: str,
+        crawl_state: CrawlStateStore,
+        key: Optional[str] = None,
+        extract: Optional[Callable[[str], Any]] = None
+    ) -> FetchResult:
+        """
+        前回の検証情報で条件付き取得し、変化の有無をkey（省略時はURL）で判定
+        extractを指定すると、本文ではなく抽出したデータ（result.data）の正規形で比較する
+        304応答またはハッシュが前回と同じ場合はunchanged=True（その場で記録する）
+        変化があった場合は記録せずresult.pendingに残す（呼び出し側が保存の確定後に記録する）
+        """
+        key = key or url
+        result = await self.fetch(url, headers=crawl_state.conditional_headers(key))
+        if result.not_modified:
+            crawl_state.record_not_modified(key)
+            result.unchanged = True
+        elif result.ok:
+            if extract:
+                result.data = extract(result.html)
+            pending = crawl_state.compare_fetch(
+                key, result.html, result.headers, data=result.data)
+            if pending.changed:
+                result.pending = pending
+            else:
+                crawl_state.commit_fetch(pending)
+                result.unchanged = True
+        return result
@@ -1,51 +1,80 @@
-import asyncio
+import logging
+from typing import Optional
 
 from playwright.async_api import Page
 
-from .cloudflare import verify_cloudflare_passed
-from .utils import get_random_delay
+from .browser_pool import BrowserPool
+from .cloudflare import (PAGE_BLOCKED, PAGE_CHALLENGE, classify_response,
+                         get_challenge_detector)
+from utils.metrics import PHASE_GOTO, get_metrics
+from utils.tracing import traced
 
+from .rate_limiter import HostRateLimiter, get_rate_limiter, parse_retry_after
 
-async def get_page_with_retry(page: Page, url: str, max_retries: int = 3) -> bool:
-    """ページの読み込みを試行（改善版）"""
+logger = logging.getLogger(__name__)
+
+
+@traced('get_page_with_retry')
+async def get_page_with_retry(
+    page: Page,
+    url: str,
+    max_retries: int = 3,
+    rate_limiter: Optional[HostRateLimiter] = None,
+    browser_pool: Optional[BrowserPool] = None
+) -> bool:
+    """ページの読み込みを試行（改善版）
+
+    browser_poolを渡すと結果をコンテキストの健全性として記録する
+    """
+    limiter = rate_limiter or get_rate_limiter()
+    metrics = get_metrics()
     for attempt in range(max_retries):
         try:
-            print(f"Loading page attempt {attempt + 1}")
+            logger.info(f"Loading page attempt {attempt + 1}")
+            if attempt:
+                metrics.retries.inc(operation='page_load')
+
+            # レートリミッターで許可を取得
+            await limiter.acquire(url)
 
             # より緩やかな条件でページを読み込み
-            await page.goto(url,
-                            wait_until='domcontentloaded',
-                            timeout=60000)
-
-            # ページが完全に読み込まれるまで待機
-            try:
-                await page.wait_for_load_state('load', timeout=30000)
-            except Exception as e:
-                print(f"Load state timeout, but continuing: {e}")
-
-            # スクロールしてコンテンツを読み込み
-            await page.evaluate("""
-                window.scrollTo({
-                    top: document.body.scrollHeight,
-                    behavior: 'smooth'
-                });
-            """)
-            await asyncio.sleep(2)
-
-            await page.evaluate("window.scrollTo(0, 0);")
-            await asyncio.sleep(1)
-
-            # Cloudflareチェックの通過を待機
-            if await verify_cloudflare_passed(page):
+            with metrics.phase(PHASE_GOTO, url=url, attempt=attempt + 1):
+                response = await page.goto(url,
+                                           wait_until='domcontentloaded',
+                                           timeout=60000)
+            await metrics.record_transfer(response)
+
+            # チャレンジ（403 + cf-mitigated）は待機し、明らかなブロックは即座に再試行
+            if response and classify_response(response.status, response.headers) == PAGE_BLOCKED:
+                logger.warning(f"Received HTTP {response.status} on attempt {attempt + 1}")
+                limiter.record_response(
+                    url, response.status,
+                    retry_after=parse_retry_after(response.headers.get('retry-after')))
+                if browser_pool:
+                    browser_pool.report(page.context, status=response.status)
+                continue
+
+            # 固定の待機はせず、コンテンツが現れた時点で次へ進む
+            result = await get_challenge_detector().wait(page, response)
+            if result.ok:
+                # チャレンジを通過した場合は最初の応答（403等）ではなく成功として記録
+                status = response.status if response and not result.challenged else 200
+                limiter.record_response(url, status)
+                if browser_pool:
+                    browser_pool.report(page.context, status=status)
                 return True
 
-            print(f"Failed to verify page content on attempt {attempt + 1}")
-            if attempt < max_retries - 1:
-                await asyncio.sleep(get_random_delay(8, 15))
+            logger.warning(f"Failed to verify page content on attempt {attempt + 1} ({result.state})")
+            limiter.record_response(url, result.http_status, challenge=result.state == PAGE_CHALLENGE)
+            if browser_pool:
+                browser_pool.report(
+                    page.context, status=result.http_status,
+                    challenge=result.state == PAGE_CHALLENGE)
 
         except Exception as e:
-            print(f"Error loading page on attempt {attempt + 1}: {str(e)}")
-            if attempt < max_retries - 1:
-                await asyncio.sleep(get_random_delay(8, 15))
+            logger.error(f"Error loading page on attempt {attempt + 1}: {str(e)}")
+            limiter.record_error(url)
+            if browser_pool:
+                browser_pool.report(page.context, error=True)
 
     return False
@@ -1,8 +1,362 @@
 # scraper/proxy_handler.py
 import asyncio
 import logging
-import socket
-from typing import Optional
+import secrets
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import TOR_CONFIG
+
+
+class TorControlError(Exception):
+    """Torコントロールポートがエラー応答を返した"""
+
+
+class TorController:
+    """
+    asyncioによるTorコントロールポートのクライアント
+    コマンドごとに応答（複数行・データ行を含む）を読み切り、エラー応答は例外にする
+    """
+
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+        password: Optional[str] = None,
+        cookie_path: Optional[str] = None,
+        timeout: float = 10.0
+    ):
+        self.host = host or TOR_CONFIG['host']
+        self.port = port or TOR_CONFIG['control_port']
+        self.password = password if password is not None else TOR_CONFIG['password']
+        self.cookie_path = cookie_path or TOR_CONFIG['cookie_path']
+        self.timeout = timeout
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    async def connect(self) -> None:
+        """接続して認証"""
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        await self.authenticate()
+
+    async def authenticate(self) -> None:
+        if self.password is not None:
+            escaped = self.password.replace('\\', '\\\\').replace('"', '\\"')
+            await self.command(f'AUTHENTICATE "{escaped}"')
+        elif self.cookie_path:
+            cookie = await asyncio.to_thread(Path(self.cookie_path).read_bytes)
+            await self.command(f'AUTHENTICATE {cookie.hex()}')
+        else:
+            await self.command('AUTHENTICATE')
+
+    async def command(self, line: str) -> List[Tuple[str, str]]:
+        """コマンドを送り、(ステータス, 本文)の応答行を返す"""
+        if self.writer is None:
+            raise TorControlError("Not connected to Tor control port")
+        async with self._lock:
+            self.writer.write(line.encode('utf-8') + b'\r\n')
+            await self.writer.drain()
+            reply = await asyncio.wait_for(self._read_reply(), self.timeout)
+        status = reply[-1][0]
+        if not status.startswith('2'):
+            raise TorControlError(f"{line.split()[0]} failed: {status} {reply[-1][1]}")
+        return reply
+
+    async def _read_reply(self) -> List[Tuple[str, str]]:
+        lines = []
+        while True:
+            line = await self._readline()
+            status, separator, text = line[:3], line[3:4], line[4:]
+            if separator == '+':
+                # データ行は"."の行まで続く
+                data = []
+                while (data_line := await self._readline()) != '.':
+                    data.append(data_line[1:] if data_line.startswith('..') else data_line)
+                text = '\n'.join([text] + data)
+            lines.append((status, text))
+            if separator == ' ':
+                return lines
+
+    async def _readline(self) -> str:
+        raw = await self.reader.readline()
+        if not raw:
+            raise TorControlError("Tor control connection closed")
+        return raw.decode('utf-8', errors='replace').rstrip('\r\n')
+
+    async def signal(self, name: str) -> None:
+        await self.command(f'SIGNAL {name}')
+
+    async def get_info(self, key: str) -> str:
+        reply = await self.command(f'GETINFO {key}')
+        status, text = reply[0]
+        return text.split('=', 1)[1] if '=' in text else text
+
+    async def circuit_established(self) -> bool:
+        return await self.get_info('status/circuit-established') == '1'
+
+    async def close(self) -> None:
+        if self.writer:
+            try:
+                self.writer.write(b'QUIT\r\n')
+                await self.writer.drain()
+                self.writer.close()
+                await self.writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+            self.writer = self.reader = None
+
+
+@dataclass
+class TorIdentity:
+    """
+    IsolateSOCKSAuthで分離されたSOCKS認証情報（1つの出口回路）
+    ChromiumはSOCKS5認証に対応しないため、ローカルの認証なしSOCKSリレー経由で使う
+    """
+    identity_id: int
+    username: str
+    password: str
+    port: Optional[int] = None
+    generation: int = 0
+    created_at: float = field(default_factory=time.monotonic)
+    requests: int = 0
+    errors: int = 0
+    throttles: int = 0
+    challenges: int = 0
+    bound_contexts: int = 0
+
+    @property
+    def proxy_url(self) -> str:
+        """ブラウザコンテキストに渡すプロキシ"""
+        return f"socks5://127.0.0.1:{self.port}"
+
+    @property
+    def cache_key(self) -> str:
+        """出口IPの単位（ローテーションで変わる）"""
+        return f"tor:{self.username}"
+
+
+def _new_credentials(identity_id: int) -> Tuple[str, str]:
+    return f"kanou-{identity_id}-{secrets.token_hex(6)}", secrets.token_hex(6)
+
+
+class TorCircuitPool:
+    """
+    分離したTor回路（SOCKS ID）のプール
+    IDごとにローカルSOCKSリレーを起動してブラウザコンテキストに割り当て、
+    429・403・チャレンジから健全性を算出し、下回ったIDは認証情報を替えて回路を切り替える
+    切り替えは新しい接続から効くため待機しない
+    """
+
+    def __init__(self, size: int, config: Optional[Dict] = None):
+        self.config = {**TOR_CONFIG, **(config or {})}
+        self.identities = []
+        for identity_id in range(size):
+            username, password = _new_credentials(identity_id)
+            self.identities.append(TorIdentity(identity_id, username, password))
+        self.controller: Optional[TorController] = None
+        self._servers: List[asyncio.AbstractServer] = []
+        self._connections: set = set()
+        self._last_newnym = 0.0
+        self.rotations = 0
+        self.logger = logging.getLogger(__name__)
+
+    async def start(self) -> None:
+        """IDごとのリレーを起動し、コントロールポートに接続して回路の確立を確認"""
+        for identity in self.identities:
+            server = await asyncio.start_server(
+                lambda r, w, identity=identity: self._relay(identity, r, w),
+                host='127.0.0.1', port=0)
+            identity.port = server.sockets[0].getsockname()[1]
+            self._servers.append(server)
+
+        self.controller = TorController()
+        try:
+            await self.controller.connect()
+            established = await self.controller.circuit_established()
+            self.logger.info(
+                f"Tor circuit pool started: {len(self.identities)} identities, "
+                f"circuit established: {established}")
+        except (OSError, asyncio.TimeoutError, TorControlError) as e:
+            # SOCKSだけでも分離は効くため続行
+            self.logger.warning(f"Tor control port unavailable, continuing without it: {e}")
+            self.controller = None
+
+    # 割り当て
+
+    def assign(self) -> TorIdentity:
+        """割り当てが少なく健全なIDを選ぶ"""
+        identity = min(
+            self.identities, key=lambda i: (i.bound_contexts, -self.health(i)))
+        identity.bound_contexts += 1
+        return identity
+
+    def release(self, identity: TorIdentity) -> None:
+        identity.bound_contexts = max(0, identity.bound_contexts - 1)
+
+    def report(
+        self,
+        identity: TorIdentity,
+        status: Optional[int] = None,
+        challenge: bool = False,
+        error: bool = False
+    ) -> bool:
+        """リクエスト結果を記録し、健全性が下回ればローテーションする。ローテーションした場合True"""
+        identity.requests += 1
+        if error:
+            identity.errors += 1
+        if status in (403, 429):
+            identity.throttles += 1
+        if challenge:
+            identity.challenges += 1
+        if self.health(identity) < self.config['min_health']:
+            self.rotate(identity, f"health {self.health(identity):.2f}")
+            return True
+        return False
+
+    def health(self, identity: TorIdentity) -> float:
+        """エラー率・429/403・チャレンジから0〜1の健全性を算出"""
+        score = 1.0
+        if identity.requests >= self.config['min_requests_for_error_rate']:
+            score -= identity.errors / identity.requests
+        score -= identity.throttles * self.config['throttle_penalty']
+        score -= identity.challenges * self.config['challenge_penalty']
+        return max(0.0, score)
+
+    def rotate(self, identity: TorIdentity, reason: str) -> None:
+        """認証情報を替えて新しい回路に切り替える（以降の接続から有効）"""
+        identity.username, identity.password = _new_credentials(identity.identity_id)
+        identity.generation += 1
+        identity.created_at = time.monotonic()
+        identity.requests = identity.errors = identity.throttles = identity.challenges = 0
+        self.rotations += 1
+        self.logger.info(
+            f"Rotated Tor identity {identity.identity_id} ({reason}), "
+            f"generation {identity.generation}")
+
+    async def new_identity_all(self) -> bool:
+        """全回路を作り直す（NEWNYMはTor側の最短間隔を守る）"""
+        if self.controller is None:
+            return False
+        if time.monotonic() - self._last_newnym < self.config['newnym_interval']:
+            return False
+        await self.controller.signal('NEWNYM')
+        self._last_newnym = time.monotonic()
+        for identity in self.identities:
+            self.rotate(identity, "NEWNYM")
+        return True
+
+    # SOCKSリレー
+
+    async def _relay(
+        self,
+        identity: TorIdentity,
+        client_reader: asyncio.StreamReader,
+        client_writer: asyncio.StreamWriter
+    ) -> None:
+        """認証なしのSOCKS5要求を受け、IDの認証情報でTorのSOCKSポートへ中継"""
+        upstream_writer = None
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            # クライアントとの挨拶（認証なしを選択）
+            version, method_count = await client_reader.readexactly(2)
+            await client_reader.readexactly(method_count)
+            if version != 5:
+                return
+            client_writer.write(b'\x05\x00')
+            request = await _read_socks_request(client_reader)
+
+            upstream_reader, upstream_writer = await asyncio.open_connection(
+                self.config['host'], self.config['socks_port'])
+            # ユーザー名/パスワード認証（IsolateSOCKSAuthで回路が分かれる）
+            upstream_writer.write(b'\x05\x01\x02')
+            if await upstream_reader.readexactly(2) != b'\x05\x02':
+                raise ConnectionError("Tor SOCKS port rejected username/password auth")
+            username = identity.username.encode('utf-8')
+            password = identity.password.encode('utf-8')
+            upstream_writer.write(
+                bytes([1, len(username)]) + username + bytes([len(password)]) + password)
+            if (await upstream_reader.readexactly(2))[1] != 0:
+                raise ConnectionError("Tor SOCKS auth failed")
+
+            upstream_writer.write(request)
+            reply = await _read_socks_request(upstream_reader)
+            client_writer.write(reply)
+            await client_writer.drain()
+            if reply[1] != 0:
+                return
+
+            await asyncio.gather(
+                _pipe(client_reader, upstream_writer),
+                _pipe(upstream_reader, client_writer))
+        except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+            self.logger.debug(f"SOCKS relay for identity {identity.identity_id} closed: {e}")
+        finally:
+            self._connections.discard(task)
+            for writer in (client_writer, upstream_writer):
+                if writer is not None:
+                    writer.close()
+
+    def get_stats(self) -> List[Dict]:
+        return [
+            {
+                'identity_id': identity.identity_id,
+                'generation': identity.generation,
+                'health': self.health(identity),
+                'requests': identity.requests,
+                'throttles': identity.throttles,
+                'challenges': identity.challenges,
+                'bound_contexts': identity.bound_contexts,
+            }
+            for identity in self.identities
+        ]
+
+    async def close(self) -> None:
+        for server in self._servers:
+            server.close()
+        for task in list(self._connections):
+            task.cancel()
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers = []
+        if self.controller:
+            await self.controller.close()
+            self.controller = None
+
+
+async def _read_socks_request(reader: asyncio.StreamReader) -> bytes:
+    """SOCKS5の要求・応答（VER CMD/REP RSV ATYP ADDR PORT）を1件読む"""
+    header = await reader.readexactly(4)
+    address_type = header[3]
+    if address_type == 1:
+        address = await reader.readexactly(4)
+    elif address_type == 3:
+        length = await reader.readexactly(1)
+        address = length + await reader.readexactly(length[0])
+    elif address_type == 4:
+        address = await reader.readexactly(16)
+    else:
+        raise ConnectionError(f"Unsupported SOCKS address type: {address_type}")
+    port = await reader.readexactly(2)
+    return header + address + port
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while data := await reader.read(65536):
+            writer.write(data)
+            await writer.drain()
+    finally:
+        if writer.can_write_eof():
+            try:
+                writer.write_eof()
+            except OSError:
+                pass
 
 
 class TorProxyHandler:
@@ -13,17 +367,17 @@ class TorProxyHandler:
 
     async def new_identity(self) -> bool:
         """Torの新しいIDを要求（新しいIP取得）"""
+        controller = TorController(port=self.control_port)
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect(('127.0.0.1', self.control_port))
-                s.send(b'AUTHENTICATE ""\r\n')
-                s.send(b'SIGNAL NEWNYM\r\n')
-                self.logger.info("Requested new Tor identity")
-                await asyncio.sleep(5)  # 新しい回路の確立を待機
-                return True
-        except Exception as e:
+            await controller.connect()
+            await controller.signal('NEWNYM')
+            self.logger.info("Requested new Tor identity")
+            return True
+        except (OSError, asyncio.TimeoutError, TorControlError) as e:
             self.logger.error(f"Failed to get new Tor identity: {e}")
             return False
+        finally:
+            await controller.close()
 
     def get_proxy_url(self) -> str:
         """プロキシURLを取得"""
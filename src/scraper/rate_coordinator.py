@@ -0,0 +1,311 @@
+# scraper/rate_coordinator.py
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional, Set, Union
+
+from config.settings import RATE_LIMIT_CONFIG
+from scraper.rate_limiter import HostRateLimiter, scale_rate_config
+from utils.logger import setup_logger
+from utils.metrics import get_metrics
+from utils.tracing import get_tracer
+
+# 1行1メッセージのJSON
+OP_ACQUIRE = 'acquire'      # 許可の取得（許可できるまで応答を保留）
+OP_RESPONSE = 'response'    # 応答結果の通知
+OP_ERROR = 'error'          # 通信エラーの通知
+EVENT_COOLDOWN = 'cooldown'  # 調整役から全プロセスへのクールダウン通知
+
+
+class RateCoordinator:
+    """
+    同じホスト上の全プロセスで1つのレートを共有する調整役（UNIXソケットのサーバー）
+    ホストごとのトークンバケットを1つだけ持ち、全プロセスの許可を順に払い出す
+    どこかのプロセスが429・403・チャレンジを受けると、その時点で全体のレートを下げ、
+    待機中の許可もクールダウンが明けるまで払い出さない。クールダウンは全プロセスに通知する
+    """
+
+    def __init__(self, path: Union[str, Path], config: Optional[Dict] = None):
+        self.path = Path(path)
+        self.limiter = HostRateLimiter(config)
+        self.clients: Set[asyncio.StreamWriter] = set()
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.granted = 0
+        self.logger = logging.getLogger(__name__)
+
+    async def start(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 前回のプロセスが残したソケットファイル
+        if self.path.exists():
+            self.path.unlink()
+        self.server = await asyncio.start_unix_server(self._handle, str(self.path))
+        # 別ユーザーで動くコンテナからも接続できるようにする
+        os.chmod(self.path, 0o666)
+        self.logger.info(f"Rate coordinator listening on {self.path}")
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.clients.add(writer)
+        self.logger.info(f"Client connected ({len(self.clients)} total)")
+        grants: Set[asyncio.Task] = set()
+        try:
+            while line := await reader.readline():
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    self.logger.warning(f"Ignoring malformed message: {line[:100]!r}")
+                    continue
+                op = message.get('op')
+                if op == OP_ACQUIRE:
+                    # 許可待ちの間も同じ接続の他のメッセージを処理する
+                    task = asyncio.create_task(self._grant(message, writer))
+                    grants.add(task)
+                    task.add_done_callback(grants.discard)
+                elif op == OP_RESPONSE:
+                    self._record(message['url'], lambda: self.limiter.record_response(
+                        message['url'], message.get('status'),
+                        challenge=message.get('challenge', False),
+                        retry_after=message.get('retry_after')))
+                elif op == OP_ERROR:
+                    self._record(message['url'], lambda: self.limiter.record_error(message['url']))
+        except ConnectionError:
+            pass
+        finally:
+            for task in grants:
+                task.cancel()
+            self.clients.discard(writer)
+            writer.close()
+            self.logger.info(f"Client disconnected ({len(self.clients)} remaining)")
+
+    async def _grant(self, message: Dict, writer: asyncio.StreamWriter) -> None:
+        url = message['url']
+        waited = await self.limiter.acquire(url)
+        self.granted += 1
+        bucket = self.limiter.buckets[self.limiter.host_of(url)]
+        self._send(writer, {
+            'id': message['id'],
+            'waited': waited,
+            'rate': bucket.rate,
+        })
+
+    def _record(self, url: str, record) -> None:
+        """応答結果を反映し、クールダウンが延びたら全プロセスに通知"""
+        bucket = self.limiter._bucket(url)
+        before = bucket.blocked_until
+        record()
+        if bucket.blocked_until > before:
+            self._broadcast({
+                'event': EVENT_COOLDOWN,
+                'host': self.limiter.host_of(url),
+                'seconds': bucket.blocked_until - self.limiter.clock(),
+                'rate': bucket.rate,
+            })
+
+    def _broadcast(self, message: Dict) -> None:
+        for writer in list(self.clients):
+            self._send(writer, message)
+
+    def _send(self, writer: asyncio.StreamWriter, message: Dict) -> None:
+        if writer.is_closing():
+            return
+        writer.write(json.dumps(message).encode('utf-8') + b'\n')
+
+    async def close(self) -> None:
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for writer in list(self.clients):
+            writer.close()
+        if self.path.exists():
+            self.path.unlink()
+
+
+class RateCoordinatorClient(HostRateLimiter):
+    """
+    調整役と許可・応答結果をやり取りするレートリミッター（HostRateLimiterと同じ使い方）
+    ローカルのバケットは調整役から受け取ったレートとクールダウンを映すだけで、
+    調整役に接続できない間だけローカルで制限する（そのプロセス単独のレートになる）
+    """
+
+    def __init__(self, path: Union[str, Path], config: Optional[Dict] = None):
+        super().__init__(config)
+        self.path = Path(path)
+        self.reconnect_interval = self.config['coordinator_reconnect']
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._next_id = 0
+        self._retry_at = 0.0
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self.fallbacks = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def _ensure_connected(self) -> bool:
+        if self.connected:
+            return True
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self.connected:
+                return True
+            if time.monotonic() < self._retry_at:
+                return False
+            try:
+                self._reader, self._writer = await asyncio.open_unix_connection(str(self.path))
+            except OSError as e:
+                self._retry_at = time.monotonic() + self.reconnect_interval
+                self.logger.warning(
+                    f"Rate coordinator unavailable at {self.path} ({e}), pacing locally")
+                return False
+            self._reader_task = asyncio.create_task(self._read_loop(self._reader))
+            self.logger.info(f"Connected to rate coordinator at {self.path}")
+            return True
+
+    async def _read_loop(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                if message.get('event') == EVENT_COOLDOWN:
+                    self._apply_cooldown(message)
+                    continue
+                future = self._pending.pop(message.get('id'), None)
+                if future and not future.done():
+                    future.set_result(message)
+        except (ConnectionError, ValueError) as e:
+            self.logger.warning(f"Rate coordinator connection lost: {e}")
+        finally:
+            # 再接続済みなら新しい接続は閉じない
+            if self._reader is reader:
+                self._disconnect()
+
+    def _disconnect(self) -> None:
+        if self._writer:
+            self._writer.close()
+        self._reader = self._writer = None
+        self._retry_at = time.monotonic() + self.reconnect_interval
+        # 許可待ちの呼び出しはローカルの制限に切り替える
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("rate coordinator disconnected"))
+        self._pending.clear()
+
+    def _apply_cooldown(self, message: Dict) -> None:
+        """他のプロセスが受けた制限をローカルのバケットにも反映（切断後もクールダウンを守る）"""
+        bucket = self.buckets.get(message['host']) or self._bucket(f"https://{message['host']}/")
+        bucket.throttle_events += 1
+        bucket.rate = message['rate']
+        bucket.tokens = 0.0
+        bucket.blocked_until = max(bucket.blocked_until, self.clock() + message['seconds'])
+        self.logger.warning(
+            f"Fleet cooldown for {message['host']}: {message['seconds']:.1f} seconds, "
+            f"rate {message['rate']:.3f} req/s")
+
+    def _notify(self, message: Dict) -> bool:
+        """応答を待たないメッセージを送る。送れなければFalse"""
+        if not self.connected:
+            return False
+        try:
+            self._writer.write(json.dumps(message).encode('utf-8') + b'\n')
+            return True
+        except (ConnectionError, RuntimeError):
+            self._disconnect()
+            return False
+
+    async def acquire(self, url: str) -> float:
+        """調整役から許可を取得し、待機した秒数を返す"""
+        if not await self._ensure_connected():
+            self.fallbacks += 1
+            return await super().acquire(url)
+
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        started = time.perf_counter()
+        if not self._notify({'op': OP_ACQUIRE, 'id': request_id, 'url': url}):
+            self._pending.pop(request_id, None)
+            self.fallbacks += 1
+            return await super().acquire(url)
+        try:
+            reply = await future
+        except ConnectionError:
+            self.fallbacks += 1
+            return await super().acquire(url)
+        finally:
+            self._pending.pop(request_id, None)
+
+        bucket = self._bucket(url)
+        bucket.rate = reply['rate']
+        bucket.requests += 1
+        waited = reply['waited']
+        if waited:
+            bucket.stall_seconds += waited
+            get_metrics().sleep_seconds.inc(waited, reason='rate_limit')
+            get_tracer().add_span(
+                'rate_limit', time.perf_counter() - started, host=self.host_of(url),
+                coordinated=True)
+        return waited
+
+    def record_response(
+        self,
+        url: str,
+        status: Optional[int],
+        challenge: bool = False,
+        retry_after: Optional[float] = None
+    ) -> None:
+        """応答結果を調整役に通知（レートの調整とクールダウンは調整役が全体に行う）"""
+        sent = self._notify({
+            'op': OP_RESPONSE, 'url': url, 'status': status,
+            'challenge': challenge, 'retry_after': retry_after,
+        })
+        if sent:
+            get_metrics().record_response(status)
+        else:
+            super().record_response(url, status, challenge=challenge, retry_after=retry_after)
+
+    def record_error(self, url: str) -> None:
+        if self._notify({'op': OP_ERROR, 'url': url}):
+            get_metrics().responses.inc(status='error')
+        else:
+            super().record_error(url)
+
+    async def close(self) -> None:
+        if self._reader_task:
+            self._reader_task.cancel()
+            self._reader_task = None
+        self._disconnect()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='同じホストの全スクレイパーでレートとクールダウンを共有する調整役を起動')
+    parser.add_argument(
+        '--socket', default=RATE_LIMIT_CONFIG['coordinator_socket'],
+        help='UNIXソケットのパス（各コンテナはRATE_COORDINATOR_SOCKETで同じパスを指定）')
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help='接続する全プロセスのワーカー数の合計（ホストの上限レートをこの数に合わせて引き上げる）')
+    args = parser.parse_args()
+    if not args.socket:
+        parser.error('--socket is required')
+
+    setup_logger()
+    try:
+        asyncio.run(RateCoordinator(args.socket, scale_rate_config(args.workers)).serve_forever())
+    except KeyboardInterrupt:
+        pass
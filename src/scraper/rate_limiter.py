@@ -0,0 +1,203 @@
+# scraper/rate_limiter.py
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional
+from urllib.parse import urlparse
+
+from config.settings import RATE_LIMIT_CONFIG
+from utils.metrics import get_metrics
+from utils.tracing import get_tracer
+
+THROTTLE_STATUSES = (403, 429)
+
+
+@dataclass
+class TokenBucket:
+    """ホスト単位のトークンバケット"""
+    rate: float
+    capacity: float
+    tokens: float
+    updated_at: float
+    blocked_until: float = 0.0
+    requests: int = 0
+    throttle_events: int = 0
+    stall_seconds: float = 0.0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+    def refill(self, now: float) -> None:
+        """経過時間に応じてトークンを補充"""
+        elapsed = max(0.0, now - self.updated_at)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+
+class HostRateLimiter:
+    """
+    ホスト単位の適応型レートリミッター
+    200応答が続く間は加算的にレートを上げ、429/403/チャレンジで乗算的に下げる
+    """
+
+    def __init__(
+        self,
+        config: Optional[Dict] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep
+    ):
+        self.config = {**RATE_LIMIT_CONFIG, **(config or {})}
+        self.clock = clock
+        self.sleep = sleep
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        """URLからホスト名を取得"""
+        return urlparse(url).netloc or url
+
+    def _bucket(self, url: str) -> TokenBucket:
+        host = self.host_of(url)
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(
+                rate=self.config['initial_rate'],
+                capacity=self.config['burst'],
+                tokens=1.0,
+                updated_at=self.clock()
+            )
+        return self.buckets[host]
+
+    async def acquire(self, url: str) -> float:
+        """リクエスト許可を取得し、待機した秒数を返す"""
+        bucket = self._bucket(url)
+        waited = 0.0
+        started = time.perf_counter()
+        async with bucket.lock:
+            while True:
+                now = self.clock()
+                bucket.refill(now)
+                wait = bucket.blocked_until - now
+                if wait <= 0:
+                    # 浮動小数点の誤差で待機が終わらないのを防ぐ
+                    if bucket.tokens >= 1 - 1e-9:
+                        bucket.tokens = max(0.0, bucket.tokens - 1)
+                        bucket.requests += 1
+                        break
+                    wait = (1 - bucket.tokens) / bucket.rate
+                    wait *= 1 + random.uniform(0, self.config['jitter'])
+
+                waited += wait
+                bucket.stall_seconds += wait
+                await self.sleep(wait)
+        if waited:
+            get_metrics().sleep_seconds.inc(waited, reason='rate_limit')
+            # 他のリクエストのロック待ちを含めた実時間
+            get_tracer().add_span(
+                'rate_limit', time.perf_counter() - started, host=self.host_of(url))
+        return waited
+
+    def record_response(
+        self,
+        url: str,
+        status: Optional[int],
+        challenge: bool = False,
+        retry_after: Optional[float] = None
+    ) -> None:
+        """応答結果をフィードバックしてレートを調整"""
+        bucket = self._bucket(url)
+        get_metrics().record_response(status)
+        if challenge or status in THROTTLE_STATUSES:
+            self._throttle(bucket, 'challenge' if challenge else status, retry_after)
+        elif status is not None and 200 <= status < 400:
+            bucket.rate = min(
+                self.config['max_rate'],
+                bucket.rate + self.config['additive_increase']
+            )
+
+    def record_error(self, url: str) -> None:
+        """通信エラーを記録（レートは維持し短時間停止）"""
+        bucket = self._bucket(url)
+        get_metrics().responses.inc(status='error')
+        cooldown = self.config['cooldown'].get('error', 0)
+        bucket.blocked_until = max(bucket.blocked_until, self.clock() + cooldown)
+
+    def _throttle(self, bucket: TokenBucket, reason, retry_after: Optional[float]) -> None:
+        bucket.throttle_events += 1
+        bucket.rate = max(
+            self.config['min_rate'],
+            bucket.rate * self.config['multiplicative_decrease']
+        )
+        bucket.tokens = 0.0
+        cooldown = self.config['cooldown'].get(reason, 0)
+        if retry_after is not None:
+            cooldown = max(cooldown, retry_after)
+        bucket.blocked_until = max(bucket.blocked_until, self.clock() + cooldown)
+        self.logger.warning(
+            f"Throttled ({reason}): rate lowered to {bucket.rate:.3f} req/s, "
+            f"cooling down {cooldown:.1f} seconds")
+
+    def get_metrics(self) -> Dict[str, Dict]:
+        """ホストごとの現在レートと停止時間"""
+        now = self.clock()
+        return {
+            host: {
+                'rate': bucket.rate,
+                'tokens': bucket.tokens,
+                'requests': bucket.requests,
+                'throttle_events': bucket.throttle_events,
+                'stall_seconds': bucket.stall_seconds,
+                'cooldown_remaining': max(0.0, bucket.blocked_until - now),
+            }
+            for host, bucket in self.buckets.items()
+        }
+
+    async def close(self) -> None:
+        """解放するリソースはない（調整役のクライアントは接続を閉じる）"""
+        pass
+
+    def log_metrics(self) -> None:
+        """メトリクスをログに出力"""
+        for host, metrics in self.get_metrics().items():
+            self.logger.info(
+                f"Rate limiter [{host}]: {metrics['rate']:.3f} req/s, "
+                f"{metrics['requests']} requests, "
+                f"{metrics['throttle_events']} throttles, "
+                f"stalled {metrics['stall_seconds']:.1f} seconds")
+
+
+def scale_rate_config(worker_count: int, config: Optional[Dict] = None) -> Dict:
+    """
+    ワーカー数に応じてホストの上限レートを引き上げた設定を返す
+    バケットは全ワーカーで共有されるため、max_rateのままではワーカーを増やしても全体が1ワーカー分に抑えられる
+    """
+    config = {**RATE_LIMIT_CONFIG, **(config or {})}
+    max_rate = config['max_rate'] * max(1, worker_count)
+    if config.get('host_max_rate'):
+        max_rate = min(max_rate, config['host_max_rate'])
+    return {**config, 'max_rate': max_rate}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-Afterヘッダー（秒数）を解析"""
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+_default_limiter: Optional[HostRateLimiter] = None
+
+
+def get_rate_limiter() -> HostRateLimiter:
+    """プロセス共通のレートリミッターを取得"""
+    global _default_limiter
+    if _default_limiter is None:
+        _default_limiter = HostRateLimiter()
+    return _default_limiter
+
+
+def set_rate_limiter(limiter: HostRateLimiter) -> None:
+    """プロセス共通のレートリミッターを差し替える（タスクの生成前に呼ぶ）"""
+    global _default_limiter
+    _default_limiter = limiter
@@ -0,0 +1,118 @@
+# scraper/resource_blocker.py
+import logging
+from collections import Counter
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from playwright.async_api import BrowserContext, Response, Route
+
+from config.settings import RESOURCE_BLOCKING_CONFIG
+
+# 許可ドメイン以外から読み込まれた場合に遮断する種類
+THIRD_PARTY_TYPES = {'script', 'xhr', 'fetch', 'websocket', 'eventsource', 'other'}
+
+
+def _domain_matches(host: str, domains) -> bool:
+    return any(host == d or host.endswith('.' + d) for d in domains)
+
+
+class ResourceBlocker:
+    """
+    コンテキスト単位のリクエスト遮断
+    画像・フォント・広告・サードパーティスクリプトを読み込まずに中断する
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = {**RESOURCE_BLOCKING_CONFIG, **(config or {})}
+        self.logger = logging.getLogger(__name__)
+        self.blocked_requests = 0
+        self.allowed_requests = 0
+        self.allowed_bytes = 0
+        self.blocked_by_type: Counter = Counter()
+        self.blocked_by_domain: Counter = Counter()
+
+    def should_block(self, resource_type: str, url: str, is_navigation: bool = False) -> bool:
+        """リクエストを遮断すべきか判定"""
+        if is_navigation or resource_type == 'document':
+            return False
+
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https'):
+            return False
+
+        host = parsed.hostname or ''
+        if _domain_matches(host, self.config['deny_domains']):
+            return True
+
+        allowed_domain = _domain_matches(host, self.config['allow_domains'])
+        # Cloudflareチャレンジ関連は種類に関係なく通す
+        if allowed_domain and (host.endswith('cloudflare.com') or '/cdn-cgi/' in parsed.path):
+            return False
+
+        if resource_type in self.config['block_resource_types']:
+            return True
+
+        if (self.config['block_third_party'] and not allowed_domain
+                and resource_type in THIRD_PARTY_TYPES):
+            return True
+
+        return False
+
+    async def install(self, context: BrowserContext) -> None:
+        """コンテキストにルーティングを設定"""
+        if not self.config['enabled']:
+            return
+        await context.route('**/*', self._handle_route)
+        context.on('response', self._on_response)
+
+    async def _handle_route(self, route: Route) -> None:
+        request = route.request
+        try:
+            if self.should_block(request.resource_type, request.url,
+                                 request.is_navigation_request()):
+                self.blocked_requests += 1
+                self.blocked_by_type[request.resource_type] += 1
+                self.blocked_by_domain[urlparse(request.url).hostname or ''] += 1
+                await route.abort('blockedbyclient')
+                return
+            self.allowed_requests += 1
+            await route.continue_()
+        except Exception as e:
+            # ページが閉じられた後のルートなど
+            self.logger.debug(f"Error handling route for {request.url}: {e}")
+
+    def _on_response(self, response: Response) -> None:
+        try:
+            self.allowed_bytes += int(response.headers.get('content-length', 0))
+        except ValueError:
+            pass
+
+    def get_stats(self) -> Dict:
+        """今回の実行での遮断・通過の集計"""
+        return {
+            'blocked_requests': self.blocked_requests,
+            'allowed_requests': self.allowed_requests,
+            'allowed_bytes': self.allowed_bytes,
+            'blocked_by_type': dict(self.blocked_by_type),
+            'top_blocked_domains': dict(self.blocked_by_domain.most_common(10)),
+        }
+
+    def log_stats(self) -> None:
+        """集計をログに出力"""
+        stats = self.get_stats()
+        self.logger.info(
+            f"Resource blocking: {stats['blocked_requests']} blocked, "
+            f"{stats['allowed_requests']} allowed "
+            f"({stats['allowed_bytes'] / 1024:.0f} KiB transferred), "
+            f"by type {stats['blocked_by_type']}")
+
+
+_default_blocker: Optional[ResourceBlocker] = None
+
+
+def get_resource_blocker() -> ResourceBlocker:
+    """プロセス共通のブロッカー（実行単位の集計を共有）"""
+    global _default_blocker
+    if _default_blocker is None:
+        _default_blocker = ResourceBlocker()
+    return _default_blocker
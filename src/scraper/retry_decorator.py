@@ -1,21 +1,28 @@
 import asyncio
 import logging
-import socket
 from functools import wraps
 from typing import Any, Callable, TypeVar
 
+from utils.metrics import get_metrics
+from utils.tracing import get_tracer
+
+from .proxy_handler import TorControlError, TorController
+
 T = TypeVar('T')
 
+logger = logging.getLogger(__name__)
+
 
 async def switch_proxy():
     """Torの新しい回路を要求"""
+    controller = TorController()
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect(('127.0.0.1', 9051))
-            s.send(b'AUTHENTICATE ""\r\n')
-            s.send(b'SIGNAL NEWNYM\r\n')
-    except Exception as e:
-        print(f"Failed to switch Tor circuit: {e}")
+        await controller.connect()
+        await controller.signal('NEWNYM')
+    except (OSError, asyncio.TimeoutError, TorControlError) as e:
+        logger.error(f"Failed to switch Tor circuit: {e}")
+    finally:
+        await controller.close()
 
 # scraper/retry_decorator.py
 
@@ -34,7 +41,8 @@ def with_retry(
 
             for attempt in range(max_retries):
                 try:
-                    return await func(*args, **kwargs)
+                    with get_tracer().span('attempt', function=func.__name__, attempt=attempt + 1):
+                        return await func(*args, **kwargs)
                 except Exception as e:
                     last_exception = e
                     logging.error(
@@ -43,7 +51,8 @@ def with_retry(
                     )
 
                     if attempt < max_retries - 1:
-                        await asyncio.sleep(delay)
+                        get_metrics().retries.inc(operation=func.__name__)
+                        await get_metrics().sleep(delay, 'retry')
                         delay = min(delay * exponential_base, max_delay)
 
             raise last_exception
@@ -1,4 +1,5 @@
 import random
+from typing import Dict, List
 
 from config.settings import SCRAPING_CONFIG
 
@@ -19,3 +20,16 @@ def normalize_url(url: str) -> str:
         if url.startswith('/')
         else url
     )
+
+
+# 香水詳細ページのURL（スペックは絶対URLを返すが、相対URLも受け付ける）
+PERFUME_URL_PREFIXES = ('/perfume/', 'https://www.fragrantica.com/perfume/')
+
+
+def perfume_urls(perfumes: List[Dict]) -> List[str]:
+    """香水一覧（PERFUME_LIST_SPECの出力）から詳細ページのURLを正規化して取り出す"""
+    return [
+        normalize_url(perfume['url'])
+        for perfume in perfumes
+        if perfume['url'].startswith(PERFUME_URL_PREFIXES)
+    ]
@@ -0,0 +1,255 @@
+# storage/base.py
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from config.settings import CATALOG_CONFIG, STORAGE_CONFIG
+
+RECORD_FRAGRANCE_BASIC = 'fragrance_basic'
+RECORD_PERFUME = 'perfume'
+RECORD_BRAND = 'brand'
+
+STORAGE_BACKEND_SEGMENT = 'segment'
+STORAGE_BACKEND_FILES = 'files'
+STORAGE_BACKEND_SQLITE = 'sqlite'
+STORAGE_BACKENDS = (STORAGE_BACKEND_SEGMENT, STORAGE_BACKEND_FILES, STORAGE_BACKEND_SQLITE)
+
+CommitCallback = Callable[[], None]
+
+logger = logging.getLogger(__name__)
+
+
+class RecordStorage(ABC):
+    """
+    スクレイピング結果の保存先の共通インターフェース
+    on_commitはレコードが永続化された後にイベントループ上で呼ばれる
+    """
+
+    @abstractmethod
+    async def write(
+        self,
+        record_type: str,
+        record: Dict,
+        on_commit: Optional[CommitCallback] = None
+    ) -> None:
+        """レコードを1件書き込む"""
+
+    async def write_many(
+        self,
+        record_type: str,
+        records: Iterable[Dict],
+        on_commit: Optional[CommitCallback] = None
+    ) -> None:
+        """複数レコードを書き込み、全件の永続化後にon_commitを呼ぶ"""
+        records = list(records)
+        for i, record in enumerate(records):
+            await self.write(
+                record_type, record,
+                on_commit=on_commit if i == len(records) - 1 else None)
+        if not records and on_commit:
+            on_commit()
+
+    @abstractmethod
+    async def flush(self) -> None:
+        """バッファ中のレコードを書き出す"""
+
+    @abstractmethod
+    async def close(self) -> None:
+        """書き出しを完了してリソースを解放"""
+
+    async def __aenter__(self) -> 'RecordStorage':
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+
+class BufferedRecordStorage(RecordStorage):
+    """
+    レコードをバッファし、一定件数・一定サイズ・一定時間でまとめてコミットする保存先
+    _commitはイベントループ外のスレッドで実行され、flushの直列化によって同時には呼ばれない
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = {**STORAGE_CONFIG, **(config or {})}
+        self._buffers: Dict[str, List[Any]] = {}
+        self._callbacks: List[CommitCallback] = []
+        self._buffered_records = 0
+        self._buffered_bytes = 0
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+        # 統計
+        self.records_written = 0
+        self.commits = 0
+
+    def _prepare(self, record_type: str, record: Dict) -> Tuple[Any, int]:
+        """バッファに積む形式とそのバイト数（既定はレコードそのまま）"""
+        return record, 0
+
+    @abstractmethod
+    def _commit(self, batches: Dict[str, List[Any]]) -> None:
+        """ワーカースレッドで実行されるグループコミット"""
+
+    def _close_resources(self) -> None:
+        """ワーカースレッドで実行される終了処理"""
+
+    async def write(
+        self,
+        record_type: str,
+        record: Dict,
+        on_commit: Optional[CommitCallback] = None
+    ) -> None:
+        """レコードをバッファに追加し、閾値を超えたらグループコミット"""
+        await self.write_many(record_type, [record], on_commit)
+
+    async def write_many(
+        self,
+        record_type: str,
+        records: Iterable[Dict],
+        on_commit: Optional[CommitCallback] = None
+    ) -> None:
+        """複数レコードを同じコミットに入るようまとめてバッファに追加"""
+        if self._closed:
+            raise RuntimeError("Storage is closed")
+        self._ensure_flush_task()
+
+        buffer = self._buffers.setdefault(record_type, [])
+        for record in records:
+            item, size = self._prepare(record_type, record)
+            buffer.append(item)
+            self._buffered_records += 1
+            self._buffered_bytes += size
+        if on_commit:
+            self._callbacks.append(on_commit)
+
+        if (self._buffered_records >= self.config['group_commit_records']
+                or self._buffered_bytes >= self.config['group_commit_bytes']):
+            await self.flush()
+
+    async def flush(self) -> None:
+        """バッファをスレッドで書き出し、完了後にコールバックを呼ぶ"""
+        async with self._flush_lock:
+            if not self._buffered_records and not self._callbacks:
+                return
+            batches = {k: v for k, v in self._buffers.items() if v}
+            callbacks = self._callbacks
+            self._buffers = {}
+            self._callbacks = []
+            self._buffered_records = 0
+            self._buffered_bytes = 0
+
+            if batches:
+                await asyncio.to_thread(self._commit, batches)
+                self.records_written += sum(len(items) for items in batches.values())
+                self.commits += 1
+
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f"Error in commit callback: {e}")
+
+    async def close(self) -> None:
+        """残りを書き出してリソースを解放"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        await asyncio.to_thread(self._close_resources)
+        logger.info(f"{type(self).__name__} closed: {self.get_stats()}")
+
+    def get_stats(self) -> Dict:
+        return {
+            'records_written': self.records_written,
+            'commits': self.commits,
+        }
+
+    def _ensure_flush_task(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        """件数に達しなくても一定間隔でコミット"""
+        while True:
+            await asyncio.sleep(self.config['commit_interval'])
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing {type(self).__name__}: {e}")
+
+
+def create_storage(
+    backend: str,
+    root: Union[str, Path],
+    config: Optional[Dict] = None,
+    catalog_path: Optional[Union[str, Path]] = None
+) -> RecordStorage:
+    """
+    バックエンド名から保存先を生成
+    segment: root/segments以下にJSONLセグメント
+    files: 従来の1香水1ファイルの配置
+    sqlite: カタログDB（catalog_path、省略時はroot直下）
+    """
+    root = Path(root)
+    if backend == STORAGE_BACKEND_SEGMENT:
+        from .segment_storage import SegmentStorage
+        return SegmentStorage(root / 'segments', config)
+    if backend == STORAGE_BACKEND_FILES:
+        from .file_storage import JsonFileStorage
+        return JsonFileStorage(root)
+    if backend == STORAGE_BACKEND_SQLITE:
+        from .sqlite_catalog import SqliteCatalogStorage
+        return SqliteCatalogStorage(catalog_path or root / CATALOG_CONFIG['filename'], config)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def iter_saved_records(
+    backend: str,
+    root: Union[str, Path],
+    record_type: str,
+    catalog_path: Optional[Union[str, Path]] = None
+) -> Iterator[Dict]:
+    """
+    create_storageで保存したレコードを順に読み出す
+    sqliteバックエンドは香水（perfume）と香水基本情報（fragrance_basic）のみ
+    """
+    root = Path(root)
+    if backend == STORAGE_BACKEND_SEGMENT:
+        from .segment_storage import iter_records
+        yield from iter_records(root / 'segments', record_type)
+    elif backend == STORAGE_BACKEND_FILES:
+        from .sqlite_catalog import classify_record
+        for file_path in root.rglob('*.json'):
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    record = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping {file_path}: {e}")
+                continue
+            if classify_record(record) == record_type:
+                yield record
+    elif backend == STORAGE_BACKEND_SQLITE:
+        from .sqlite_catalog import SqliteCatalogStorage
+        catalog = SqliteCatalogStorage(catalog_path or root / CATALOG_CONFIG['filename'])
+        try:
+            if record_type == RECORD_PERFUME:
+                yield from catalog.iter_perfumes()
+            elif record_type == RECORD_FRAGRANCE_BASIC:
+                yield from catalog.iter_fragrances()
+            else:
+                raise ValueError(f"Cannot read {record_type} records from the catalog")
+        finally:
+            catalog.conn.close()
+    else:
+        raise ValueError(f"Unknown storage backend: {backend}")
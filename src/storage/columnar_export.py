@@ -0,0 +1,218 @@
+# storage/columnar_export.py
+import argparse
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterator, List, Union
+
+from .base import RECORD_PERFUME
+from .segment_storage import iter_records
+from .sqlite_catalog import (SEASONS, TIMES_OF_DAY, SqliteCatalogStorage,
+                             classify_record)
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # 列指向エクスポートは任意
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+FORMAT_PARQUET = 'parquet'
+FORMAT_ARROW = 'arrow'
+FORMAT_SUFFIXES = {FORMAT_PARQUET: '.parquet', FORMAT_ARROW: '.arrow'}
+
+
+def _schemas() -> Dict[str, 'pa.Schema']:
+    perfumes = pa.schema(
+        [
+            ('perfume_id', pa.int64()),
+            ('brand', pa.string()),
+            ('name', pa.string()),
+            ('url', pa.string()),
+            ('for_women', pa.bool_()),
+            ('for_men', pa.bool_()),
+        ]
+        + [(season, pa.bool_()) for season in SEASONS]
+        + [(time_of_day, pa.bool_()) for time_of_day in TIMES_OF_DAY]
+        + [('accord_count', pa.int16())]
+    )
+    accords = pa.schema([
+        ('perfume_id', pa.int64()),
+        ('accord', pa.string()),
+        ('strength', pa.int16()),
+        ('position', pa.int16()),
+    ])
+    return {'perfumes': perfumes, 'perfume_accords': accords}
+
+
+def perfume_key(record: Dict) -> str:
+    """香水を識別するキー（URL、なければブランドと名前）"""
+    return record.get('url') or f"{record['brand']}/{record['name']}"
+
+
+def perfume_id(record: Dict) -> int:
+    """キーのハッシュから導く安定したID（エクスポートのたびに変わらない符号付き64bit）"""
+    digest = hashlib.blake2b(perfume_key(record).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def _source_records(source: Path) -> Iterator[Dict]:
+    """
+    1つの保存形式から香水レコードを読み出す
+    セグメントがあればセグメントのみ（互換の1香水1ファイルは同じ内容の写しのため読まない）
+    """
+    if source.is_file():
+        catalog = SqliteCatalogStorage(source)
+        try:
+            yield from catalog.iter_perfumes()
+        finally:
+            catalog.conn.close()
+        return
+
+    segment_roots = sorted(p for p in source.rglob('segments') if p.is_dir())
+    if segment_roots:
+        for segment_root in segment_roots:
+            yield from iter_records(segment_root, RECORD_PERFUME)
+        return
+
+    for file_path in sorted(source.rglob('*.json')):
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping {file_path}: {e}")
+            continue
+        if classify_record(record) == RECORD_PERFUME:
+            yield record
+
+
+def iter_perfume_records(source: Union[str, Path]) -> Iterator[Dict]:
+    """
+    保存済みの香水レコードを香水ごとに1件（最後に保存されたもの）ずつ読み出す
+    source: カタログDB（.sqlite3）、またはセグメント・1香水1ファイルを含むデータディレクトリ
+    追記型のセグメントは再取得のたびに行が増えるため、1パス目でキーごとの最後の位置だけを覚え
+    2パス目でその位置のレコードを返す（メモリはキーの分のみ）
+    """
+    source = Path(source)
+    last_seen: Dict[str, int] = {}
+    for position, record in enumerate(_source_records(source)):
+        last_seen[perfume_key(record)] = position
+    for position, record in enumerate(_source_records(source)):
+        if last_seen.get(perfume_key(record)) == position:
+            yield record
+
+
+class _TableWriter:
+    """列ごとのバッファをbatch_rows行ごとにレコードバッチとして書き出す"""
+
+    def __init__(self, path: Path, schema: 'pa.Schema', file_format: str, batch_rows: int):
+        self.schema = schema
+        self.batch_rows = batch_rows
+        self.columns: Dict[str, List] = {name: [] for name in schema.names}
+        self.rows = 0
+        self.total_rows = 0
+        if file_format == FORMAT_PARQUET:
+            self.writer = pq.ParquetWriter(str(path), schema, compression='zstd')
+        else:
+            self.writer = pa.ipc.new_file(str(path), schema)
+
+    def append(self, row: Dict) -> None:
+        for name, values in self.columns.items():
+            values.append(row[name])
+        self.rows += 1
+        if self.rows >= self.batch_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.rows:
+            return
+        batch = pa.record_batch(
+            [pa.array(self.columns[field.name], type=field.type) for field in self.schema],
+            schema=self.schema)
+        if isinstance(self.writer, pq.ParquetWriter):
+            self.writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+        self.total_rows += self.rows
+        for values in self.columns.values():
+            values.clear()
+        self.rows = 0
+
+    def close(self) -> None:
+        self.flush()
+        self.writer.close()
+
+
+def export_perfumes(
+    source: Union[str, Path],
+    output_dir: Union[str, Path],
+    file_format: str = FORMAT_PARQUET,
+    batch_rows: int = 50000
+) -> Dict[str, int]:
+    """
+    香水レコードを列指向の2テーブルに書き出す
+    perfumes: 1香水1行（性別・季節・時間帯はブール列）
+    perfume_accords: アコードを平坦化した(perfume_id, accord, strength)
+    perfume_idはURLのハッシュで、エクスポートをまたいで同じ香水は同じIDになる
+    メモリ使用量はbatch_rows行分と重複除去用のキーに収まる
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow is required for columnar export (pip install pyarrow)")
+    if file_format not in FORMAT_SUFFIXES:
+        raise ValueError(f"Unknown format: {file_format}")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    suffix = FORMAT_SUFFIXES[file_format]
+    writers = {
+        name: _TableWriter(output_dir / f"{name}{suffix}", schema, file_format, batch_rows)
+        for name, schema in _schemas().items()
+    }
+
+    try:
+        for record in iter_perfume_records(source):
+            record_id = perfume_id(record)
+            seasons = record.get('seasons') or {}
+            time_of_day = record.get('time_of_day') or {}
+            genders = record.get('target_gender') or []
+            accords = record.get('main_accords') or []
+            writers['perfumes'].append({
+                'perfume_id': record_id,
+                'brand': record['brand'],
+                'name': record['name'],
+                'url': record.get('url'),
+                'for_women': 'women' in genders,
+                'for_men': 'men' in genders,
+                **{season: bool(seasons.get(season)) for season in SEASONS},
+                **{t: bool(time_of_day.get(t)) for t in TIMES_OF_DAY},
+                'accord_count': len(accords),
+            })
+            for position, accord in enumerate(accords):
+                writers['perfume_accords'].append({
+                    'perfume_id': record_id,
+                    'accord': accord['name'],
+                    'strength': int(accord['strength']),
+                    'position': position,
+                })
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    counts = {name: writer.total_rows for name, writer in writers.items()}
+    logger.info(f"Exported {counts} to {output_dir}")
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='香水レコードをParquet/Arrowの列指向テーブルに書き出す')
+    parser.add_argument('source', help='カタログDBまたはデータディレクトリ（例: data）')
+    parser.add_argument('output_dir', help='例: data/columnar')
+    parser.add_argument('--format', choices=list(FORMAT_SUFFIXES), default=FORMAT_PARQUET)
+    parser.add_argument('--batch-rows', type=int, default=50000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(export_perfumes(args.source, args.output_dir, args.format, args.batch_rows))
@@ -0,0 +1,183 @@
+# storage/crawl_state.py
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Set, Union
+
+from config.settings import FRONTIER_CONFIG
+
+from .frontier import open_shared_db
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS url_state (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    checked_at REAL,
+    changed_at REAL
+);
+CREATE TABLE IF NOT EXISTS brand_counts (
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    perfume_count INTEGER NOT NULL,
+    recorded_at REAL NOT NULL,
+    PRIMARY KEY (kind, url)
+);
+"""
+
+
+def content_hash(html: str) -> str:
+    """本文のハッシュ（変更検知用）"""
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+
+def canonical_hash(data: Any) -> str:
+    """抽出済みデータの正規形（キー順を固定したJSON）のハッシュ"""
+    return content_hash(
+        json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':')))
+
+
+@dataclass
+class UrlState:
+    """URLごとの前回取得時の検証情報"""
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_hash: Optional[str]
+    checked_at: Optional[float]
+    changed_at: Optional[float]
+
+
+@dataclass
+class PendingFetch:
+    """記録前の取得結果（保存が確定してからcommit_fetchで記録する）"""
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_hash: str
+    changed: bool
+
+
+class CrawlStateStore:
+    """
+    差分クロール用にURLごとのETag/Last-Modified・本文ハッシュと、
+    タスク（フロンティアの種別）ごとに処理済みブランドの香水数を保持する
+    フロンティアと同じSQLiteファイルに別テーブルとして格納する
+    """
+
+    def __init__(self, path: Union[str, Path], clock: Callable[[], float] = time.time):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.clock = clock
+        # フロンティアと同じファイルのため、同じジャーナルモードで開く
+        self.conn = open_shared_db(self.path, FRONTIER_CONFIG['journal_mode'])
+        self.conn.executescript(_SCHEMA)
+
+    def get(self, url: str) -> Optional[UrlState]:
+        row = self.conn.execute(
+            "SELECT url, etag, last_modified, content_hash, checked_at, changed_at "
+            "FROM url_state WHERE url = ?", (url,)).fetchone()
+        return UrlState(*row) if row else None
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """条件付きリクエスト用のヘッダー（検証情報がなければ空）"""
+        state = self.get(url)
+        headers = {}
+        if state and state.etag:
+            headers['If-None-Match'] = state.etag
+        if state and state.last_modified:
+            headers['If-Modified-Since'] = state.last_modified
+        return headers
+
+    def compare_fetch(
+        self,
+        url: str,
+        html: Optional[str] = None,
+        headers: Optional[Mapping[str, str]] = None,
+        data: Any = None
+    ) -> PendingFetch:
+        """
+        取得結果を前回と比較する（記録はしない）。前回から内容が変わっていればchanged=True（初回もTrue）
+        data: 抽出したデータ。指定時は本文ではなくその正規形をハッシュする
+              （広告・トークン・カウンター等、本文だけの変動を変化とみなさない）
+        変化のあったページは抽出・保存が確定してからcommit_fetchで記録する
+        （先に記録すると、保存前の失敗やクラッシュの後も変化なしと判定されて取りこぼす）
+        """
+        headers = headers or {}
+        digest = canonical_hash(data) if data is not None else content_hash(html)
+        previous = self.get(url)
+        return PendingFetch(
+            url=url,
+            etag=headers.get('etag'),
+            last_modified=headers.get('last-modified'),
+            content_hash=digest,
+            changed=previous is None or previous.content_hash != digest)
+
+    def commit_fetch(self, pending: PendingFetch) -> None:
+        """compare_fetchの結果を記録"""
+        now = self.clock()
+        self.conn.execute(
+            "INSERT INTO url_state (url, etag, last_modified, content_hash, checked_at, changed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (url) DO UPDATE SET etag = excluded.etag, "
+            "last_modified = excluded.last_modified, content_hash = excluded.content_hash, "
+            "checked_at = excluded.checked_at, "
+            "changed_at = CASE WHEN ? THEN excluded.changed_at ELSE url_state.changed_at END",
+            (pending.url, pending.etag, pending.last_modified, pending.content_hash, now, now,
+             pending.changed))
+
+    def record_fetch(self, url: str, html: str, headers: Optional[Mapping[str, str]] = None) -> bool:
+        """取得結果をすぐに記録し、前回から本文が変わっていればTrue（初回もTrue）"""
+        pending = self.compare_fetch(url, html, headers)
+        self.commit_fetch(pending)
+        return pending.changed
+
+    def record_not_modified(self, url: str) -> None:
+        """304応答（変更なし）を記録"""
+        self.conn.execute(
+            "UPDATE url_state SET checked_at = ? WHERE url = ?", (self.clock(), url))
+
+    def forget(self, url: str) -> None:
+        """検証情報を破棄（取得後の処理に失敗し、次回は必ず取り直す場合）"""
+        self.conn.execute("DELETE FROM url_state WHERE url = ?", (url,))
+
+    def perfume_count(self, kind: str, url: str) -> Optional[int]:
+        """前回処理したときのブランドの香水数"""
+        row = self.conn.execute(
+            "SELECT perfume_count FROM brand_counts WHERE kind = ? AND url = ?",
+            (kind, url)).fetchone()
+        return row[0] if row else None
+
+    def record_perfume_count(self, kind: str, url: str, count: int) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO brand_counts (kind, url, perfume_count, recorded_at) "
+            "VALUES (?, ?, ?, ?)",
+            (kind, url, count, self.clock()))
+
+    def changed_brands(
+        self,
+        kind: str,
+        brands: Iterable[Dict],
+        completed: Optional[Set[str]] = None
+    ) -> List[str]:
+        """
+        一覧の香水数が前回処理時から変わったブランドのURLを返す
+        記録のないブランド（差分クロール導入前に取得済み）は現在の香水数を基準として記録する
+        completed: 完了したことのあるブランドのURL。指定時はそれ以外の基準を記録しない
+        （未完了のブランドに基準があると、初めての完了で新規レコードが0件と数えられる）
+        """
+        changed = []
+        for brand in brands:
+            stored = self.perfume_count(kind, brand['url'])
+            if stored is None:
+                if completed is None or brand['url'] in completed:
+                    self.record_perfume_count(kind, brand['url'], brand['perfume_count'])
+            elif stored != brand['perfume_count']:
+                changed.append(brand['url'])
+        return changed
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,91 @@
+# storage/file_storage.py
+import argparse
+import asyncio
+import json
+import logging
+from pathlib import Path
+from typing import Callable, Dict, Optional, Union
+
+from .base import (RECORD_FRAGRANCE_BASIC, RECORD_PERFUME, CommitCallback,
+                   RecordStorage)
+from .segment_storage import iter_record_types
+
+logger = logging.getLogger(__name__)
+
+
+def _fragrance_basic_path(root: Path, record: Dict) -> Path:
+    # スラッシュを含む名前を処理
+    safe_perfume_name = record['perfume_name'].replace('/', '_')
+    brand_name = record['brand_name']
+    return root / brand_name[0].upper() / brand_name / f"{safe_perfume_name}.json"
+
+
+def _perfume_path(root: Path, record: Dict) -> Path:
+    return root / record['brand'] / f"{record['name']}.json"
+
+
+# 従来の1香水1ファイルの配置
+FILE_LAYOUTS: Dict[str, Callable[[Path, Dict], Path]] = {
+    RECORD_FRAGRANCE_BASIC: _fragrance_basic_path,
+    RECORD_PERFUME: _perfume_path,
+}
+
+
+def write_record_file(root: Path, record_type: str, record: Dict) -> Path:
+    """レコードを従来の配置で整形済みJSONファイルに書き出す"""
+    file_path = FILE_LAYOUTS[record_type](root, record)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    return file_path
+
+
+class JsonFileStorage(RecordStorage):
+    """1レコード1ファイルで保存する互換バックエンド（書き込みはスレッドで実行）"""
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+
+    async def write(
+        self,
+        record_type: str,
+        record: Dict,
+        on_commit: Optional[CommitCallback] = None
+    ) -> None:
+        file_path = await asyncio.to_thread(write_record_file, self.root, record_type, record)
+        logger.debug(f"Saved {record_type} record to {file_path}")
+        if on_commit:
+            on_commit()
+
+    async def flush(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+def export_segments_to_files(segment_root: Union[str, Path], files_root: Union[str, Path]) -> Dict[str, int]:
+    """セグメントの全レコードを従来のファイル配置に書き出し、種別ごとの件数を返す"""
+    files_root = Path(files_root)
+    counts = {}
+    for record_type, records in iter_record_types(segment_root):
+        if record_type not in FILE_LAYOUTS:
+            logger.warning(f"No file layout for record type {record_type}, skipping")
+            continue
+        count = 0
+        for record in records:
+            write_record_file(files_root, record_type, record)
+            count += 1
+        counts[record_type] = count
+        logger.info(f"Exported {count} {record_type} records to {files_root}")
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='JSONLセグメントを従来の1香水1ファイルの配置に書き出す')
+    parser.add_argument('segment_root', help='例: data/fragrance_basic_info/segments')
+    parser.add_argument('files_root', help='例: data/fragrance_basic_info')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(export_segments_to_files(args.segment_root, args.files_root))
@@ -0,0 +1,571 @@
+# storage/frontier.py
+import asyncio
+import json
+import logging
+import math
+import os
+import socket
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from config.settings import FRONTIER_CONFIG
+
+PENDING = 'pending'
+IN_PROGRESS = 'in_progress'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEDULER_PRIORITY = 'priority'
+SCHEDULER_FIFO = 'fifo'
+
+# 期待される新規レコード数が未設定のURLの価値（1件分。価値は対数で保持する）
+DEFAULT_VALUE = math.log1p(1)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS frontier (
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_status INTEGER,
+    last_error TEXT,
+    next_eligible REAL NOT NULL DEFAULT 0,
+    payload TEXT,
+    seq INTEGER,
+    updated_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL NOT NULL DEFAULT 0,
+    value REAL NOT NULL DEFAULT %r,
+    done_at REAL,
+    successes INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    priority REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, url)
+);
+""" % DEFAULT_VALUE
+
+# 旧スキーマのファイルでは列の追加後に作成する
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_frontier_ready
+    ON frontier (kind, state, next_eligible, seq);
+CREATE INDEX IF NOT EXISTS idx_frontier_priority
+    ON frontier (kind, state, priority DESC, seq);
+"""
+
+
+@dataclass
+class FrontierEntry:
+    """フロンティア上のURLの状態"""
+    kind: str
+    url: str
+    state: str
+    attempts: int
+    last_status: Optional[int]
+    next_eligible: float
+    payload: Dict
+    # これまでに完了した回数（0なら初めての取得）
+    successes: int = 0
+
+
+# 旧スキーマのファイルに追加する列
+_ADDED_COLUMNS = (
+    ('lease_owner', 'TEXT'),
+    ('lease_expires', 'REAL NOT NULL DEFAULT 0'),
+    ('value', f'REAL NOT NULL DEFAULT {DEFAULT_VALUE!r}'),
+    ('done_at', 'REAL'),
+    ('successes', 'INTEGER NOT NULL DEFAULT 0'),
+    ('failures', 'INTEGER NOT NULL DEFAULT 0'),
+    ('priority', 'REAL NOT NULL DEFAULT 0'),
+)
+
+
+# SQLiteのWAL（共有メモリを使う）が動かないネットワークファイルシステム
+NETWORK_FILESYSTEMS = {
+    'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', '9p', 'ceph', 'glusterfs',
+    'fuse.glusterfs', 'fuse.sshfs', 'lustre', 'afs',
+}
+JOURNAL_AUTO = 'auto'
+
+
+def filesystem_type(path: Union[str, Path]) -> Optional[str]:
+    """pathを含むマウントのファイルシステム種別（/proc/mountsのないOSではNone）"""
+    try:
+        with open('/proc/mounts', 'r', encoding='utf-8') as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return None
+    resolved = str(Path(path).resolve())
+    best = None
+    for mount_point, fstype in mounts:
+        mount_point = mount_point.replace('\\040', ' ')
+        if resolved == mount_point or resolved.startswith(mount_point.rstrip('/') + '/'):
+            if best is None or len(mount_point) > len(best[0]):
+                best = (mount_point, fstype)
+    return best[1] if best else None
+
+
+def journal_mode_for(path: Union[str, Path], mode: str = JOURNAL_AUTO) -> str:
+    """'auto'ならネットワークファイルシステム上はDELETE、それ以外はWAL"""
+    if mode != JOURNAL_AUTO:
+        return mode
+    return 'DELETE' if filesystem_type(Path(path).parent) in NETWORK_FILESYSTEMS else 'WAL'
+
+
+def open_shared_db(path: Union[str, Path], mode: str = JOURNAL_AUTO) -> sqlite3.Connection:
+    """フロンティアのファイルを開き、置き場所に合ったジャーナルモードを設定する"""
+    journal_mode = journal_mode_for(path, mode)
+    # 同じホストの複数コンテナから同じファイルを使う場合に備えてロック待ちを許容
+    conn = sqlite3.connect(str(path), isolation_level=None, timeout=30)
+    conn.execute(f'PRAGMA journal_mode={journal_mode}')
+    # WAL以外ではNORMALだと電源断でコミット済みのトランザクションを失いうる
+    conn.execute(f"PRAGMA synchronous={'NORMAL' if journal_mode.upper() == 'WAL' else 'FULL'}")
+    return conn
+
+
+def default_owner() -> str:
+    """リースの所有者（ホスト名:PID。コンテナごとにホスト名が異なる）"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_alive(owner: str) -> bool:
+    """同じホストの所有者ならプロセスの生存を確認（他ホストは不明のためTrue）"""
+    host, _, pid = owner.rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    if int(pid) == os.getpid():
+        # 再起動前の自分（コンテナのPIDは再起動後も同じになりやすい）
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class CrawlFrontier:
+    """
+    SQLiteによる永続的なクロールフロンティア
+    URLごとに状態・試行回数・最終ステータス・次回実行可能時刻を保持し、
+    クラッシュ後も処理中だったURLから数秒で再開できる
+
+    同じホスト上の複数のコンテナ（同じボリュームをマウント）から同じファイルを使える
+    取り出したURLには期限付きのリースを付け、ハートビートで延長する
+    期限切れのリース（停止したワーカーの分）は他のワーカーが奪って処理する
+    複数ノードでの共有には対応しない。WALは同じホストの共有メモリを前提とし、
+    NFS等のネットワークファイルシステムではSQLiteのロック自体が信頼できない
+    ネットワークボリューム上ではjournal_mode=DELETEに切り替えるが、それでも使うのは1ホストからに限る
+
+    scheduler='priority'ではURLごとの点数の高い順に取り出す
+      点数 = (価値 + staleness_weight × 鮮度切れ度) × (1 - failure_weight × 失敗率)
+             + aging_per_hour × 待ち時間（時間）
+      価値: 期待される新規レコード数（set_valuesで設定、log(1+件数)で保持）
+      鮮度切れ度: 未取得なら1、取得済みなら前回完了からの経過時間/staleness_horizon（上限1）
+      失敗率: failures / (failures + successes + 1)
+    待ち時間による加点で、価値の低いURLもいずれ価値の高いURLを追い越す
+    点数は追加・失敗・返却・未処理へ戻す際に計算してpriority列に保持し、索引順に取り出す
+    （待ち時間の加点は実行可能になった時刻を引いて表す。現在時刻の項は全URLに共通で順序に影響しない）
+    鮮度切れ度はその時点の値で固定する
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        config: Optional[Dict] = None,
+        clock: Callable[[], float] = time.time
+    ):
+        self.config = {**FRONTIER_CONFIG, **(config or {})}
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = self.config['max_attempts']
+        self.base_backoff = self.config['base_backoff']
+        self.max_backoff = self.config['max_backoff']
+        self.lease_ttl = self.config['lease_ttl']
+        self.heartbeat_interval = self.config['heartbeat_interval']
+        self.owner = self.config['owner'] or default_owner()
+        self.scheduler = self.config['scheduler']
+        if self.scheduler not in (SCHEDULER_PRIORITY, SCHEDULER_FIFO):
+            raise ValueError(f"Unknown frontier scheduler: {self.scheduler}")
+        self.clock = clock
+        self.logger = logging.getLogger(__name__)
+        # このインスタンスが保持しているリース
+        self._held: Set[Tuple[str, str]] = set()
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self.stolen = 0
+        self.conn = open_shared_db(self.path, self.config['journal_mode'])
+        self.conn.executescript(_SCHEMA)
+        self._migrate()
+        self.conn.executescript(_INDEXES)
+        self.recover()
+
+    def _migrate(self) -> None:
+        """後から追加した列のない旧スキーマのファイルに列を追加"""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(frontier)")}
+        for name, definition in _ADDED_COLUMNS:
+            if name in columns:
+                continue
+            try:
+                self.conn.execute(f"ALTER TABLE frontier ADD COLUMN {name} {definition}")
+            except sqlite3.OperationalError:
+                # 他のコンテナが同時に追加した
+                continue
+            if name == 'successes':
+                # 列の追加前に完了していたURLも完了済みとして扱う
+                self.conn.execute(
+                    "UPDATE frontier SET successes = 1 WHERE state = ?", (DONE,))
+            if name == 'priority':
+                self.reprioritize()
+
+    def recover(self) -> int:
+        """
+        前回の実行で処理中のまま残ったURLを未処理に戻す
+        戻すのは所有者のいないものと、同じホストの終了済みプロセス（再起動前の自分を含む）のものだけ
+        他のワーカーが処理中のURLはリースが切れるまで奪わない
+        """
+        owners = [row[0] for row in self.conn.execute(
+            "SELECT DISTINCT lease_owner FROM frontier WHERE state = ?", (IN_PROGRESS,))]
+        dead = [owner for owner in owners if owner is None or not _owner_alive(owner)]
+        now = self.clock()
+        recovered = 0
+        with self._transaction():
+            for owner in dead:
+                cursor = self.conn.execute(
+                    "UPDATE frontier SET state = ?, lease_owner = NULL, lease_expires = 0, "
+                    "updated_at = ? WHERE state = ? AND lease_owner IS ?",
+                    (PENDING, now, IN_PROGRESS, owner))
+                recovered += cursor.rowcount
+            if recovered:
+                # 今戻した行（updated_atが今回の時刻）
+                self._reprioritize("state = ? AND updated_at = ?", (PENDING, now), now)
+        return recovered
+
+    def enqueue(self, kind: str, url: str, payload: Optional[Dict] = None) -> bool:
+        """URLを追加（既存の場合は何もしない）。追加された場合True"""
+        return self.enqueue_many(kind, [(url, payload)]) == 1
+
+    def enqueue_many(self, kind: str, items: Iterable[Tuple[str, Optional[Dict]]]) -> int:
+        """複数URLを1トランザクションで追加し、追加件数を返す"""
+        return len(self.enqueue_new(kind, items))
+
+    def enqueue_new(self, kind: str, items: Iterable[Tuple[str, Optional[Dict]]]) -> List[str]:
+        """複数URLを1トランザクションで追加し、新たに追加されたURLを返す（登録済みのURLは除く）"""
+        now = self.clock()
+        # 未取得・失敗なし・既定の価値のURLの点数
+        priority = DEFAULT_VALUE + self.config['staleness_weight'] - self._aging(now)
+        with self._transaction():
+            seq = self._next_seq(kind)
+            added = []
+            for url, payload in items:
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO frontier "
+                    "(kind, url, state, payload, seq, updated_at, priority) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (kind, url, PENDING, json.dumps(payload or {}, ensure_ascii=False),
+                     seq, now, priority))
+                if cursor.rowcount:
+                    added.append(url)
+                    seq += 1
+        return added
+
+    def set_values(self, kind: str, values: Iterable[Tuple[str, float]]) -> int:
+        """URLごとの期待される新規レコード数を設定し、更新件数を返す"""
+        values = [(math.log1p(max(0.0, expected)), url) for url, expected in values]
+        now = self.clock()
+        with self._transaction():
+            cursor = self.conn.executemany(
+                "UPDATE frontier SET value = ? WHERE kind = ? AND url = ?",
+                [(value, kind, url) for value, url in values])
+            updated = cursor.rowcount
+            self._reprioritize_urls(kind, [url for _, url in values], now)
+        return updated
+
+    def _aging(self, eligible_at: float) -> float:
+        """待ち時間の加点のうち、実行可能になった時刻で決まる部分（点数から引く）"""
+        return self.config['aging_per_hour'] * eligible_at / 3600.0
+
+    def _reprioritize(self, where: str, params: Tuple, now: float) -> None:
+        """条件に合う行の点数を現在の列の値で計算し直す"""
+        self.conn.execute(
+            "UPDATE frontier SET priority = "
+            "(value + ? * CASE WHEN done_at IS NULL THEN 1.0 "
+            "ELSE MIN(1.0, (? - done_at) / ?) END) "
+            "* (1.0 - ? * failures / (failures + successes + 1.0)) "
+            f"- ? * MAX(updated_at, next_eligible) / 3600.0 WHERE {where}",
+            (self.config['staleness_weight'], now, self.config['staleness_horizon'],
+             self.config['failure_weight'], self.config['aging_per_hour'], *params))
+
+    def _reprioritize_urls(self, kind: str, urls: Iterable[str], now: float) -> None:
+        for url in urls:
+            self._reprioritize("kind = ? AND url = ?", (kind, url), now)
+
+    def reprioritize(self, kind: Optional[str] = None) -> None:
+        """未処理のURLの点数を全て計算し直す（重みの設定を変えた場合）"""
+        now = self.clock()
+        with self._transaction():
+            self._reprioritize(
+                "state = ? AND (? IS NULL OR kind = ?)", (PENDING, kind, kind), now)
+
+    def dequeue(self, kind: str, limit: int = 1) -> List[FrontierEntry]:
+        """
+        実行可能なURLを点数の高い順（fifoなら追加順）に取り出し、リースを付けて処理中にする
+        他のワーカーのリースが期限切れの処理中URLも取り出す（停止したワーカーからの奪取）
+        """
+        now = self.clock()
+        with self._transaction():
+            # 奪われ続けるURL（ワーカーを落とすページ等）は上限で打ち切る
+            self.conn.execute(
+                "UPDATE frontier SET state = ?, last_error = ?, lease_owner = NULL, "
+                "failures = failures + 1, updated_at = ? WHERE kind = ? AND state = ? AND lease_expires <= ? AND lease_owner IS NOT ? "
+                "AND attempts >= ?",
+                (FAILED, 'lease expired', now, kind, IN_PROGRESS, now, self.owner,
+                 self.max_attempts))
+            # 奪えるリース（停止したワーカーの分）を先に取り出す。処理中のURLは少ない
+            rows = self.conn.execute(
+                "SELECT kind, url, state, attempts, last_status, next_eligible, payload, successes "
+                "FROM frontier WHERE kind = ? AND state = ? AND lease_expires <= ? "
+                "AND lease_owner IS NOT ? ORDER BY seq LIMIT ?",
+                (kind, IN_PROGRESS, now, self.owner, limit)).fetchall()
+            if len(rows) < limit:
+                # 点数順は索引を順に走査し、全件を並べ替えない（バックオフ中の行は読み飛ばす）
+                if self.scheduler == SCHEDULER_PRIORITY:
+                    source, order_by = 'frontier INDEXED BY idx_frontier_priority', 'priority DESC, seq'
+                else:
+                    source, order_by = 'frontier', 'seq'
+                rows += self.conn.execute(
+                    "SELECT kind, url, state, attempts, last_status, next_eligible, payload, successes "
+                    f"FROM {source} WHERE kind = ? AND state = ? AND next_eligible <= ? "
+                    f"ORDER BY {order_by} LIMIT ?",
+                    (kind, PENDING, now, limit - len(rows))).fetchall()
+            self.conn.executemany(
+                "UPDATE frontier SET state = ?, attempts = attempts + 1, lease_owner = ?, "
+                "lease_expires = ?, updated_at = ? WHERE kind = ? AND url = ?",
+                [(IN_PROGRESS, self.owner, now + self.lease_ttl, now, kind, row[1])
+                 for row in rows])
+        stolen = sum(1 for row in rows if row[2] == IN_PROGRESS)
+        if stolen:
+            self.stolen += stolen
+            self.logger.info(f"Took over {stolen} expired leases of {kind}")
+        self._held.update((kind, row[1]) for row in rows)
+        return [
+            FrontierEntry(kind=row[0], url=row[1], state=IN_PROGRESS, attempts=row[3] + 1,
+                          last_status=row[4], next_eligible=row[5],
+                          payload=json.loads(row[6] or '{}'), successes=row[7])
+            for row in rows
+        ]
+
+    def mark_done(self, kind: str, url: str, status: Optional[int] = 200) -> None:
+        """処理完了として記録（リースを奪われた後でも結果は保存済みのため記録する）"""
+        self._held.discard((kind, url))
+        now = self.clock()
+        self.conn.execute(
+            "UPDATE frontier SET state = ?, last_status = ?, last_error = NULL, "
+            "lease_owner = NULL, successes = successes + 1, done_at = ?, updated_at = ? "
+            "WHERE kind = ? AND url = ?",
+            (DONE, status, now, now, kind, url))
+
+    def mark_failed(
+        self,
+        kind: str,
+        url: str,
+        status: Optional[int] = None,
+        error: Optional[str] = None
+    ) -> str:
+        """
+        失敗を記録し、上限内なら指数バックオフで再実行予約。新しい状態を返す
+        リースを他のワーカーに奪われていれば、そちらの処理を優先して何もしない
+        """
+        self._held.discard((kind, url))
+        row = self.conn.execute(
+            "SELECT attempts, state, lease_owner FROM frontier WHERE kind = ? AND url = ?",
+            (kind, url)).fetchone()
+        if row and row[1] == IN_PROGRESS and row[2] not in (None, self.owner):
+            return row[1]
+        attempts = row[0] if row else self.max_attempts
+        now = self.clock()
+        if attempts >= self.max_attempts:
+            state, next_eligible = FAILED, now
+        else:
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1))
+            state, next_eligible = PENDING, now + backoff
+        self.conn.execute(
+            "UPDATE frontier SET state = ?, last_status = ?, last_error = ?, "
+            "next_eligible = ?, lease_owner = NULL, failures = failures + 1, updated_at = ? "
+            "WHERE kind = ? AND url = ?",
+            (state, status, error, next_eligible, now, kind, url))
+        if state == PENDING:
+            self._reprioritize_urls(kind, [url], now)
+        return state
+
+    def release(self, kind: str, url: str) -> None:
+        """処理せずに未処理へ戻す（試行回数は戻す）"""
+        self._held.discard((kind, url))
+        now = self.clock()
+        cursor = self.conn.execute(
+            "UPDATE frontier SET state = ?, attempts = MAX(attempts - 1, 0), lease_owner = NULL, "
+            "lease_expires = 0, updated_at = ? WHERE kind = ? AND url = ? AND state = ? "
+            "AND lease_owner IS ?",
+            (PENDING, now, kind, url, IN_PROGRESS, self.owner))
+        if cursor.rowcount:
+            self._reprioritize_urls(kind, [url], now)
+
+    def heartbeat(self) -> int:
+        """保持中のリースを延長し、延長できた件数を返す（奪われたリースは保持から外す）"""
+        if not self._held:
+            return 0
+        now = self.clock()
+        lost = []
+        with self._transaction():
+            for kind, url in list(self._held):
+                cursor = self.conn.execute(
+                    "UPDATE frontier SET lease_expires = ? WHERE kind = ? AND url = ? "
+                    "AND state = ? AND lease_owner = ?",
+                    (now + self.lease_ttl, kind, url, IN_PROGRESS, self.owner))
+                if not cursor.rowcount:
+                    lost.append((kind, url))
+        if lost:
+            self.logger.warning(f"Lost {len(lost)} leases to other workers")
+            self._held.difference_update(lost)
+        return len(self._held)
+
+    def start_heartbeat(self) -> None:
+        """リースを定期的に延長するタスクを起動（イベントループ内で呼ぶ）"""
+        if self._heartbeat_task is None:
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                self.heartbeat()
+            except sqlite3.Error as e:
+                # ロック待ちの超過等。次の周期で再試行（リース期限はハートビート間隔より長い）
+                self.logger.error(f"Lease heartbeat failed: {e}")
+
+    def is_done(self, kind: str, url: str) -> bool:
+        row = self.conn.execute(
+            "SELECT state FROM frontier WHERE kind = ? AND url = ?", (kind, url)).fetchone()
+        return bool(row) and row[0] == DONE
+
+    def completed(self, kind: str, urls: Iterable[str]) -> Set[str]:
+        """urlsのうち一度でも完了したことのあるもの（再取得のため未処理に戻したものを含む）"""
+        urls = list(urls)
+        completed = set()
+        # SQLiteのパラメータ数の上限を超えないよう分割
+        for start in range(0, len(urls), 500):
+            chunk = urls[start:start + 500]
+            completed.update(row[0] for row in self.conn.execute(
+                f"SELECT url FROM frontier WHERE kind = ? AND successes > 0 "
+                f"AND url IN ({','.join('?' * len(chunk))})", (kind, *chunk)))
+        return completed
+
+    def urls(self, kind: str) -> Set[str]:
+        """登録済みのURL一覧"""
+        return {row[0] for row in self.conn.execute(
+            "SELECT url FROM frontier WHERE kind = ?", (kind,))}
+
+    def payloads(self, kind: str, state: Optional[str] = None) -> List[Tuple[str, Dict]]:
+        """登録済みの(URL, ペイロード)一覧（stateを指定するとその状態のもののみ）"""
+        rows = self.conn.execute(
+            "SELECT url, payload FROM frontier WHERE kind = ? AND (? IS NULL OR state = ?)",
+            (kind, state, state)).fetchall()
+        return [(url, json.loads(payload or '{}')) for url, payload in rows]
+
+    def counts(self, kind: str) -> Dict[str, int]:
+        """状態ごとの件数"""
+        return dict(self.conn.execute(
+            "SELECT state, COUNT(*) FROM frontier WHERE kind = ? GROUP BY state",
+            (kind,)).fetchall())
+
+    def next_eligible_delay(self, kinds: Sequence[str]) -> Optional[float]:
+        """
+        未処理URLが次に実行可能になるまでの秒数
+        他のワーカーが処理中のURLは、リースが切れて奪える時刻までの秒数として含める
+        （そのワーカーが停止していても取りこぼさない）
+        未処理も他のワーカーの処理中もなければNone
+        """
+        placeholders = ','.join('?' * len(kinds))
+        row = self.conn.execute(
+            f"SELECT MIN(CASE WHEN state = ? THEN next_eligible ELSE lease_expires END) "
+            f"FROM frontier WHERE kind IN ({placeholders}) "
+            f"AND (state = ? OR (state = ? AND lease_owner IS NOT ?))",
+            (PENDING, *kinds, PENDING, IN_PROGRESS, self.owner)).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - self.clock())
+
+    def reset(self, kind: str) -> None:
+        """指定種別を全て未処理に戻す（全件を再取得する場合）"""
+        now = self.clock()
+        with self._transaction():
+            self.conn.execute(
+                "UPDATE frontier SET state = ?, attempts = 0, next_eligible = 0, "
+                "lease_owner = NULL, updated_at = ? WHERE kind = ?",
+                (PENDING, now, kind))
+            self._reprioritize("kind = ?", (kind,), now)
+
+    def requeue(self, kind: str, urls: Iterable[str]) -> int:
+        """完了・失敗済みのURLを未処理に戻し（差分クロールで変更があったもの）、件数を返す"""
+        now = self.clock()
+        urls = list(urls)
+        with self._transaction():
+            cursor = self.conn.executemany(
+                "UPDATE frontier SET state = ?, attempts = 0, next_eligible = 0, updated_at = ? "
+                "WHERE kind = ? AND url = ? AND state IN (?, ?)",
+                [(PENDING, now, kind, url, DONE, FAILED) for url in urls])
+            requeued = cursor.rowcount
+            self._reprioritize_urls(kind, urls, now)
+        return requeued
+
+    def requeue_stale(self, kind: str, max_age: float) -> int:
+        """完了からmax_age秒を超えたURLを未処理に戻し、件数を返す"""
+        now = self.clock()
+        with self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE frontier SET state = ?, attempts = 0, next_eligible = 0, updated_at = ? "
+                "WHERE kind = ? AND state = ? AND updated_at < ?",
+                (PENDING, now, kind, DONE, now - max_age))
+            requeued = cursor.rowcount
+            if requeued:
+                # 今戻した行（updated_atが今回の時刻）
+                self._reprioritize(
+                    "kind = ? AND state = ? AND updated_at = ?", (kind, PENDING, now), now)
+        return requeued
+
+    def close(self) -> None:
+        """ハートビートを止め、処理しなかったリースを他のワーカーのために返却"""
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        for kind, url in list(self._held):
+            try:
+                self.release(kind, url)
+            except sqlite3.Error as e:
+                self.logger.error(f"Failed to release lease for {url}: {e}")
+        self.conn.close()
+
+    def _next_seq(self, kind: str) -> int:
+        row = self.conn.execute(
+            "SELECT MAX(seq) FROM frontier WHERE kind = ?", (kind,)).fetchone()
+        return (row[0] or 0) + 1
+
+    def _transaction(self):
+        return _Transaction(self.conn)
+
+
+class _Transaction:
+    """自動コミットモードの接続で明示的にトランザクションを張る"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
@@ -0,0 +1,294 @@
+# storage/html_archive.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+from config.settings import ARCHIVE_CONFIG
+
+try:
+    import zstandard
+except ImportError:  # zstdがなければzlibで圧縮
+    zstandard = None
+
+CODEC_ZSTD = 'zstd'
+CODEC_ZLIB = 'zlib'
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    raw_size INTEGER NOT NULL,
+    codec TEXT NOT NULL,
+    dict_id INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS captures (
+    url TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    digest TEXT NOT NULL REFERENCES blobs (digest),
+    status INTEGER,
+    meta TEXT,
+    PRIMARY KEY (url, fetched_at)
+);
+CREATE INDEX IF NOT EXISTS idx_captures_digest ON captures (digest);
+CREATE TABLE IF NOT EXISTS dictionaries (
+    dict_id INTEGER PRIMARY KEY,
+    data BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class HtmlArchive:
+    """
+    取得したHTMLをコンテンツアドレス（SHA-256）で保存するアーカイブ
+    本文はWARC風の追記専用セグメントに圧縮して格納し、URL→ダイジェストの索引はSQLiteに持つ
+    同じ内容のページは本文を再格納せず取得記録のみ追加する
+    zstdが使える場合はページ間で共通の定型部分から辞書を学習して圧縮率を上げる
+    """
+
+    def __init__(self, root: Union[str, Path], config: Optional[Dict] = None):
+        self.config = {**ARCHIVE_CONFIG, **(config or {})}
+        self.root = Path(root)
+        self.segment_dir = self.root / 'segments'
+        self.segment_dir.mkdir(parents=True, exist_ok=True)
+        self.codec = CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+        # タスクからはasyncio.to_threadで呼ばれるためロックで直列化
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            str(self.root / 'index.sqlite3'),
+            isolation_level=None, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_SCHEMA)
+
+        self._segment_prefix = f"{datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}"
+        self._segment_sequence = 0
+        self._segment: Optional[BinaryIO] = None
+        self._segment_name: Optional[str] = None
+        self._readers: Dict[str, BinaryIO] = {}
+
+        self._dictionaries: Dict[int, 'zstandard.ZstdCompressionDict'] = {}
+        self._dict_id = self._load_latest_dictionary()
+        self._training_samples: List[bytes] = []
+
+        # 統計
+        self.pages_seen = 0
+        self.pages_deduplicated = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    # 書き込み
+
+    def put(
+        self,
+        url: str,
+        html: str,
+        status: Optional[int] = 200,
+        meta: Optional[Dict] = None
+    ) -> Tuple[str, bool]:
+        """ページを保存し、(ダイジェスト, 本文を新規格納したか)を返す"""
+        raw = html.encode('utf-8')
+        digest = hashlib.sha256(raw).hexdigest()
+        with self._lock:
+            self.pages_seen += 1
+            self.raw_bytes += len(raw)
+            exists = self.conn.execute(
+                "SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if exists:
+                self.pages_deduplicated += 1
+            else:
+                self._store_blob(digest, raw)
+                self._collect_training_sample(raw)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO captures (url, fetched_at, digest, status, meta) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (url, time.time(), digest, status,
+                 json.dumps(meta, ensure_ascii=False) if meta else None))
+        return digest, not exists
+
+    def _store_blob(self, digest: str, raw: bytes) -> None:
+        codec, dict_id, payload = self._compress(raw)
+        segment = self._current_segment()
+        header = json.dumps({
+            'digest': digest, 'codec': codec, 'dict_id': dict_id,
+            'length': len(payload), 'raw_size': len(raw),
+        }).encode('utf-8') + b'\n'
+        segment.write(header)
+        offset = segment.tell()
+        segment.write(payload + b'\n')
+        segment.flush()
+        self.stored_bytes += len(header) + len(payload) + 1
+        self.conn.execute(
+            "INSERT INTO blobs (digest, segment, offset, length, raw_size, codec, dict_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (digest, self._segment_name, offset, len(payload), len(raw), codec, dict_id))
+
+    def _current_segment(self) -> BinaryIO:
+        if self._segment is None or self._segment.tell() >= self.config['segment_max_bytes']:
+            if self._segment:
+                self._segment.close()
+            self._segment_sequence += 1
+            self._segment_name = f"archive-{self._segment_prefix}-{self._segment_sequence:04d}.blobs"
+            self._segment = open(self.segment_dir / self._segment_name, 'ab')
+        return self._segment
+
+    # 圧縮
+
+    def _compress(self, raw: bytes) -> Tuple[str, int, bytes]:
+        level = self.config['compression_level']
+        if self.codec == CODEC_ZSTD:
+            dictionary = self._dictionaries.get(self._dict_id)
+            compressor = zstandard.ZstdCompressor(level=level, dict_data=dictionary) \
+                if dictionary else zstandard.ZstdCompressor(level=level)
+            return CODEC_ZSTD, self._dict_id if dictionary else 0, compressor.compress(raw)
+        return CODEC_ZLIB, 0, zlib.compress(raw, min(level, 9))
+
+    def _decompress(self, codec: str, dict_id: int, payload: bytes) -> bytes:
+        if codec == CODEC_ZLIB:
+            return zlib.decompress(payload)
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed archive entries")
+        dictionary = self._get_dictionary(dict_id) if dict_id else None
+        decompressor = zstandard.ZstdDecompressor(dict_data=dictionary) \
+            if dictionary else zstandard.ZstdDecompressor()
+        return decompressor.decompress(payload)
+
+    def _collect_training_sample(self, raw: bytes) -> None:
+        """辞書が未学習なら定型部分（先頭・末尾）を集めて一定数で学習"""
+        if self.codec != CODEC_ZSTD or self._dict_id:
+            return
+        sample_bytes = self.config['dict_sample_bytes']
+        self._training_samples.append(raw[:sample_bytes] + raw[-sample_bytes:])
+        if len(self._training_samples) < self.config['dict_training_samples']:
+            return
+        try:
+            dictionary = zstandard.train_dictionary(
+                self.config['dict_size'], self._training_samples)
+        except zstandard.ZstdError as e:
+            logger.warning(f"Failed to train zstd dictionary: {e}")
+            self._training_samples.clear()
+            return
+        cursor = self.conn.execute(
+            "INSERT INTO dictionaries (data, created_at) VALUES (?, ?)",
+            (dictionary.as_bytes(), time.time()))
+        self._dict_id = cursor.lastrowid
+        self._dictionaries[self._dict_id] = dictionary
+        self._training_samples.clear()
+        logger.info(f"Trained zstd dictionary {self._dict_id} ({len(dictionary.as_bytes())} bytes)")
+
+    def _load_latest_dictionary(self) -> int:
+        if self.codec != CODEC_ZSTD:
+            return 0
+        row = self.conn.execute(
+            "SELECT dict_id FROM dictionaries ORDER BY dict_id DESC LIMIT 1").fetchone()
+        if not row:
+            return 0
+        self._get_dictionary(row[0])
+        return row[0]
+
+    def _get_dictionary(self, dict_id: int) -> 'zstandard.ZstdCompressionDict':
+        if dict_id not in self._dictionaries:
+            row = self.conn.execute(
+                "SELECT data FROM dictionaries WHERE dict_id = ?", (dict_id,)).fetchone()
+            if not row:
+                raise KeyError(f"Unknown archive dictionary: {dict_id}")
+            self._dictionaries[dict_id] = zstandard.ZstdCompressionDict(row[0])
+        return self._dictionaries[dict_id]
+
+    # 読み出し
+
+    def get(self, digest: str) -> Optional[str]:
+        """ダイジェストから本文を取得"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT segment, offset, length, codec, dict_id FROM blobs WHERE digest = ?",
+                (digest,)).fetchone()
+            if not row:
+                return None
+            segment, offset, length, codec, dict_id = row
+            if self._segment and segment == self._segment_name:
+                self._segment.flush()
+            reader = self._readers.get(segment)
+            if reader is None:
+                reader = open(self.segment_dir / segment, 'rb')
+                self._readers[segment] = reader
+            reader.seek(offset)
+            payload = reader.read(length)
+            return self._decompress(codec, dict_id, payload).decode('utf-8')
+
+    def latest_digest(self, url: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT digest FROM captures WHERE url = ? ORDER BY fetched_at DESC LIMIT 1",
+                (url,)).fetchone()
+        return row[0] if row else None
+
+    def get_latest(self, url: str) -> Optional[str]:
+        """URLの最新の本文を取得"""
+        digest = self.latest_digest(url)
+        return self.get(digest) if digest else None
+
+    def iter_latest(self, url_prefix: str = '') -> Iterator[Tuple[str, Dict, str]]:
+        """URLごとの最新の取得記録を(url, meta, html)で列挙"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT url, digest, meta, MAX(fetched_at) FROM captures "
+                "WHERE url LIKE ? AND status = 200 GROUP BY url ORDER BY url",
+                (url_prefix + '%',)).fetchall()
+        for url, digest, meta, _ in rows:
+            html = self.get(digest)
+            if html is not None:
+                yield url, json.loads(meta) if meta else {}, html
+
+    def get_stats(self) -> Dict:
+        return {
+            'pages_seen': self.pages_seen,
+            'pages_deduplicated': self.pages_deduplicated,
+            'raw_bytes': self.raw_bytes,
+            'stored_bytes': self.stored_bytes,
+            'codec': self.codec,
+            'dict_id': self._dict_id,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._segment:
+                self._segment.flush()
+                os.fsync(self._segment.fileno())
+                self._segment.close()
+                self._segment = None
+            for reader in self._readers.values():
+                reader.close()
+            self._readers.clear()
+            self.conn.close()
+        logger.info(f"HTML archive closed: {self.get_stats()}")
+
+
+async def archive_page(
+    archive: Optional[HtmlArchive],
+    url: str,
+    html: str,
+    status: Optional[int] = 200,
+    meta: Optional[Dict] = None
+) -> None:
+    """イベントループ外でページをアーカイブ（失敗してもスクレイピングは止めない）"""
+    if archive is None:
+        return
+    try:
+        await asyncio.to_thread(archive.put, url, html, status, meta)
+    except Exception as e:
+        logger.error(f"Error archiving {url}: {e}")
@@ -1,10 +1,13 @@
 import json
+import logging
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional
 
 from config.settings import OUTPUT_DIR
 from models.brand import Brand
 
+logger = logging.getLogger(__name__)
+
 
 class JsonStorage:
     @staticmethod
@@ -20,4 +23,19 @@ class JsonStorage:
                 ensure_ascii=False,
                 indent=2
             )
-        print(f"Saved brands for letter {letter} to {filename}")
+        logger.info(f"Saved brands for letter {letter} to {filename}")
+
+    @staticmethod
+    def save_brands_by_letter(brands_by_letter: Dict[str, List[Brand]]) -> None:
+        """複数文字のブランド情報をまとめて保存"""
+        for letter, brands in brands_by_letter.items():
+            JsonStorage.save_brands(brands, letter)
+
+    @staticmethod
+    def load_brands(letter: str) -> Optional[List[Brand]]:
+        """保存済みのブランド情報を読み込む（未保存ならNone）"""
+        filename = OUTPUT_DIR / f'fragrantica_brands_{letter}.json'
+        if not filename.exists():
+            return None
+        with open(filename, 'r', encoding='utf-8') as f:
+            return [Brand.from_dict(data) for data in json.load(f)]
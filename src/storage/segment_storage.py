@@ -0,0 +1,197 @@
+# storage/segment_storage.py
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+from .base import BufferedRecordStorage
+
+try:
+    import zstandard
+except ImportError:  # zstd圧縮は任意
+    zstandard = None
+
+COMPRESSION_NONE = 'none'
+COMPRESSION_ZSTD = 'zstd'
+
+FSYNC_ALWAYS = 'always'      # グループコミットごと
+FSYNC_INTERVAL = 'interval'  # fsync_interval秒に1回まで
+FSYNC_NEVER = 'never'        # OSに任せる（クローズ時のみ）
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER)
+
+SEGMENT_SUFFIXES = {COMPRESSION_NONE: '.jsonl', COMPRESSION_ZSTD: '.jsonl.zst'}
+
+logger = logging.getLogger(__name__)
+
+
+class _SegmentWriter:
+    """
+    レコード種別ごとの追記専用セグメントファイル
+    プロセスごとに新しいセグメントを作り、既存ファイルには追記しない
+    """
+
+    def __init__(self, directory: Path, record_type: str, compression: str, max_bytes: int):
+        self.directory = directory
+        self.record_type = record_type
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.prefix = f"{record_type}-{datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}"
+        self.sequence = 0
+        self.file: Optional[BinaryIO] = None
+        self.size = 0
+        self.compressor = zstandard.ZstdCompressor() if compression == COMPRESSION_ZSTD else None
+
+    def append(self, lines: List[bytes]) -> int:
+        """行をまとめて追記し、書き込んだバイト数を返す"""
+        if self.file is None or self.size >= self.max_bytes:
+            self._rotate()
+        data = b''.join(lines)
+        if self.compressor:
+            # コミットごとに独立したフレームにする（連結しても有効なzstdストリーム）
+            data = self.compressor.compress(data)
+        self.file.write(data)
+        self.file.flush()
+        self.size += len(data)
+        return len(data)
+
+    def fsync(self) -> None:
+        if self.file:
+            os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        if self.file:
+            self.fsync()
+            self.file.close()
+            self.file = None
+
+    def _rotate(self) -> None:
+        self.close()
+        self.sequence += 1
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / \
+            f"{self.prefix}-{self.sequence:04d}{SEGMENT_SUFFIXES[self.compression]}"
+        self.file = open(path, 'ab')
+        self.size = 0
+        logger.info(f"Opened segment {path}")
+
+
+class SegmentStorage(BufferedRecordStorage):
+    """
+    バッファリングしたレコードをJSONLセグメントにまとめて書き出す保存先
+    一定件数・一定サイズ・一定時間のいずれかでグループコミットし、
+    ファイル書き込みとfsyncはイベントループ外のスレッドで行う
+    """
+
+    def __init__(self, root: Union[str, Path], config: Optional[Dict] = None):
+        super().__init__(config)
+        self.root = Path(root)
+        self.compression = self.config['compression']
+        if self.compression == COMPRESSION_ZSTD and zstandard is None:
+            logger.warning("zstandard is not installed, writing uncompressed segments")
+            self.compression = COMPRESSION_NONE
+        if self.compression not in SEGMENT_SUFFIXES:
+            raise ValueError(f"Unknown compression: {self.compression}")
+        if self.config['fsync'] not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {self.config['fsync']}")
+
+        self._writers: Dict[str, _SegmentWriter] = {}
+        self._last_fsync = time.monotonic()
+        self.bytes_written = 0
+
+    def get_stats(self) -> Dict:
+        return {
+            **super().get_stats(),
+            'bytes_written': self.bytes_written,
+            'compression': self.compression,
+        }
+
+    def _prepare(self, record_type: str, record: Dict) -> Tuple[bytes, int]:
+        line = json.dumps(record, ensure_ascii=False,
+                          separators=(',', ':')).encode('utf-8') + b'\n'
+        return line, len(line)
+
+    def _commit(self, batches: Dict[str, List[bytes]]) -> None:
+        for record_type, lines in batches.items():
+            writer = self._writers.get(record_type)
+            if writer is None:
+                writer = _SegmentWriter(
+                    self.root / record_type,
+                    record_type,
+                    self.compression,
+                    self.config['segment_max_bytes'])
+                self._writers[record_type] = writer
+            self.bytes_written += writer.append(lines)
+
+        policy = self.config['fsync']
+        now = time.monotonic()
+        if policy == FSYNC_ALWAYS or (
+                policy == FSYNC_INTERVAL
+                and now - self._last_fsync >= self.config['fsync_interval']):
+            for record_type in batches:
+                self._writers[record_type].fsync()
+            self._last_fsync = now
+
+    def _close_resources(self) -> None:
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+
+
+def segment_paths(root: Union[str, Path], record_type: str) -> List[Path]:
+    """レコード種別のセグメントを作成順に列挙"""
+    directory = Path(root) / record_type
+    if not directory.exists():
+        return []
+    return sorted(
+        path for path in directory.iterdir()
+        if path.name.endswith(tuple(SEGMENT_SUFFIXES.values())))
+
+
+def _open_segment(path: Path) -> BinaryIO:
+    if path.name.endswith(SEGMENT_SUFFIXES[COMPRESSION_ZSTD]):
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        return zstandard.ZstdDecompressor().stream_reader(
+            open(path, 'rb'), read_across_frames=True, closefd=True)
+    return open(path, 'rb')
+
+
+def iter_segment_records(path: Path) -> Iterator[Dict]:
+    """
+    1セグメントのレコードを順に読み出す
+    書き込み途中で止まった末尾の不完全な行は読み飛ばす
+    """
+    with _open_segment(path) as raw:
+        pending = b''
+        while True:
+            chunk = raw.read(1 << 20)
+            if not chunk:
+                break
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                if line:
+                    yield json.loads(line)
+        if pending:
+            try:
+                yield json.loads(pending)
+            except ValueError:
+                logger.warning(f"Skipping truncated record at end of {path}")
+
+
+def iter_records(root: Union[str, Path], record_type: str) -> Iterator[Dict]:
+    """全セグメントのレコードを順に読み出す"""
+    for path in segment_paths(root, record_type):
+        yield from iter_segment_records(path)
+
+
+def iter_record_types(root: Union[str, Path]) -> Iterator[Tuple[str, Iterator[Dict]]]:
+    """セグメントディレクトリにある全レコード種別を列挙"""
+    root = Path(root)
+    if not root.exists():
+        return
+    for directory in sorted(p for p in root.iterdir() if p.is_dir()):
+        yield directory.name, iter_records(root, directory.name)
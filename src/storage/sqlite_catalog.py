@@ -0,0 +1,329 @@
+# storage/sqlite_catalog.py
+import argparse
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+from .base import (RECORD_BRAND, RECORD_FRAGRANCE_BASIC, RECORD_PERFUME,
+                   BufferedRecordStorage)
+from .segment_storage import iter_record_types
+
+logger = logging.getLogger(__name__)
+
+SEASONS = ('spring', 'summer', 'fall', 'winter')
+TIMES_OF_DAY = ('day', 'night')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS brands (
+    url TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    perfume_count INTEGER,
+    page_number TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_brands_name ON brands (name);
+
+CREATE TABLE IF NOT EXISTS fragrances (
+    url TEXT PRIMARY KEY,
+    brand_name TEXT NOT NULL,
+    perfume_name TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fragrances_brand ON fragrances (brand_name);
+
+CREATE TABLE IF NOT EXISTS perfumes (
+    id INTEGER PRIMARY KEY,
+    brand TEXT NOT NULL,
+    name TEXT NOT NULL,
+    url TEXT,
+    target_gender TEXT NOT NULL,
+    spring INTEGER NOT NULL,
+    summer INTEGER NOT NULL,
+    fall INTEGER NOT NULL,
+    winter INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    night INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (brand, name)
+);
+CREATE INDEX IF NOT EXISTS idx_perfumes_url ON perfumes (url);
+CREATE INDEX IF NOT EXISTS idx_perfumes_brand ON perfumes (brand);
+
+CREATE TABLE IF NOT EXISTS perfume_accords (
+    perfume_id INTEGER NOT NULL REFERENCES perfumes (id) ON DELETE CASCADE,
+    accord TEXT NOT NULL,
+    strength INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (perfume_id, accord)
+);
+CREATE INDEX IF NOT EXISTS idx_perfume_accords_accord ON perfume_accords (accord, strength);
+"""
+
+
+class SqliteCatalogStorage(BufferedRecordStorage):
+    """
+    Brand・FragranceBasicInfo・PerfumeをSQLite（WALモード）にupsertする保存先
+    バッファしたレコードは1コミット1トランザクションで書き込む
+    """
+
+    def __init__(self, path: Union[str, Path], config: Optional[Dict] = None):
+        super().__init__(config)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # コミットはワーカースレッド、検索はイベントループから行うためロックで直列化
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            str(self.path), isolation_level=None, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA foreign_keys=ON')
+        self.conn.executescript(_SCHEMA)
+
+    def _commit(self, batches: Dict[str, List[Dict]]) -> None:
+        self.upsert(batches)
+
+    def _close_resources(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    def upsert(self, batches: Dict[str, Iterable[Dict]]) -> None:
+        """レコード種別ごとのレコードを1トランザクションでupsert"""
+        now = time.time()
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                for record_type, records in batches.items():
+                    upsert = _UPSERTS.get(record_type)
+                    if upsert is None:
+                        logger.warning(f"Unsupported record type for catalog: {record_type}")
+                        continue
+                    for record in records:
+                        upsert(self.conn, record, now)
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    # 検索
+
+    def perfumes_by_brand(self, brand: str) -> List[Dict]:
+        return self._perfumes("WHERE p.brand = ?", (brand,))
+
+    def perfumes_by_accord(self, accord: str, min_strength: int = 0) -> List[Dict]:
+        return self._perfumes(
+            "WHERE p.id IN (SELECT perfume_id FROM perfume_accords "
+            "WHERE accord = ? AND strength >= ?)",
+            (accord, min_strength))
+
+    def perfumes_by_season(self, season: str) -> List[Dict]:
+        if season not in SEASONS + TIMES_OF_DAY:
+            raise ValueError(f"Unknown season: {season}")
+        return self._perfumes(f"WHERE p.{season} = 1", ())
+
+    def get_perfume(self, url: str) -> Optional[Dict]:
+        perfumes = self._perfumes("WHERE p.url = ?", (url,))
+        return perfumes[0] if perfumes else None
+
+    def iter_perfumes(self, batch_size: int = 1000) -> Iterator[Dict]:
+        """全香水をID順にページングして読み出す（メモリはbatch_size件分のみ）"""
+        last_id = 0
+        while True:
+            with self._lock:
+                ids = [row[0] for row in self.conn.execute(
+                    "SELECT id FROM perfumes WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size))]
+            if not ids:
+                return
+            yield from self._perfumes(
+                f"WHERE p.id IN ({','.join('?' * len(ids))}) ORDER BY p.id", tuple(ids))
+            last_id = ids[-1]
+
+    def iter_fragrances(self, batch_size: int = 1000) -> Iterator[Dict]:
+        """全香水の基本情報をrowid順にページングして読み出す"""
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT rowid, brand_name, perfume_name, url FROM fragrances "
+                    "WHERE rowid > ? ORDER BY rowid LIMIT ?", (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield {'brand_name': row[1], 'perfume_name': row[2], 'url': row[3]}
+            last_id = rows[-1][0]
+
+    def fragrances_by_brand(self, brand_name: str) -> List[Dict]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT brand_name, perfume_name, url FROM fragrances WHERE brand_name = ?",
+                (brand_name,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def _perfumes(self, where: str, params: tuple) -> List[Dict]:
+        with self._lock:
+            rows = self.conn.execute(f"SELECT p.* FROM perfumes p {where}", params).fetchall()
+            accords: Dict[int, List[Dict]] = {}
+            if rows:
+                ids = [row['id'] for row in rows]
+                for accord in self.conn.execute(
+                        f"SELECT perfume_id, accord, strength FROM perfume_accords "
+                        f"WHERE perfume_id IN ({','.join('?' * len(ids))}) "
+                        f"ORDER BY perfume_id, position", ids):
+                    accords.setdefault(accord['perfume_id'], []).append(
+                        {'name': accord['accord'], 'strength': accord['strength']})
+        return [
+            {
+                'name': row['name'],
+                'brand': row['brand'],
+                'target_gender': json.loads(row['target_gender']),
+                'main_accords': accords.get(row['id'], []),
+                'seasons': {season: bool(row[season]) for season in SEASONS},
+                'time_of_day': {time_of_day: bool(row[time_of_day]) for time_of_day in TIMES_OF_DAY},
+                'url': row['url'],
+            }
+            for row in rows
+        ]
+
+
+def _upsert_brand(conn: sqlite3.Connection, record: Dict, now: float) -> None:
+    conn.execute(
+        "INSERT INTO brands (url, name, perfume_count, page_number, updated_at) "
+        "VALUES (?, ?, ?, ?, ?) ON CONFLICT (url) DO UPDATE SET "
+        "name = excluded.name, perfume_count = excluded.perfume_count, "
+        "page_number = excluded.page_number, updated_at = excluded.updated_at",
+        (record['url'], record['name'], record.get('perfume_count'),
+         record.get('page_number'), now))
+
+
+def _upsert_fragrance(conn: sqlite3.Connection, record: Dict, now: float) -> None:
+    conn.execute(
+        "INSERT INTO fragrances (url, brand_name, perfume_name, updated_at) "
+        "VALUES (?, ?, ?, ?) ON CONFLICT (url) DO UPDATE SET "
+        "brand_name = excluded.brand_name, perfume_name = excluded.perfume_name, "
+        "updated_at = excluded.updated_at",
+        (record['url'], record['brand_name'], record['perfume_name'], now))
+
+
+def _upsert_perfume(conn: sqlite3.Connection, record: Dict, now: float) -> None:
+    seasons = record.get('seasons') or {}
+    time_of_day = record.get('time_of_day') or {}
+    conn.execute(
+        "INSERT INTO perfumes (brand, name, url, target_gender, spring, summer, fall, winter, "
+        "day, night, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (brand, name) DO UPDATE SET "
+        "url = COALESCE(excluded.url, perfumes.url), target_gender = excluded.target_gender, "
+        "spring = excluded.spring, summer = excluded.summer, fall = excluded.fall, "
+        "winter = excluded.winter, day = excluded.day, night = excluded.night, "
+        "updated_at = excluded.updated_at",
+        (record['brand'], record['name'], record.get('url'),
+         json.dumps(record.get('target_gender') or [], ensure_ascii=False),
+         *(int(bool(seasons.get(season))) for season in SEASONS),
+         *(int(bool(time_of_day.get(t))) for t in TIMES_OF_DAY),
+         now))
+    perfume_id = conn.execute(
+        "SELECT id FROM perfumes WHERE brand = ? AND name = ?",
+        (record['brand'], record['name'])).fetchone()[0]
+
+    # アコードは丸ごと置き換える
+    conn.execute("DELETE FROM perfume_accords WHERE perfume_id = ?", (perfume_id,))
+    conn.executemany(
+        "INSERT OR REPLACE INTO perfume_accords (perfume_id, accord, strength, position) "
+        "VALUES (?, ?, ?, ?)",
+        [(perfume_id, accord['name'], int(accord['strength']), position)
+         for position, accord in enumerate(record.get('main_accords') or [])])
+
+
+_UPSERTS = {
+    RECORD_BRAND: _upsert_brand,
+    RECORD_FRAGRANCE_BASIC: _upsert_fragrance,
+    RECORD_PERFUME: _upsert_perfume,
+}
+
+
+def classify_record(record: Any) -> Optional[str]:
+    """従来のJSONファイルの内容からレコード種別を判定"""
+    if not isinstance(record, dict):
+        return None
+    if 'main_accords' in record and 'brand' in record:
+        return RECORD_PERFUME
+    if 'perfume_name' in record and 'brand_name' in record:
+        return RECORD_FRAGRANCE_BASIC
+    if 'perfume_count' in record and 'url' in record:
+        return RECORD_BRAND
+    return None
+
+
+def import_directory_tree(
+    catalog: SqliteCatalogStorage,
+    data_dir: Union[str, Path],
+    batch_size: int = 5000
+) -> Dict[str, int]:
+    """
+    既存のデータディレクトリ（1香水1ファイルのJSON、ブランド一覧、JSONLセグメント）を
+    カタログに一括取り込みし、種別ごとの件数を返す
+    """
+    data_dir = Path(data_dir)
+    counts: Dict[str, int] = {}
+    batch: Dict[str, List[Dict]] = {}
+    pending = 0
+
+    def add(record_type: str, record: Dict) -> None:
+        nonlocal pending
+        batch.setdefault(record_type, []).append(record)
+        counts[record_type] = counts.get(record_type, 0) + 1
+        pending += 1
+        if pending >= batch_size:
+            flush()
+
+    def flush() -> None:
+        nonlocal batch, pending
+        if batch:
+            catalog.upsert(batch)
+            logger.info(f"Imported {sum(counts.values())} records")
+        batch, pending = {}, 0
+
+    for file_path in data_dir.rglob('*.json'):
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping {file_path}: {e}")
+            continue
+        for record in content if isinstance(content, list) else [content]:
+            record_type = classify_record(record)
+            if record_type:
+                add(record_type, record)
+
+    for segment_root in data_dir.rglob('segments'):
+        if not segment_root.is_dir():
+            continue
+        for record_type, records in iter_record_types(segment_root):
+            if record_type not in _UPSERTS:
+                continue
+            for record in records:
+                add(record_type, record)
+
+    flush()
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='既存のデータディレクトリをSQLiteカタログに取り込む')
+    parser.add_argument('data_dir', help='例: data')
+    parser.add_argument('--catalog', help='カタログのパス（省略時はdata_dir/catalog.sqlite3）')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from config.settings import CATALOG_CONFIG
+    storage = SqliteCatalogStorage(
+        args.catalog or Path(args.data_dir) / CATALOG_CONFIG['filename'])
+    try:
+        print(import_directory_tree(storage, args.data_dir))
+    finally:
+        storage.conn.close()
@@ -1,62 +1,272 @@
-from typing import Any, Dict, Tuple
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Union
 
 from config.constants import LETTER_GROUPS, LETTER_PAGE_MAPPING
+from config.settings import FRONTIER_CONFIG, OUTPUT_DIR
 from core.base_task import BaseTask
-from scraper import setup_browser
+from core.channel import Channel
+from models.brand import Brand
 from scraper.brand_scraper import BrandScraper
+from scraper.browser_pool import BrowserPool, ContextLease
+from scraper.extractor import BRAND_LIST_SPEC
+from scraper.http_fetcher import HttpFetcher
+from storage.base import (RECORD_BRAND, STORAGE_BACKEND_SQLITE,
+                          create_storage)
+from storage.crawl_state import CrawlStateStore, PendingFetch
+from storage.frontier import CrawlFrontier
 from storage.json_storage import JsonStorage
+from utils.metrics import PHASE_SAVE, get_metrics
+from utils.tracing import get_tracer
 
 
 class BrandScrapingTask(BaseTask):
-    """ブランドスクレイピングタスク"""
+    """
+    ブランドスクレイピングタスク
+    デザイナー一覧ページごとに1回だけ読み込み、そのページに含まれる全文字を抽出する
+    異なるページはコンテキストごとのワーカーで並行に処理し、最後にまとめて保存する
+    """
 
-    def __init__(self, letter_group: int):
-        self.letter_group = letter_group
-        self.playwright = None
-        self.browser = None
-        self.scraper = None
+    def __init__(
+        self,
+        letter_group: Union[int, Sequence[int]],
+        storage_backend: Optional[str] = None,
+        incremental: bool = False,
+        context_count: int = 1,
+        pool: Optional[BrowserPool] = None,
+        brand_sink: Optional[Channel] = None
+    ):
+        # 複数グループを1プロセスでまとめて処理できる
+        self.letter_groups = [letter_group] if isinstance(letter_group, int) else list(letter_group)
+        self.letters = [letter for group in self.letter_groups for letter in LETTER_GROUPS[group]]
+        # 後続タスクはJSONファイルを読むため、カタログへの書き込みは追加で行う
+        self.storage = create_storage(STORAGE_BACKEND_SQLITE, OUTPUT_DIR) \
+            if storage_backend == STORAGE_BACKEND_SQLITE else None
+        self.context_count = context_count
+        # パイプラインでは共有のプールを受け取る（その場合は閉じない）
+        self.pool = pool
+        self.owns_pool = pool is None
+        # 取得できたブランドをページ単位で後続ステージへ流す
+        self.brand_sink = brand_sink
+        self.frontier = None
+        self.frontier_kind = f"brand_pages:{','.join(map(str, self.letter_groups))}"
+        # 差分クロール: デザイナー一覧ページが前回から変わっていなければ取得しない
+        self.incremental = incremental
+        self.crawl_state = None
+        # ページ番号 → 文字 → ブランド（今回取得したページのみ）
+        self.page_results: Dict[str, Dict[str, List[Brand]]] = {}
+        # 取得または変更なしを確認できたページのフロンティア上のキー
+        self.completed_pages: List[str] = []
+        self.logger = logging.getLogger(__name__)
+        # 変化のあったページの検証情報（保存が確定してから記録する）
+        self.pending_fetches: Dict[str, PendingFetch] = {}
 
     async def setup(self) -> None:
         """タスクのセットアップ"""
-        self.playwright, self.browser = await setup_browser()
-        self.scraper = BrandScraper(self.browser)
+        if self.owns_pool:
+            self.pool = BrowserPool({'contexts_per_browser': self.context_count})
+            await self.pool.start()
+        self.frontier = CrawlFrontier(OUTPUT_DIR / FRONTIER_CONFIG['filename'])
+        self.frontier.start_heartbeat()
+        if self.incremental:
+            self.crawl_state = CrawlStateStore(OUTPUT_DIR / FRONTIER_CONFIG['filename'])
 
-    async def process_letter(self, letter: str) -> Tuple[str, int]:
-        """文字ごとの処理"""
-        try:
+    def pages_to_letters(self) -> Dict[str, List[str]]:
+        """対象の文字を含むデザイナー一覧ページごとの文字（ページ番号順）"""
+        pages: Dict[str, List[str]] = {}
+        for letter in self.letters:
             page_nums = LETTER_PAGE_MAPPING.get(letter, [])
             if not page_nums:
-                print(f"No page mapping found for letter {letter}")
-                return letter, 0
+                self.logger.warning(f"No page mapping found for letter {letter}")
+            for page_num in page_nums:
+                pages.setdefault(page_num, []).append(letter)
+        return dict(sorted(pages.items(), key=lambda item: int(item[0])))
+
+    @staticmethod
+    def designer_page_key(page_num: str, letters: List[str]) -> str:
+        """差分判定の記録キー（同じページを別の文字の組み合わせでも処理するため分ける）"""
+        return f"{BrandScraper.designer_page_url(page_num)}#{''.join(letters)}"
 
-            brands = await self.scraper.scrape_letter(letter, page_nums)
-            if brands:
-                JsonStorage.save_brands(brands, letter)
-            return letter, len(brands)
+    async def _designer_page_unchanged(
+        self,
+        lease: ContextLease,
+        page_num: str,
+        letters: List[str]
+    ) -> bool:
+        """保存済みの文字ファイルがあり、ページが前回取得時から変わっていなければTrue"""
+        if not self.crawl_state:
+            return False
+        if any(not (OUTPUT_DIR / f'fragrantica_brands_{letter}.json').exists() for letter in letters):
+            return False
+        url = BrandScraper.designer_page_url(page_num)
+        try:
+            # 本文ではなく抽出したブランド一覧で比較（広告・トークン等の変動を無視する）
+            result = await HttpFetcher(lease.context).fetch_if_changed(
+                url, self.crawl_state, key=self.designer_page_key(page_num, letters),
+                extract=lambda html: BRAND_LIST_SPEC.extract_html(html, base_url=url))
         except Exception as e:
-            print(f"Error processing letter {letter}: {e}")
-            return letter, 0
+            self.logger.warning(f"Conditional fetch failed for {url}: {e}")
+            return False
+        if result.pending:
+            self.pending_fetches[url] = result.pending
+        # チャレンジ等で判定できない場合は変更ありとして取り直す
+        return result.unchanged
+
+    async def process_page(
+        self,
+        scraper: BrandScraper,
+        lease: ContextLease,
+        page_num: str,
+        letters: List[str]
+    ) -> bool:
+        """1ページを処理し、結果を保持する。成功（または変更なし）ならTrue"""
+        try:
+            if await self._designer_page_unchanged(lease, page_num, letters):
+                self.logger.info(f"Designer page {page_num} unchanged, keeping saved brands")
+                await self.emit_saved_brands(page_num, letters)
+                return True
+
+            results = await scraper.scrape_page(page_num, letters)
+            if results:
+                self.page_results[page_num] = results
+                await self.emit_brands(
+                    [brand for letter in letters for brand in results.get(letter, [])])
+                return True
+        except Exception as e:
+            self.logger.error(f"Error processing page {page_num}: {e}")
+
+        # 取得に失敗したページは次回必ず取り直す
+        self.pending_fetches.pop(BrandScraper.designer_page_url(page_num), None)
+        if self.crawl_state:
+            self.crawl_state.forget(self.designer_page_key(page_num, letters))
+        return False
+
+    async def emit_brands(self, brands: List[Brand]) -> None:
+        """後続ステージへブランドを送る（満杯なら後続が追いつくまで待つ）"""
+        if self.brand_sink is None:
+            return
+        for brand in brands:
+            await self.brand_sink.send(brand.to_dict())
+
+    async def emit_saved_brands(self, page_num: str, letters: List[str]) -> None:
+        """取得しなかったページのブランドを保存済みのファイルから後続ステージへ送る"""
+        if self.brand_sink is None:
+            return
+        for letter in letters:
+            saved = JsonStorage.load_brands(letter) or []
+            await self.emit_brands([brand for brand in saved if brand.page_number == page_num])
+
+    async def _page_worker(self, worker_id: int) -> None:
+        """コンテキストを1つ借り、フロンティアからページを取り出して処理するワーカー"""
+        lease = await self.pool.acquire()
+        scraper = BrandScraper(context=lease.context, pool=self.pool)
+        try:
+            while True:
+                entries = self.frontier.dequeue(self.frontier_kind)
+                if not entries:
+                    delay = self.frontier.next_eligible_delay([self.frontier_kind])
+                    if delay is None:
+                        return
+                    self.logger.info(
+                        f"[worker {worker_id}] Waiting {delay:.1f} seconds for pages in backoff")
+                    await get_metrics().sleep(delay, 'backoff')
+                    continue
+
+                entry = entries[0]
+                page_num, letters = entry.payload['page'], entry.payload['letters']
+                with get_tracer().span(
+                        'designer_page', page=page_num, letters=''.join(letters), worker=worker_id):
+                    processed = await self.process_page(scraper, lease, page_num, letters)
+                if processed:
+                    # 保存が確定するまで完了にはしない
+                    self.completed_pages.append(entry.url)
+                else:
+                    self.frontier.mark_failed(self.frontier_kind, entry.url)
+                self.logger.info(f"[worker {worker_id}] Completed processing page {page_num}")
+        finally:
+            await scraper.cleanup()
+            await self.pool.release(lease)
+
+    def collect_brands(self) -> Dict[str, List[Brand]]:
+        """
+        今回取得したページを含む文字について、ページごとの結果をまとめる
+        取得しなかったページ（変更なし・失敗・前回完了）の分は保存済みのファイルから補う
+        """
+        brands_by_letter = {}
+        for letter in self.letters:
+            page_nums = LETTER_PAGE_MAPPING.get(letter, [])
+            if not any(page_num in self.page_results for page_num in page_nums):
+                continue
+            saved = None
+            brands: List[Brand] = []
+            for page_num in page_nums:
+                if page_num in self.page_results:
+                    brands.extend(self.page_results[page_num].get(letter, []))
+                    continue
+                if saved is None:
+                    saved = JsonStorage.load_brands(letter) or []
+                brands.extend(brand for brand in saved if brand.page_number == page_num)
+            # 重複を除去
+            brands_by_letter[letter] = list({brand.url: brand for brand in brands}.values())
+        return brands_by_letter
 
     async def execute(self, **kwargs: Dict[str, Any]) -> None:
         """タスクの実行"""
         try:
-            letters = LETTER_GROUPS[self.letter_group]
-            print(f"Processing letter group {self.letter_group}: {letters}")
+            pages = self.pages_to_letters()
+            self.logger.info(
+                f"Processing letter groups {self.letter_groups}: {self.letters} "
+                f"on {len(pages)} designer pages")
+
+            self.frontier.enqueue_many(
+                self.frontier_kind,
+                [(BrandScraper.designer_page_url(page_num), {'page': page_num, 'letters': letters})
+                 for page_num, letters in pages.items()])
+            # 前回の実行が完了していれば全ページを取り直し、途中で止まっていれば続きから再開
+            counts = self.frontier.counts(self.frontier_kind)
+            if counts.get('done', 0) + counts.get('failed', 0) == len(pages):
+                self.frontier.reset(self.frontier_kind)
+            # 途中から再開する場合、前回完了したページのブランドも後続ステージへ流す
+            if self.brand_sink:
+                for page_num, letters in pages.items():
+                    if self.frontier.is_done(
+                            self.frontier_kind, BrandScraper.designer_page_url(page_num)):
+                        await self.emit_saved_brands(page_num, letters)
+
+            workers = [
+                asyncio.create_task(self._page_worker(worker_id))
+                for worker_id in range(max(1, min(self.context_count, len(pages))))
+            ]
+            await asyncio.gather(*workers)
+
+            # 全ページの結果をまとめて1回で保存し、保存後にページを完了とする
+            brands_by_letter = self.collect_brands()
+            with get_metrics().phase(PHASE_SAVE):
+                JsonStorage.save_brands_by_letter(brands_by_letter)
+                if self.storage:
+                    await self.storage.write_many(
+                        RECORD_BRAND,
+                        [brand.to_dict() for brands in brands_by_letter.values() for brand in brands])
+            for url in self.completed_pages:
+                self.frontier.mark_done(self.frontier_kind, url)
+                pending = self.pending_fetches.pop(url, None)
+                if pending and self.crawl_state:
+                    self.crawl_state.commit_fetch(pending)
 
-            for letter in letters:
-                result = await self.process_letter(letter)
-                print(
-                    f"Completed processing letter {result[0]}: found {result[1]} brands")
+            for letter, brands in brands_by_letter.items():
+                self.logger.info(f"Completed processing letter {letter}: found {len(brands)} brands")
 
         except Exception as e:
-            print(f"Critical error in brand scraping task: {e}")
+            self.logger.error(f"Critical error in brand scraping task: {e}", exc_info=True)
             raise
 
     async def cleanup(self) -> None:
         """リソースのクリーンアップ"""
-        if self.scraper:
-            await self.scraper.cleanup()
-        if self.browser:
-            await self.browser.close()
-        if self.playwright:
-            await self.playwright.stop()
+        if self.pool and self.owns_pool:
+            await self.pool.close()
+        if self.storage:
+            await self.storage.close()
+        if self.frontier:
+            self.frontier.close()
+        if self.crawl_state:
+            self.crawl_state.close()
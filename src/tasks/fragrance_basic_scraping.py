@@ -1,20 +1,37 @@
 import asyncio
 import json
 import logging
-import time
 import traceback
 from pathlib import Path
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Set
 
-from fake_useragent import UserAgent
+from playwright.async_api import BrowserContext, Page
 
+from config.settings import ARCHIVE_CONFIG, CATALOG_CONFIG, FRONTIER_CONFIG
 from core.base_task import BaseTask
+from core.channel import Channel
 from models.fragrance_basic import FragranceBasicInfo
-from scraper import setup_browser
 from scraper.brand_scraper import BrandScraper
-from scraper.proxy_handler import TorProxyHandler
-from scraper.utils import get_random_delay
+from scraper.browser_pool import BrowserPool, ContextLease
+from scraper.cloudflare import PAGE_BLOCKED, classify_response, get_challenge_detector
+from scraper.extractor import (PERFUME_LIST_SELECTORS, extract_perfume_list,
+                               parse_perfume_list)
+from scraper.http_fetcher import (FETCH_MODE_BROWSER, FETCH_MODE_HTTP,
+                                  FETCH_MODES, HttpFetcher)
+from scraper.rate_limiter import get_rate_limiter, parse_retry_after
+from scraper.resource_blocker import get_resource_blocker
+from storage.base import (RECORD_FRAGRANCE_BASIC, STORAGE_BACKEND_SEGMENT,
+                          CommitCallback, RecordStorage, create_storage)
+from storage.crawl_state import CrawlStateStore
+from storage.frontier import CrawlFrontier, FrontierEntry
+from storage.html_archive import HtmlArchive, archive_page
 from utils.logger import setup_logger
+from utils.metrics import PHASE_EXTRACT, PHASE_GOTO, PHASE_SAVE, get_metrics
+from utils.shard_planner import load_manifest, manifest_kind
+from utils.tracing import get_tracer, traced
+
+# 全ブランドを共有キューとして処理する場合のletter
+LETTER_ALL = 'all'
 
 
 class FragranceBasicScrapingTask(BaseTask):
@@ -27,173 +44,177 @@ class FragranceBasicScrapingTask(BaseTask):
         delay_max: float = 2.0,
         max_retries: int = 3,
         letter: str = None,
-        batch_size: int = 50
+        batch_size: int = 50,
+        worker_count: int = 1,
+        context_count: int = 1,
+        queue_size: Optional[int] = None,
+        max_inflight_pages: Optional[int] = None,
+        fetch_mode: str = FETCH_MODE_BROWSER,
+        frontier_path: Optional[str] = None,
+        storage_backend: str = STORAGE_BACKEND_SEGMENT,
+        incremental: bool = False,
+        pool: Optional[BrowserPool] = None,
+        perfume_sink: Optional[Channel] = None,
+        perfume_kind: Optional[str] = None,
+        shard_manifest: Optional[str] = None
     ):
         self.brand_data_dir = Path(brand_data_dir)
         self.output_dir = Path(output_dir)
         self.delay_min = delay_min
         self.delay_max = delay_max
         self.max_retries = max_retries
-        self.playwright = None
-        self.browser = None
-        self.context = None
-        self.page = None
+        # パイプラインでは共有のプールを受け取る（その場合は閉じない）
+        self.pool: Optional[BrowserPool] = pool
+        self.owns_pool = pool is None
+        # 抽出した香水URLを詳細取得ステージへ流す
+        self.perfume_sink = perfume_sink
+        # 詳細取得のフロンティアの種別（同じフロンティアのファイルを使う場合）
+        # ブランドの完了と同時に香水URLを登録し、チャネル上で失われても詳細取得から漏れないようにする
+        self.perfume_kind = perfume_kind
         self.letter = letter
-        self.playwright = None
         self.logger = setup_logger()
         self.batch_size = batch_size
-        self.last_refresh_time = None
-        self.refresh_interval = 300  # 5分ごとにリフレッシュ
-        self.brands_since_refresh = 0
-        self.max_brands_before_refresh = 40
-        self.proxy_handler = TorProxyHandler()
-        self.consecutive_429 = 0
-
-    async def should_refresh(self) -> bool:
-        """ブラウザをリフレッシュすべきか判断"""
-        current_time = time.time()
-
-        # 初回実行時
-        if self.last_refresh_time is None:
-            self.last_refresh_time = current_time
-            return False
-
-        # 時間経過によるリフレッシュ
-        time_elapsed = current_time - self.last_refresh_time
-        if time_elapsed > self.refresh_interval:
-            self.logger.info(
-                f"Refreshing due to time elapsed: {time_elapsed:.1f} seconds")
-            return True
-
-        # ブランド数によるリフレッシュ
-        if self.brands_since_refresh >= self.max_brands_before_refresh:
-            self.logger.info(
-                f"Refreshing after processing {self.brands_since_refresh} brands")
-            return True
-
-        return False
+        self.rate_limiter = get_rate_limiter()
+        if fetch_mode not in FETCH_MODES:
+            raise ValueError(f"Unknown fetch mode: {fetch_mode}")
+        self.fetch_mode = fetch_mode
+        self.frontier_path = Path(frontier_path) if frontier_path else \
+            self.brand_data_dir / FRONTIER_CONFIG['filename']
+        self.frontier: Optional[CrawlFrontier] = None
+        # アルファベットごとに別コンテナで動くため種別を分ける
+        # letter='all'なら全ブランドを1つの種別に登録し、任意の台数のコンテナで分け合う
+        self.frontier_kind = f"fragrance_basic:{letter}"
+        # シャードのマニフェストを渡すと、文字の代わりにそこに含まれるブランドを処理する
+        self.shard = load_manifest(shard_manifest) if shard_manifest else None
+        if self.shard:
+            self.frontier_kind = f"fragrance_basic:{manifest_kind(self.shard)}"
+        self.storage_backend = storage_backend
+        self.storage: Optional[RecordStorage] = None
+        self.archive: Optional[HtmlArchive] = None
+        # 差分クロール: 香水数が変わったブランドのみ再取得
+        self.incremental = incremental
+        self.crawl_state: Optional[CrawlStateStore] = None
+        self._brand_counts: Dict[str, int] = {}
+
+        # ワーカープールの設定
+        self.worker_count = max(1, worker_count)
+        self.context_count = max(1, min(context_count, self.worker_count))
+        self.queue_size = queue_size or self.worker_count * 2
+        self.max_inflight_pages = max(
+            1, min(max_inflight_pages or self.worker_count, self.worker_count))
+        self.consecutive_errors = 0
+        self._page_slots: Optional[asyncio.Semaphore] = None
+        self._brand_locks: Dict[Path, asyncio.Lock] = {}
 
     async def setup(self) -> None:
         """タスクのセットアップ"""
         self.logger.info("Setting up FragranceBasicScrapingTask")
-        self.playwright, self.browser, self.context = await setup_browser()
+        # ワーカー数に応じてコンテキストあたりのページ数を決める
+        if self.owns_pool:
+            self.pool = BrowserPool({
+                'contexts_per_browser': self.context_count,
+                'max_pages_per_context': -(-self.worker_count // self.context_count),
+            })
+            await self.pool.start()
+        self.frontier = CrawlFrontier(self.frontier_path)
+        self.frontier.start_heartbeat()
+        self.storage = create_storage(
+            self.storage_backend, self.output_dir,
+            catalog_path=self.brand_data_dir / CATALOG_CONFIG['filename'])
+        if ARCHIVE_CONFIG['enabled']:
+            self.archive = HtmlArchive(self.brand_data_dir / ARCHIVE_CONFIG['dirname'])
+        if self.incremental:
+            self.crawl_state = CrawlStateStore(self.frontier_path)
+
+    @traced('extract_perfume_urls')
+    async def _extract_perfume_urls(
+        self,
+        brand_url: str,
+        page: Page,
+        max_retries: int = 5
+    ) -> List[Dict]:
+        """ワーカーのページでブランドページから香水の基本情報を抽出"""
+        if self.fetch_mode == FETCH_MODE_HTTP:
+            perfumes = await self._extract_perfume_urls_http(brand_url, page.context)
+            if perfumes:
+                return perfumes
 
-    async def _extract_perfume_urls(self, brand_url: str, max_retries: int = 5) -> List[Dict]:
-        """ブランドページから香水の基本情報を抽出"""
         last_error = None
-        ua = UserAgent()
+        metrics = get_metrics()
 
         for attempt in range(max_retries):
-            page = None
             try:
                 self.logger.info(
                     f"Extracting perfume URLs from {brand_url} (attempt {attempt + 1}/{max_retries})")
+                if attempt:
+                    metrics.retries.inc(operation='brand_page')
 
-                page = await self.context.new_page()
-
-                # User-Agentをリクエストごとに変更
+                # User-Agentはコンテキストのもの（cf_clearanceはUser-Agentに紐づく）を使う
                 await page.set_extra_http_headers({
-                    'User-Agent': ua.random,
                     'Accept-Language': 'en-US,en;q=0.9',
                     'Cache-Control': 'no-cache',
                     'Pragma': 'no-cache'
                 })
 
-                # リトライ時は初期待機時間を長めに
-                if attempt > 0:
-                    initial_wait = get_random_delay(20, 30)
-                    self.logger.info(
-                        f"Initial wait after previous error: {initial_wait:.1f} seconds")
-                    await asyncio.sleep(initial_wait)
+                # レートリミッターで許可を取得（リトライ時の待機もここで行う）
+                waited = await self.rate_limiter.acquire(brand_url)
+                if waited:
+                    self.logger.debug(
+                        f"Rate limiter delayed request by {waited:.1f} seconds")
 
                 # ページ読み込み
-                response = await page.goto(
-                    brand_url,
-                    wait_until='domcontentloaded',
-                    timeout=30000 * (attempt + 1)
-                )
+                with metrics.phase(PHASE_GOTO, url=brand_url, attempt=attempt + 1):
+                    response = await page.goto(
+                        brand_url,
+                        wait_until='domcontentloaded',
+                        timeout=30000 * (attempt + 1)
+                    )
+                await metrics.record_transfer(response)
 
                 if not response:
                     raise Exception("No response received")
 
-                if response.status == 429:
-                    # 429エラー時は指数的に増加する待機時間
-                    wait_time = get_random_delay(30, 60) * (2 ** attempt)
+                if classify_response(response.status, response.headers) == PAGE_BLOCKED:
+                    # 待機はレートリミッターのクールダウンに任せる
                     self.logger.warning(
-                        f"Rate limit (429) hit on attempt {attempt + 1}, waiting {wait_time:.1f} seconds")
-                    await asyncio.sleep(wait_time)
+                        f"Received {response.status} status on attempt {attempt + 1}, throttling host")
+                    self.rate_limiter.record_response(
+                        brand_url, response.status,
+                        retry_after=parse_retry_after(response.headers.get('retry-after')))
+                    self.pool.report(page.context, status=response.status)
                     continue
 
-                if response.status == 403:
-                    wait_time = get_random_delay(30, 60) * (attempt + 1)
+                # 香水一覧が現れた時点で次へ進む（チャレンジ中はDOM変更を待つ）
+                result = await get_challenge_detector().wait(
+                    page, response, content_selectors=PERFUME_LIST_SELECTORS)
+                if not result.ok:
                     self.logger.warning(
-                        f"Received 403 status on attempt {attempt + 1}, waiting {wait_time:.1f} seconds")
-                    await asyncio.sleep(wait_time)
+                        f"Page {result.state} after {result.time_to_clear:.1f}s, throttling host")
+                    self.rate_limiter.record_response(
+                        brand_url, response.status, challenge=True)
+                    self.pool.report(page.context, status=response.status, challenge=True)
                     continue
 
-                if response.status != 200:
+                # チャレンジ通過後は最初の応答のステータスによらず続行
+                if response.status != 200 and not result.challenged:
                     raise Exception(f"HTTP {response.status}")
 
-                # ランダムなスクロール動作を追加
-                await page.evaluate("""
-                    window.scrollTo({
-                        top: Math.random() * document.body.scrollHeight,
-                        behavior: 'smooth'
-                    });
-                """)
-
-                await asyncio.sleep(get_random_delay(1, 3))
-
-                # コンテンツの存在を確認
                 content = await page.content()
-                if "Access Denied" in content or "Security Challenge" in content:
-                    wait_time = get_random_delay(15, 30) * (attempt + 1)
-                    self.logger.warning(
-                        f"Access denied or security challenge detected, waiting {wait_time:.1f} seconds")
-                    await asyncio.sleep(wait_time)
-                    continue
+                # チャレンジを通過した場合は最初の応答（403等）ではなく成功として記録
+                status = 200 if result.challenged else response.status
+                self.rate_limiter.record_response(brand_url, status)
+                self.pool.report(page.context, status=status)
+                await archive_page(self.archive, brand_url, content)
 
-                # 香水情報の抽出
-                perfumes = await page.evaluate('''
-                    () => {
-                        const boxes = document.querySelectorAll('.cell.text-left.prefumeHbox');
-                        return Array.from(boxes).map(box => {
-                            const link = box.querySelector('h3 > a');
-                            if (!link) return null;
-
-                            return {
-                                name: link.textContent.trim(),
-                                url: link.href
-                            };
-                        }).filter(item => item !== null);
-                    }
-                ''')
+                # 香水情報の抽出（1回のevaluateで一覧全体を取得）
+                with metrics.phase(PHASE_EXTRACT):
+                    perfumes = await extract_perfume_list(page)
 
                 if not perfumes:
                     self.logger.warning("No perfumes found on the page")
-                    await asyncio.sleep(get_random_delay(3, 7))
                     continue
 
-                # URLの正規化と検証
-                normalized_perfumes = []
-                for perfume in perfumes:
-                    try:
-                        url = perfume['url']
-                        if not url.startswith('http'):
-                            url = f"https://www.fragrantica.com{url}"
-
-                        if '/perfume/' not in url:
-                            continue
-
-                        normalized_perfumes.append({
-                            'name': perfume['name'],
-                            'url': url
-                        })
-                    except Exception as e:
-                        self.logger.error(
-                            f"Error normalizing perfume URL: {e}")
-                        continue
-
+                normalized_perfumes = self._normalize_perfumes(perfumes)
                 if normalized_perfumes:
                     self.logger.info(
                         f"Successfully extracted {len(normalized_perfumes)} perfumes")
@@ -202,53 +223,66 @@ class FragranceBasicScrapingTask(BaseTask):
             except Exception as e:
                 last_error = e
                 self.logger.error(f"Attempt {attempt + 1} failed: {str(e)}")
-
-                # エラーの種類に応じて待機時間を調整
-                if '429' in str(e):
-                    wait_time = get_random_delay(30, 60) * (2 ** attempt)
-                else:
-                    wait_time = get_random_delay(10, 20) * (attempt + 1)
-
-                self.logger.info(
-                    f"Waiting {wait_time:.1f} seconds before retry")
-                await asyncio.sleep(wait_time)
-
-            finally:
-                if page:
-                    try:
-                        await page.close()
-                        self.logger.debug("Page closed")
-                    except Exception as e:
-                        self.logger.error(f"Error closing page: {e}")
+                self.rate_limiter.record_error(brand_url)
+                self.pool.report(page.context, error=True)
 
         if last_error:
-            # 全試行失敗後は特に長い待機を設定
-            if '429' in str(last_error):
-                wait_time = get_random_delay(120, 180)  # 2-3分の待機
-                self.logger.warning(
-                    f"Rate limit issues detected, triggering long cool-down: {wait_time:.1f} seconds")
-                await asyncio.sleep(wait_time)
-
             self.logger.error(
                 f"All attempts failed for {brand_url}: {str(last_error)}")
         return []
 
-    async def save_fragrance_data(self, fragrance: FragranceBasicInfo) -> None:
-        """香水基本データの保存"""
-        try:
-            initial = fragrance.brand_name[0].upper()
+    async def _extract_perfume_urls_http(self, brand_url: str, context: BrowserContext) -> List[Dict]:
+        """HTTPのみでブランドページを取得し香水一覧を抽出"""
+        html = await HttpFetcher(context, self.rate_limiter).fetch_html(brand_url)
+        if not html:
+            return []
+        await archive_page(self.archive, brand_url, html)
+
+        with get_metrics().phase(PHASE_EXTRACT):
+            perfumes = self._normalize_perfumes(parse_perfume_list(html, base_url=brand_url))
+        if perfumes:
+            self.logger.info(
+                f"Successfully extracted {len(perfumes)} perfumes via HTTP")
+        else:
+            self.logger.info(
+                "No perfumes found in HTTP response, falling back to browser")
+        return perfumes
 
-            # スラッシュを含む名前を処理
-            safe_perfume_name = fragrance.perfume_name.replace('/', '_')
+    def _normalize_perfumes(self, perfumes: List[Dict]) -> List[Dict]:
+        """URLの正規化と検証"""
+        normalized_perfumes = []
+        for perfume in perfumes:
+            try:
+                url = perfume['url']
+                if not url.startswith('http'):
+                    url = f"https://www.fragrantica.com{url}"
 
-            output_dir = self.output_dir / initial / fragrance.brand_name
-            output_dir.mkdir(parents=True, exist_ok=True)
+                if '/perfume/' not in url:
+                    continue
 
-            file_path = output_dir / f"{safe_perfume_name}.json"
-            self.logger.info(f"Saving fragrance data to {file_path}")
+                normalized_perfumes.append({
+                    'name': perfume['name'],
+                    'url': url
+                })
+            except Exception as e:
+                self.logger.error(
+                    f"Error normalizing perfume URL: {e}")
+                continue
+        return normalized_perfumes
 
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(fragrance.to_dict(), f, ensure_ascii=False, indent=2)
+    async def save_fragrance_data(
+        self,
+        fragrances: List[FragranceBasicInfo],
+        on_commit: Optional[CommitCallback] = None
+    ) -> None:
+        """香水基本データの保存（全件の書き出し後にon_commitを呼ぶ）"""
+        try:
+            self.logger.info(f"Saving {len(fragrances)} fragrance records")
+            with get_metrics().phase(PHASE_SAVE):
+                await self.storage.write_many(
+                    RECORD_FRAGRANCE_BASIC,
+                    [fragrance.to_dict() for fragrance in fragrances],
+                    on_commit=on_commit)
 
         except Exception as e:
             self.logger.error(f"Error saving fragrance data: {e}")
@@ -281,169 +315,320 @@ class FragranceBasicScrapingTask(BaseTask):
             self.logger.error(f"Error checking brand completion: {e}")
             return False
 
-    async def deep_refresh(self):
-        """完全なブラウザリフレッシュ"""
-        self.logger.info("Performing deep refresh of browser and context")
-        try:
-            # 既存のリソースをクリーンアップ
-            if self.context:
-                await self.context.close()
-            if self.browser:
-                await self.browser.close()
-
-            # 新しいブラウザセッションを作成
-            self.logger.info("Creating new browser session...")
-            _, self.browser, self.context = await setup_browser()
-
-            # より長い待機時間を設定
-            await asyncio.sleep(get_random_delay(20, 30))
-
-            self.logger.info("Deep refresh completed")
-            return True
-        except Exception as e:
-            self.logger.error(f"Error during deep refresh: {e}")
-            return False
-
     async def execute(self) -> None:
         try:
             brands = await self.load_brand_files()
             self.logger.info(f"Loaded {len(brands)} brands to process")
-            self.last_refresh_time = time.time()
-            self.brands_since_refresh = 0
-            consecutive_errors = 0  # エラー発生の連続カウント
+            self.logger.info(
+                f"Using {self.worker_count} workers, {self.context_count} contexts per browser, "
+                f"{self.max_inflight_pages} in-flight pages, queue size {self.queue_size}")
+            self.consecutive_errors = 0  # エラー発生の連続カウント
+            self._page_slots = asyncio.Semaphore(self.max_inflight_pages)
 
-            # バッチ処理を実装
-            for i in range(0, len(brands), self.batch_size):
-                batch = brands[i:i + self.batch_size]
-                self.logger.info(
-                    f"Processing batch {i//self.batch_size + 1}, brands {i+1} to {min(i+self.batch_size, len(brands))}")
-
-                for brand in batch:
-                    try:
-                        # 処理済みのブランドはスキップ
-                        if await self.check_brand_completion(brand):
-                            continue
-
-                        self.logger.info(f"Processing brand: {brand['name']}")
-                        perfumes = await self._extract_perfume_urls(brand['url'])
-
-                        if perfumes:
-                            consecutive_errors = 0  # 成功したらリセット
-                            for perfume in perfumes:
-                                try:
-                                    fragrance = FragranceBasicInfo(
-                                        brand_name=brand['name'],
-                                        perfume_name=perfume['name'],
-                                        url=perfume['url']
-                                    )
-                                    await self.save_fragrance_data(fragrance)
-                                    await asyncio.sleep(0.5)
-
-                                except Exception as e:
-                                    self.logger.error(
-                                        f"Error saving perfume data: {e}")
-                                    continue
-                        else:
-                            consecutive_errors += 1
-                            if consecutive_errors >= 3:  # 3回連続でエラーが発生した場合
-                                self.logger.warning(
-                                    f"Detected {consecutive_errors} consecutive errors. Performing deep refresh...")
-                                await self.deep_refresh()
-                                consecutive_errors = 0
-                                await asyncio.sleep(get_random_delay(30, 60))
-
-                        # ブランド間の待機時間を調整
-                        brand_wait_time = get_random_delay(8, 15)  # 待機時間を延長
-                        self.logger.debug(
-                            f"Waiting {brand_wait_time:.1f} seconds before next brand")
-                        await asyncio.sleep(brand_wait_time)
-
-                    except Exception as e:
-                        self.logger.error(
-                            f"Error processing brand {brand['name']}: {e}")
-                        consecutive_errors += 1
-                        if consecutive_errors >= 3:
-                            self.logger.warning(
-                                "Too many consecutive errors. Performing deep refresh...")
-                            await self.deep_refresh()
-                            consecutive_errors = 0
-                            await asyncio.sleep(get_random_delay(30, 60))
-                        continue
-
-                # バッチ間で長めの待機
-                batch_wait_time = get_random_delay(60, 120)  # 待機時間をさらに延長
-                self.logger.info(
-                    f"Batch {i//self.batch_size + 1} complete. Waiting {batch_wait_time:.1f} seconds before next batch...")
-                await asyncio.sleep(batch_wait_time)
+            await self._seed_frontier(brands)
+            self.logger.info(
+                f"Frontier state: {self.frontier.counts(self.frontier_kind)}")
 
-                # バッチ終了時に必ずdeep refresh
-                await self.deep_refresh()
+            await self._feed_workers()
+
+            self.logger.info(
+                f"Frontier state: {self.frontier.counts(self.frontier_kind)}")
 
         except Exception as e:
             self.logger.error(f"Critical error in execute: {e}")
             self.logger.error(traceback.format_exc())
             raise
 
-    async def should_refresh(self) -> bool:
-        """ブラウザをリフレッシュすべきか判断"""
-        current_time = time.time()
-
-        # 時間経過によるリフレッシュ（5分）
-        time_elapsed = current_time - self.last_refresh_time
-        if time_elapsed > 300:  # 5分
-            self.logger.info(
-                f"Time-based refresh triggered after {time_elapsed:.1f} seconds")
-            return True
-
-        # ブランド数によるリフレッシュ（40ブランド）
-        if self.brands_since_refresh >= 40:
-            self.logger.info(
-                f"Count-based refresh triggered after {self.brands_since_refresh} brands")
-            return True
+    async def consume_brands(self, channel: Channel) -> None:
+        """
+        上流のブランドスクレイピングから届いたブランドを順次処理する（パイプライン用）
+        届いたブランドはフロンティアに登録してから取り出すため、途中で止まっても再開できる
+        チャネルが閉じられ、未処理・処理中のブランドがなくなったら終了
+        """
+        self.logger.info(
+            f"Consuming brands from {channel.name} with {self.worker_count} workers, "
+            f"{self.max_inflight_pages} in-flight pages")
+        self.consecutive_errors = 0
+        self._page_slots = asyncio.Semaphore(self.max_inflight_pages)
+        await self._feed_workers(channel)
+        self.logger.info(
+            f"Frontier state: {self.frontier.counts(self.frontier_kind)}")
+
+    async def _feed_workers(self, channel: Optional[Channel] = None) -> None:
+        """
+        フロンティアからブランドを1件ずつ取り出してワーカーのキューに渡す
+        リースはキューに空きがある分だけ取るため、複数コンテナで共有しても1台が抱え込まない
+        channelを渡すと、届いたブランドを登録しながら閉じられるまで続ける
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        workers = [
+            asyncio.create_task(self._brand_worker(worker_id, queue))
+            for worker_id in range(self.worker_count)
+        ]
+        dispatched = 0
+        try:
+            while True:
+                if channel:
+                    received = channel.receive_nowait(self.batch_size)
+                    if received:
+                        await self._seed_frontier(received)
+
+                entries = self.frontier.dequeue(self.frontier_kind)
+                if entries:
+                    await queue.put(entries[0])
+                    dispatched += 1
+                    if dispatched % self.batch_size == 0:
+                        self._log_progress(dispatched)
+                    continue
 
-        return False
+                delay = self.frontier.next_eligible_delay([self.frontier_kind])
+                if channel and not channel.exhausted:
+                    # 次のブランドが届くか、バックオフ中のブランドが実行可能になるまで待つ
+                    received = await channel.receive_batch(self.batch_size, timeout=delay)
+                    if received:
+                        await self._seed_frontier(received)
+                    continue
 
-    async def refresh_browser(self):
-        """ブラウザのリフレッシュ処理"""
+                if delay is None:
+                    # 処理中のブランドが失敗して再実行予約される場合があるため完了を待つ
+                    await queue.join()
+                    if self.frontier.next_eligible_delay([self.frontier_kind]) is None:
+                        break
+                    continue
+                self.logger.info(
+                    f"Waiting {delay:.1f} seconds for brands in backoff or leased by other workers")
+                await get_metrics().sleep(delay, 'backoff')
+
+            # 終了の合図
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+            self._log_progress(dispatched)
+        finally:
+            for worker in workers:
+                if not worker.done():
+                    worker.cancel()
+
+    def _log_progress(self, dispatched: int) -> None:
+        """batch_size件ごとの進捗と各種統計"""
+        self.logger.info(
+            f"Dispatched {dispatched} brands, frontier state: "
+            f"{self.frontier.counts(self.frontier_kind)}")
+        self.rate_limiter.log_metrics()
+        get_resource_blocker().log_stats()
+        get_challenge_detector().log_stats()
+        get_metrics().log_stats()
+        self.logger.info(f"Browser pool health: {self.pool.get_stats()}")
+
+    async def _seed_frontier(self, brands: List[Dict]) -> None:
+        """
+        ブランドをフロンティアに登録
+        初めて登録するブランドのみ既存の出力ファイルで完了判定する（旧形式からの移行）
+        """
+        brands = list({brand['url']: brand for brand in brands}.values())
+        # 登録済みのURLは無視されるため、フロンティア全体を読まずに新規のブランドが分かる
+        added = set(self.frontier.enqueue_new(
+            self.frontier_kind, [(brand['url'], brand) for brand in brands]))
+        new_brands = [brand for brand in brands if brand['url'] in added]
+        # 香水数の多い（増えた）ブランドから取り出す
+        self.frontier.set_values(
+            self.frontier_kind,
+            [(brand['url'], self._expected_records(brand['url'], brand['perfume_count']))
+             for brand in brands])
+        for brand in new_brands:
+            if await self.check_brand_completion(brand):
+                self.frontier.mark_done(self.frontier_kind, brand['url'])
+                if self.crawl_state:
+                    self.crawl_state.record_perfume_count(
+                        self.frontier_kind, brand['url'], brand['perfume_count'])
+        if self.crawl_state:
+            self._requeue_changed_brands([brand for brand in brands if brand['url'] not in added])
+
+    def _requeue_changed_brands(self, brands: List[Dict]) -> None:
+        """一覧の香水数が前回処理時から変わったブランドだけを再取得対象に戻す"""
+        self._brand_counts.update((brand['url'], brand['perfume_count']) for brand in brands)
+        completed = self.frontier.completed(self.frontier_kind, [brand['url'] for brand in brands])
+        changed = self.crawl_state.changed_brands(self.frontier_kind, brands, completed)
+        requeued = self.frontier.requeue(self.frontier_kind, changed)
+        self.logger.info(
+            f"Incremental: {requeued} of {len(brands)} known brands changed perfume count")
+
+    def _expected_records(self, url: str, count) -> int:
+        """ブランドを取得して増える（変わる）レコード数の見込み。前回の香水数があればその差"""
+        count = int(count or 0)
+        previous = self.crawl_state.perfume_count(self.frontier_kind, url) \
+            if self.crawl_state else None
+        return count if previous is None else abs(count - previous)
+
+    def _records_gained(self, entry: FrontierEntry, count: int) -> int:
+        """
+        保存するレコードのうち新規の件数
+        初めて完了するブランドは全件（記録済みの香水数があっても完了前の基準のため使わない）、
+        再取得は前回の香水数からの増分（分からなければ0）
+        """
+        if entry.successes == 0:
+            return count
+        previous = self.crawl_state.perfume_count(self.frontier_kind, entry.url) \
+            if self.crawl_state else None
+        return max(0, count - previous) if previous is not None else 0
+
+    def _complete_brand(self, entry: FrontierEntry, perfumes: List[Dict]) -> None:
+        """
+        書き出し確定後にブランドを完了とし、差分判定用の香水数を記録
+        詳細取得のフロンティアへの登録は完了の記録より先に行う（間で止まってもブランドを再取得する）
+        """
+        if self.perfume_kind:
+            self.frontier.enqueue_many(
+                self.perfume_kind,
+                [(perfume['url'], {'brand': entry.payload['name']}) for perfume in perfumes])
+        self.frontier.mark_done(self.frontier_kind, entry.url)
+        if self.crawl_state:
+            count = self._brand_counts.get(entry.url, entry.payload['perfume_count'])
+            self.crawl_state.record_perfume_count(self.frontier_kind, entry.url, count)
+
+    async def _brand_worker(self, worker_id: int, queue: asyncio.Queue) -> None:
+        """キューからブランドを取り出して処理するワーカー"""
+        lease: Optional[ContextLease] = None
+        page: Optional[Page] = None
         try:
-            self.logger.info("Refreshing browser context")
-            if self.context:
-                await self.context.close()
-            self.context = await self.browser.new_context(
-                viewport={'width': 1920, 'height': 1080},
-                user_agent=UserAgent().random,
-                java_script_enabled=True,
-                bypass_csp=True,
-                extra_http_headers={
-                    'Accept-Language': 'en-US,en;q=0.9',
-                    'Cache-Control': 'no-cache',
-                    'Pragma': 'no-cache'
-                }
-            )
-            self.logger.info("Browser context refreshed")
+            while True:
+                entry = await queue.get()
+                try:
+                    if entry is None:
+                        return
+                    # 退役が決まったブラウザのページは返却して借り直す
+                    if lease is None or lease.stale or page.is_closed():
+                        await self._release_worker_page(lease, page)
+                        lease, page = None, None
+                        lease = await self.pool.acquire()
+                        page = await lease.context.new_page()
+                    with get_tracer().span(
+                            'brand', brand=entry.payload['name'], worker=worker_id):
+                        await self._process_brand(worker_id, entry, page)
+                except Exception as e:
+                    self.logger.error(
+                        f"[worker {worker_id}] Error preparing page: {e}")
+                    self.frontier.mark_failed(
+                        self.frontier_kind, entry.url, error=str(e))
+                finally:
+                    queue.task_done()
+        finally:
+            await self._release_worker_page(lease, page)
+
+    async def _release_worker_page(self, lease: Optional[ContextLease], page: Optional[Page]) -> None:
+        """ワーカーのページを閉じてコンテキストを返却"""
+        if page and not page.is_closed():
+            try:
+                await page.close()
+            except Exception as e:
+                self.logger.error(f"Error closing worker page: {e}")
+        if lease:
+            await self.pool.release(lease)
+
+    async def _process_brand(self, worker_id: int, entry: FrontierEntry, page: Page) -> None:
+        """1ブランドを処理し、結果をフロンティアに記録"""
+        brand = entry.payload
+        perfumes = []
+        try:
+            # 同名ブランドの同時処理を防ぐ
+            async with self._brand_lock(brand):
+                async with self._page_slots:
+                    self.logger.info(
+                        f"[worker {worker_id}] Processing brand: {brand['name']}")
+                    perfumes = await self._extract_perfume_urls(brand['url'], page)
+
+            if perfumes:
+                # 保存の確定を待たずに流す（後続は登録済みのURLを重複登録しない）
+                await self._emit_perfumes(brand, perfumes)
+                fragrances = [
+                    FragranceBasicInfo(
+                        brand_name=brand['name'],
+                        perfume_name=perfume['name'],
+                        url=perfume['url']
+                    )
+                    for perfume in perfumes
+                ]
+                # 書き出しが確定してから完了を記録（クラッシュ時は再取得される）
+                # 記録を上書きする前に前回からの増分を求める
+                gained = self._records_gained(entry, len(fragrances))
+                await self.save_fragrance_data(
+                    fragrances,
+                    on_commit=lambda: self._complete_brand(entry, perfumes))
+                get_metrics().record_page('brand_page')
+                get_metrics().record_records('fragrance_basic', gained)
+                self.consecutive_errors = 0  # 成功したらリセット
+            else:
+                get_metrics().record_page('brand_page', 'failed')
+                state = self.frontier.mark_failed(
+                    self.frontier_kind, entry.url, error="no perfumes extracted")
+                self.logger.warning(
+                    f"Brand {brand['name']} failed (attempt {entry.attempts}), now {state}")
+                await self._register_brand_error(
+                    f"Detected {self.consecutive_errors + 1} consecutive errors. Recycling browsers...")
+
         except Exception as e:
-            self.logger.error(f"Error refreshing browser: {e}")
+            self.logger.error(
+                f"Error processing brand {brand['name']}: {e}")
+            get_metrics().record_page('brand_page', 'failed')
+            self.frontier.mark_failed(self.frontier_kind, entry.url, error=str(e))
+            await self._register_brand_error(
+                "Too many consecutive errors. Recycling browsers...")
+
+    async def _emit_perfumes(self, brand: Dict, perfumes: List[Dict]) -> None:
+        """詳細取得ステージへ香水URLを送る（満杯なら後続が追いつくまで待つ）"""
+        if self.perfume_sink is None:
+            return
+        for perfume in perfumes:
+            await self.perfume_sink.send(
+                {'brand': brand['name'], 'name': perfume['name'], 'url': perfume['url']})
+
+    def _brand_lock(self, brand: Dict) -> asyncio.Lock:
+        """ブランドの出力ディレクトリ単位のロックを取得"""
+        brand_dir = self.output_dir / \
+            brand['name'][0].upper() / brand['name']
+        return self._brand_locks.setdefault(brand_dir, asyncio.Lock())
+
+    async def _register_brand_error(self, message: str) -> None:
+        """連続エラーを記録し、閾値を超えたらブラウザを入れ替え"""
+        self.consecutive_errors += 1
+        if self.consecutive_errors < 3:  # 3回連続でエラーが発生した場合
+            return
+
+        self.consecutive_errors = 0
+        self.logger.warning(message)
+        # 処理中のワーカーは止めず、予備ブラウザへ順次切り替える
+        await self.pool.recycle("consecutive errors")
 
     async def cleanup(self) -> None:
         """リソースのクリーンアップ"""
         try:
             self.logger.info("Cleaning up resources")
-            if self.context:
-                await self.context.close()
-            if self.browser:
-                await self.browser.close()
-            if self.playwright:
-                await self.playwright.stop()
+            if self.pool and self.owns_pool:
+                await self.pool.close()
+            # コミット時にフロンティアを更新するため先に閉じる
+            if self.storage:
+                await self.storage.close()
+            if self.frontier:
+                self.frontier.close()
+            if self.crawl_state:
+                self.crawl_state.close()
+            if self.archive:
+                self.archive.close()
         except Exception as e:
             self.logger.error(f"Error during cleanup: {e}")
 
     async def load_brand_files(self) -> List[Dict]:
-        """ブランドデータファイルの読み込み（アルファベットでフィルタリング）"""
+        """ブランドデータファイルの読み込み（アルファベットでフィルタリング、allなら全ファイル）"""
+        if self.shard:
+            self.logger.info(
+                f"Using shard {self.shard['label']} of plan {self.shard['plan']} "
+                f"(estimated {self.shard['estimated_seconds'] / 3600:.1f}h)")
+            return list(self.shard['brands'])
         all_brands = []
         # 指定されたアルファベットのファイルのみを処理
-        file_path = self.brand_data_dir / \
-            f'fragrantica_brands_{self.letter}.json'
-        if file_path.exists():
+        pattern = 'fragrantica_brands_*.json' if self.letter == LETTER_ALL \
+            else f'fragrantica_brands_{self.letter}.json'
+        for file_path in sorted(self.brand_data_dir.glob(pattern)):
             self.logger.info(f"Loading brand file: {file_path}")
             with open(file_path, 'r', encoding='utf-8') as f:
                 brands = json.load(f)
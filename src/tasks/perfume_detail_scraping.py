@@ -1,19 +1,41 @@
-import asyncio
 import json
 import logging
 import random
-import re
 import traceback
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+from playwright.async_api import Response
+
+from config.settings import ARCHIVE_CONFIG, FRONTIER_CONFIG, INCREMENTAL_CONFIG
 from core.base_task import BaseTask
+from core.channel import Channel
 from models.perfume import Accord, Perfume, Season, TimeOfDay
-from scraper import setup_browser
-from scraper.brand_scraper import BrandScraper
+from scraper.browser_pool import BrowserPool, ContextLease
+from scraper.cloudflare import (PAGE_BLOCKED, PAGE_CHALLENGE, classify_response,
+                               get_challenge_detector)
 from scraper.cloudflare_handler import CloudflareHandler
+from scraper.extractor import (extract_perfume_detail, extract_perfume_list,
+                               parse_perfume_detail, parse_perfume_list)
+from scraper.http_fetcher import (FETCH_MODE_ARCHIVE, FETCH_MODE_BROWSER,
+                                  FETCH_MODE_HTTP, FETCH_MODES, HttpFetcher)
+from scraper.rate_limiter import get_rate_limiter, parse_retry_after
+from scraper.resource_blocker import get_resource_blocker
 from scraper.retry_decorator import with_retry
-from scraper.utils import get_random_delay
+from scraper.utils import get_random_delay, perfume_urls
+from storage.base import (RECORD_PERFUME, STORAGE_BACKEND_SEGMENT,
+                          CommitCallback, RecordStorage, create_storage)
+from storage.crawl_state import CrawlStateStore, PendingFetch
+from storage.frontier import CrawlFrontier, FrontierEntry
+from storage.html_archive import HtmlArchive, archive_page
+from utils.metrics import (PHASE_EXTRACT, PHASE_GOTO, PHASE_LOAD, PHASE_SAVE,
+                           get_metrics)
+from utils.shard_planner import load_manifest, manifest_kind
+from utils.tracing import get_tracer, traced
+
+BRAND_KIND = 'perfume_detail:brand'
+PERFUME_KIND = 'perfume_detail:perfume'
+PERFUME_URL_PREFIX = 'https://www.fragrantica.com/perfume/'
 
 
 class PerfumeDetailScrapingTask(BaseTask):
@@ -24,81 +46,117 @@ class PerfumeDetailScrapingTask(BaseTask):
         brand_data_dir: str = 'data',
         delay_min: float = 2.0,
         delay_max: float = 4.0,
-        max_retries: int = 3
+        max_retries: int = 3,
+        fetch_mode: str = FETCH_MODE_BROWSER,
+        frontier_path: Optional[str] = None,
+        storage_backend: str = STORAGE_BACKEND_SEGMENT,
+        incremental: bool = False,
+        pool: Optional[BrowserPool] = None,
+        batch_size: int = 50,
+        shard_manifest: Optional[str] = None
     ):
         self.brand_data_dir = Path(brand_data_dir)
         self.delay_min = delay_min
         self.delay_max = delay_max
         self.max_retries = max_retries
-        self.playwright = None
-        self.browser = None
-        self.scraper = None
-        self.context = None
+        # パイプラインでは共有のプールを受け取る（その場合は閉じない）
+        self.pool: Optional[BrowserPool] = pool
+        self.owns_pool = pool is None
+        # パイプラインでチャネルから一度に受け取る件数
+        self.batch_size = batch_size
+        self.lease: Optional[ContextLease] = None
         self.page = None
         self.cloudflare_handler = None
+        self.rate_limiter = get_rate_limiter()
+        if fetch_mode not in FETCH_MODES + (FETCH_MODE_ARCHIVE,):
+            raise ValueError(f"Unknown fetch mode: {fetch_mode}")
+        self.fetch_mode = fetch_mode
+        self.http_fetcher = None
+        self.frontier_path = Path(frontier_path) if frontier_path else \
+            self.brand_data_dir / FRONTIER_CONFIG['filename']
+        self.frontier: Optional[CrawlFrontier] = None
+        # シャードのマニフェストを渡すと、全ブランドの代わりにそこに含まれるブランドを処理する
+        # 種別をシャードごとに分け、他のシャードの香水を取り出さないようにする
+        self.shard = load_manifest(shard_manifest) if shard_manifest else None
+        suffix = f":{manifest_kind(self.shard)}" if self.shard else ''
+        self.brand_kind = BRAND_KIND + suffix
+        self.perfume_kind = PERFUME_KIND + suffix
+        self.storage_backend = storage_backend
+        self.storage: Optional[RecordStorage] = None
+        self.archive: Optional[HtmlArchive] = None
+        # 差分クロール: 香水数が変わったブランドと、新規または鮮度切れの香水のみ取得
+        self.incremental = incremental
+        self.crawl_state: Optional[CrawlStateStore] = None
+        self._brand_counts: Dict[str, int] = {}
+        # 変化のあった詳細ページの検証情報（保存が確定してから記録する）
+        self._pending_fetches: Dict[str, PendingFetch] = {}
         self.logger = logging.getLogger(__name__)
 
     async def setup(self) -> None:
         """タスクのセットアップ"""
         self.logger.info("Setting up PerfumeDetailScrapingTask")
-        self.playwright, self.browser = await setup_browser()
-        self.scraper = BrandScraper(self.browser)
-        self.context = await self.browser.new_context()
-        self.page = await self.context.new_page()
+        if ARCHIVE_CONFIG['enabled'] or self.fetch_mode == FETCH_MODE_ARCHIVE:
+            self.archive = HtmlArchive(self.brand_data_dir / ARCHIVE_CONFIG['dirname'])
+        self.storage = create_storage(self.storage_backend, self.brand_data_dir)
+        if self.fetch_mode == FETCH_MODE_ARCHIVE:
+            # 再抽出はアーカイブのみを使うためブラウザは起動しない
+            return
+        if self.owns_pool:
+            self.pool = BrowserPool()
+            await self.pool.start()
+        await self._ensure_page()
+        self.frontier = CrawlFrontier(self.frontier_path)
+        self.frontier.start_heartbeat()
+        if self.incremental:
+            self.crawl_state = CrawlStateStore(self.frontier_path)
+
+    async def _ensure_page(self) -> None:
+        """プールからコンテキストを借り、退役が決まっていれば借り直す"""
+        if self.lease and not self.lease.stale:
+            return
+        await self._release_page()
+        self.lease = await self.pool.acquire()
+        self.page = await self.lease.context.new_page()
         self.cloudflare_handler = CloudflareHandler(self.page)
+        self.http_fetcher = HttpFetcher(self.lease.context, self.rate_limiter)
+
+    async def _release_page(self) -> None:
+        """ページを閉じてコンテキストを返却"""
+        if self.page and not self.page.is_closed():
+            await self.page.close()
+        self.page = None
+        if self.lease:
+            await self.pool.release(self.lease)
+            self.lease = None
 
     async def execute(self, **kwargs: Dict[str, Any]) -> None:
         """タスクの実行"""
         try:
+            if self.fetch_mode == FETCH_MODE_ARCHIVE:
+                await self.reextract_from_archive()
+                return
+
             self.logger.info("Starting perfume detail scraping")
             brands = await self.load_brand_files()
-
-            for brand in brands:
-                try:
-                    self.logger.info(f"Processing brand: {brand['name']}")
-                    perfume_urls = await self.extract_perfume_urls(brand['url'])
-
-                    for perfume_url in perfume_urls:
-                        try:
-                            self.logger.info(
-                                f"Processing perfume: {perfume_url}")
-                            detail_data = await self.extract_perfume_data(perfume_url)
-
-                            # 香水名はURLから抽出
-                            perfume_name = perfume_url.split(
-                                '/')[-1].replace('.html', '')
-
-                            perfume = Perfume(
-                                name=perfume_name,
-                                brand=brand['name'],
-                                target_gender=detail_data['target_gender'],
-                                main_accords=[
-                                    Accord(**accord) for accord in detail_data['main_accords']
-                                ],
-                                seasons=Season(**detail_data['seasons']),
-                                time_of_day=TimeOfDay(
-                                    **detail_data['time_of_day'])
-                            )
-
-                            await self.save_perfume_data(perfume, brand['name'])
-                            await asyncio.sleep(
-                                get_random_delay(
-                                    self.delay_min, self.delay_max)
-                            )
-
-                        except Exception as e:
-                            self.logger.error(
-                                f"Error processing perfume {perfume_url}: {e}",
-                                exc_info=True
-                            )
-                            continue
-
-                except Exception as e:
-                    self.logger.error(
-                        f"Error processing brand {brand['name']}: {e}",
-                        exc_info=True
-                    )
-                    continue
+            self.frontier.enqueue_many(
+                self.brand_kind, [(brand['url'], {'name': brand['name']}) for brand in brands])
+            # 新しい香水の多いブランドから展開する（香水は既定の1件分の価値）
+            self.frontier.set_values(
+                self.brand_kind, [(brand['url'], self._expected_records(brand)) for brand in brands])
+            if self.crawl_state:
+                self._requeue_incremental(brands)
+            self.logger.info(
+                f"Frontier state: brands {self.frontier.counts(self.brand_kind)}, "
+                f"perfumes {self.frontier.counts(self.perfume_kind)}")
+
+            # 登録済みの香水を優先し、なくなったら次のブランドを展開する
+            while await self._process_next(expand_brands=True):
+                pass
+            await self._wait_backoff([self.perfume_kind, self.brand_kind])
+
+            self.logger.info(
+                f"Frontier state: brands {self.frontier.counts(self.brand_kind)}, "
+                f"perfumes {self.frontier.counts(self.perfume_kind)}")
 
         except Exception as e:
             self.logger.error(
@@ -107,22 +165,212 @@ class PerfumeDetailScrapingTask(BaseTask):
             )
             raise
 
+    async def consume_perfumes(self, channel: Channel) -> None:
+        """
+        上流の基本情報スクレイピングから届いた香水URLを詳細取得する（パイプライン用）
+        香水URLは上流が取得済みのため、ブランドページは再訪しない
+        届いた香水は1件処理するごとにフロンティアへ登録し、途中で止まっても再開できるようにする
+        """
+        self.logger.info(f"Consuming perfumes from {channel.name}")
+        if self.crawl_state:
+            requeued = self.frontier.requeue_stale(
+                self.perfume_kind, INCREMENTAL_CONFIG['perfume_ttl'])
+            self.logger.info(f"Incremental: {requeued} perfumes past freshness TTL")
+
+        while True:
+            self._enqueue_received(channel.receive_nowait(self.batch_size))
+            if await self._process_next(expand_brands=False):
+                continue
+            if channel.exhausted:
+                break
+            # 次の香水が届くか、バックオフ中の香水が実行可能になるまで待つ
+            delay = self.frontier.next_eligible_delay([self.perfume_kind])
+            self._enqueue_received(await channel.receive_batch(self.batch_size, timeout=delay))
+
+        await self._wait_backoff([self.perfume_kind])
+        self.logger.info(f"Frontier state: perfumes {self.frontier.counts(self.perfume_kind)}")
+
+    def _enqueue_received(self, perfumes: List[Dict]) -> None:
+        if perfumes:
+            self.frontier.enqueue_many(
+                self.perfume_kind,
+                [(perfume['url'], {'brand': perfume['brand']}) for perfume in perfumes])
+
+    async def _process_next(self, expand_brands: bool) -> bool:
+        """実行可能な香水（なければブランド）を1件処理する。処理するものがなければFalse"""
+        perfumes = self.frontier.dequeue(self.perfume_kind)
+        if perfumes:
+            with get_tracer().span('perfume', url=perfumes[0].url):
+                await self._process_perfume(perfumes[0])
+            return True
+
+        if expand_brands:
+            brands = self.frontier.dequeue(self.brand_kind)
+            if brands:
+                with get_tracer().span('brand', brand=brands[0].payload['name']):
+                    await self._process_brand(brands[0])
+                return True
+        return False
+
+    async def _wait_backoff(self, kinds: List[str]) -> None:
+        """バックオフ中のURLが実行可能になるのを待って処理し、未処理がなくなるまで繰り返す"""
+        expand_brands = self.brand_kind in kinds
+        while True:
+            delay = self.frontier.next_eligible_delay(kinds)
+            if delay is None:
+                return
+            self.logger.info(f"Waiting {delay:.1f} seconds for URLs in backoff")
+            await get_metrics().sleep(delay, 'backoff')
+            while await self._process_next(expand_brands):
+                pass
+
+    def _requeue_incremental(self, brands: List[Dict]) -> None:
+        """香水数が変わったブランドと、取得から鮮度切れになった香水を再取得対象に戻す"""
+        self._brand_counts = {brand['url']: brand['perfume_count'] for brand in brands}
+        # 差分判定の履歴はシャード分けによらず共有する
+        completed = self.frontier.completed(self.brand_kind, [brand['url'] for brand in brands])
+        changed = self.crawl_state.changed_brands(BRAND_KIND, brands, completed)
+        requeued_brands = self.frontier.requeue(self.brand_kind, changed)
+        requeued_perfumes = self.frontier.requeue_stale(
+            self.perfume_kind, INCREMENTAL_CONFIG['perfume_ttl'])
+        self.logger.info(
+            f"Incremental: {requeued_brands} brands changed perfume count, "
+            f"{requeued_perfumes} perfumes past freshness TTL")
+
+    def _expected_records(self, brand: Dict) -> int:
+        """ブランドを展開して増える香水数の見込み。前回の香水数があればその差"""
+        count = int(brand['perfume_count'] or 0)
+        previous = self.crawl_state.perfume_count(BRAND_KIND, brand['url']) \
+            if self.crawl_state else None
+        return count if previous is None else abs(count - previous)
+
+    async def _process_brand(self, entry: FrontierEntry) -> None:
+        """ブランドページから香水URLを取得しフロンティアに登録"""
+        brand_name = entry.payload['name']
+        try:
+            self.logger.info(f"Processing brand: {brand_name}")
+            await self._ensure_page()
+            perfume_urls = await self.extract_perfume_urls(entry.url)
+            added = self.frontier.enqueue_many(
+                self.perfume_kind, [(url, {'brand': brand_name}) for url in perfume_urls])
+            self.logger.info(f"Queued {added} new perfumes for {brand_name}")
+            get_metrics().record_page('brand_page')
+            self.frontier.mark_done(self.brand_kind, entry.url)
+            if self.crawl_state and entry.url in self._brand_counts:
+                self.crawl_state.record_perfume_count(
+                    BRAND_KIND, entry.url, self._brand_counts[entry.url])
+
+        except Exception as e:
+            self.logger.error(
+                f"Error processing brand {brand_name}: {e}",
+                exc_info=True
+            )
+            get_metrics().record_page('brand_page', 'failed')
+            self.frontier.mark_failed(self.brand_kind, entry.url, error=str(e))
+
+    async def _process_perfume(self, entry: FrontierEntry) -> None:
+        """香水の詳細ページを取得して保存"""
+        perfume_url = entry.url
+        try:
+            self.logger.info(f"Processing perfume: {perfume_url}")
+            await self._ensure_page()
+            detail_data = await self.extract_perfume_data(
+                perfume_url, brand=entry.payload['brand'])
+            if detail_data is None:
+                # 前回取得時から変化なし
+                self.logger.info(f"Unchanged since last crawl: {perfume_url}")
+                get_metrics().record_page('perfume', 'unchanged')
+                self.frontier.mark_done(self.perfume_kind, perfume_url, status=304)
+                return
+            perfume = self._build_perfume(perfume_url, entry.payload['brand'], detail_data)
+
+            # 書き出しが確定してから完了と検証情報を記録
+            await self.save_perfume_data(
+                perfume,
+                on_commit=lambda: self._complete_perfume(perfume_url))
+            get_metrics().record_page('perfume')
+            # 差分クロールでは変化のあったページのみここに来る。それ以外は初めての取得のみ数える
+            if self.crawl_state or entry.successes == 0:
+                get_metrics().record_records('perfume', 1)
+
+        except Exception as e:
+            self.logger.error(
+                f"Error processing perfume {perfume_url}: {e}",
+                exc_info=True
+            )
+            get_metrics().record_page('perfume', 'failed')
+            # 保存できなかったページは次回も変化ありとして取り直す
+            self._pending_fetches.pop(perfume_url, None)
+            self.frontier.mark_failed(self.perfume_kind, perfume_url, error=str(e))
+
+    def _complete_perfume(self, perfume_url: str) -> None:
+        """書き出し確定後に香水を完了とし、差分判定用の検証情報を記録"""
+        self.frontier.mark_done(self.perfume_kind, perfume_url)
+        pending = self._pending_fetches.pop(perfume_url, None)
+        if pending and self.crawl_state:
+            self.crawl_state.commit_fetch(pending)
+
+    async def reextract_from_archive(self) -> None:
+        """アーカイブ済みの詳細ページから、ネットワークに出ずに同じ抽出処理で再生成"""
+        self.logger.info("Re-extracting perfume details from archive")
+        extracted = failed = 0
+        for url, meta, html in self.archive.iter_latest(PERFUME_URL_PREFIX):
+            try:
+                # アーカイブ時のブランド名がなければURLから推定
+                brand = meta.get('brand') or url.split('/')[-2].replace('-', ' ')
+                detail_data = self._build_perfume_data(parse_perfume_detail(html))
+                await self.save_perfume_data(self._build_perfume(url, brand, detail_data))
+                extracted += 1
+            except Exception as e:
+                failed += 1
+                self.logger.error(f"Error re-extracting {url}: {e}")
+        self.logger.info(
+            f"Re-extracted {extracted} perfumes from archive ({failed} failed)")
+
+    def _build_perfume(self, perfume_url: str, brand: str, detail_data: Dict) -> Perfume:
+        """抽出結果からPerfumeを組み立てる"""
+        # 香水名はURLから抽出
+        perfume_name = perfume_url.split('/')[-1].replace('.html', '')
+
+        return Perfume(
+            name=perfume_name,
+            brand=brand,
+            target_gender=detail_data['target_gender'],
+            main_accords=[
+                Accord(**accord) for accord in detail_data['main_accords']
+            ],
+            seasons=Season(**detail_data['seasons']),
+            time_of_day=TimeOfDay(**detail_data['time_of_day']),
+            url=perfume_url
+        )
+
     async def cleanup(self) -> None:
         """リソースのクリーンアップ"""
         self.logger.info("Cleaning up resources")
-        if self.page:
-            await self.page.close()
-        if self.context:
-            await self.context.close()
-        if self.scraper:
-            await self.scraper.cleanup()
-        if self.browser:
-            await self.browser.close()
-        if self.playwright:
-            await self.playwright.stop()
+        get_resource_blocker().log_stats()
+        get_challenge_detector().log_stats()
+        get_metrics().log_stats()
+        if self.pool:
+            await self._release_page()
+            if self.owns_pool:
+                await self.pool.close()
+        # コミット時にフロンティアを更新するため先に閉じる
+        if self.storage:
+            await self.storage.close()
+        if self.frontier:
+            self.frontier.close()
+        if self.crawl_state:
+            self.crawl_state.close()
+        if self.archive:
+            self.archive.close()
 
     async def load_brand_files(self) -> List[Dict]:
         """ブランドデータファイルの読み込み"""
+        if self.shard:
+            self.logger.info(
+                f"Using shard {self.shard['label']} of plan {self.shard['plan']} "
+                f"(estimated {self.shard['estimated_seconds'] / 3600:.1f}h)")
+            return list(self.shard['brands'])
         all_brands = []
         for file_path in self.brand_data_dir.glob('fragrantica_brands_*.json'):
             self.logger.info(f"Loading brand file: {file_path}")
@@ -131,6 +379,7 @@ class PerfumeDetailScrapingTask(BaseTask):
                 all_brands.extend(brands)
         return all_brands
 
+    @traced('extract_perfume_urls')
     @with_retry(max_retries=5,
                 initial_delay=5.0,
                 max_delay=30.0
@@ -139,38 +388,38 @@ class PerfumeDetailScrapingTask(BaseTask):
         """ブランドページから香水の詳細ページURLを抽出"""
         try:
             self.logger.info(f"Extracting perfume URLs from {brand_url}")
-            await self.page.goto(brand_url, wait_until='domcontentloaded', timeout=60000)
 
-            if not await self.cloudflare_handler.wait_for_challenge_completion():
+            if self.fetch_mode == FETCH_MODE_HTTP:
+                html = await self.http_fetcher.fetch_html(brand_url)
+                if html:
+                    await archive_page(self.archive, brand_url, html)
+                with get_metrics().phase(PHASE_EXTRACT):
+                    perfume_links = perfume_urls(
+                        parse_perfume_list(html or '', base_url=brand_url))
+                if perfume_links:
+                    self.logger.info(
+                        f"Found {len(perfume_links)} perfume URLs via HTTP")
+                    return perfume_links
+
+            response = await self._goto(brand_url)
+
+            if not await self._wait_for_challenge(brand_url, response):
                 raise Exception("Failed to pass Cloudflare challenge")
 
             try:
-                await self.page.wait_for_load_state('networkidle', timeout=10000)
+                with get_metrics().phase(PHASE_LOAD):
+                    await self.page.wait_for_load_state('networkidle', timeout=10000)
             except Exception as e:
                 self.logger.warning(f"Network idle timeout: {e}")
 
-            await asyncio.sleep(get_random_delay(self.delay_min, self.delay_max))
+            await get_metrics().sleep(get_random_delay(self.delay_min, self.delay_max), 'delay')
+            if self.archive:
+                await archive_page(self.archive, brand_url, await self.page.content())
 
-            perfume_links = []
-            perfume_boxes = await self.page.query_selector_all(
-                '.cell.text-left.prefumeHbox'
-            )
-
-            for box in perfume_boxes:
-                try:
-                    link = await box.query_selector('h3 > a')
-                    if link:
-                        href = await link.get_attribute('href')
-                        if href and href.startswith('/perfume/'):
-                            full_url = f"https://www.fragrantica.com{href}"
-                            name = await link.inner_text()
-                            self.logger.info(
-                                f"Found perfume: {name.strip()} - {full_url}"
-                            )
-                            perfume_links.append(full_url)
-                except Exception as e:
-                    self.logger.error(f"Error extracting perfume URL: {e}")
-                    continue
+            with get_metrics().phase(PHASE_EXTRACT):
+                perfume_links = perfume_urls(await extract_perfume_list(self.page))
+            for full_url in perfume_links:
+                self.logger.debug(f"Found perfume: {full_url}")
 
             self.logger.info(f"Found {len(perfume_links)} perfume URLs")
             return perfume_links
@@ -180,126 +429,35 @@ class PerfumeDetailScrapingTask(BaseTask):
                 f"Error extracting perfume URLs from brand page: {e}")
             raise
 
+    @traced('extract_perfume_data')
     @with_retry(max_retries=5, initial_delay=5.0, max_delay=30.0)
-    async def extract_perfume_data(self, url: str) -> Dict:
-        """香水詳細ページからデータを抽出"""
+    async def extract_perfume_data(self, url: str, brand: Optional[str] = None) -> Optional[Dict]:
+        """
+        香水詳細ページからデータを抽出（抽出できたページはアーカイブに保存）
+        差分クロール時、前回取得から変化がなければNone
+        """
         try:
             self.logger.info(f"Extracting data from {url}")
-            await self.page.goto(url, wait_until='domcontentloaded', timeout=60000)
-
-            # Cloudflareチェックを試みるが、失敗してもコンテンツの取得を試みる
-            await self.cloudflare_handler.wait_for_challenge_completion(timeout=30000)
-
-            # ページの読み込みを確実にする
-            await self.page.wait_for_load_state('networkidle', timeout=30000)
-            await asyncio.sleep(get_random_delay(self.delay_min, self.delay_max))
-
-            # 性別情報の抽出
-            target_gender = []
-            gender_info = await self.page.evaluate('''
-                () => {
-                    const h1 = document.querySelector('h1');
-                    return h1 ? h1.innerText : null;
-                }
-            ''')
-
-            if not gender_info:
-                self.logger.warning("No content found, might be blocked")
-                raise Exception("Failed to extract content")
-
-            if gender_info:
-                self.logger.info(f"Found gender info: {gender_info}")
-                if 'for women' in gender_info.lower():
-                    target_gender.append('women')
-                if 'for men' in gender_info.lower():
-                    target_gender.append('men')
-
-            # メインアコードの抽出
-            accord_bars = await self.page.evaluate('''
-                () => {
-                    const bars = Array.from(document.getElementsByClassName('accord-bar'));
-                    return bars.map(bar => ({
-                        text: bar.innerText,
-                        style: bar.getAttribute('style')
-                    }));
-                }
-            ''')
-
-            accords = []
-            for bar in accord_bars:
-                try:
-                    name = bar['text'].strip()
-                    style = bar['style']
-                    if style:
-                        width_match = re.search(r'width:\s*([\d.]+)%', style)
-                        if width_match:
-                            strength = int(float(width_match.group(1)))
-                            accords.append({
-                                'name': name,
-                                'strength': strength
-                            })
-                            self.logger.info(
-                                f"Added accord: {name} ({strength}%)")
-                except Exception as e:
-                    self.logger.error(f"Error processing accord bar: {e}")
-                    continue
-
-            # シーズン情報を探す
-            seasons_data = await self.page.evaluate('''
-                () => {
-                    const seasonElements = Array.from(
-                        document.getElementsByClassName('vote-season')
-                    );
-                    return seasonElements.map(el => ({
-                        season: el.getAttribute('data-season'),
-                        votes: parseInt(el.innerText)
-                    }));
-                }
-            ''')
-
-            seasons = {
-                'spring': False,
-                'summer': False,
-                'fall': False,
-                'winter': False
-            }
-
-            for season_data in seasons_data:
-                if season_data.get('season') in seasons:
-                    seasons[season_data['season']] = season_data.get(
-                        'votes', 0) > 50
-
-            # 時間帯情報を探す
-            time_of_day_data = await self.page.evaluate('''
-                () => {
-                    const elements = Array.from(
-                        document.querySelectorAll('.vote-time-of-day')
-                    );
-                    return elements.map(el => ({
-                        time: el.getAttribute('data-time'),
-                        votes: parseInt(el.innerText)
-                    }));
-                }
-            ''')
-
-            time_of_day = {
-                'day': False,
-                'night': False
-            }
-
-            for tod_data in time_of_day_data:
-                if tod_data.get('time') in time_of_day:
-                    time_of_day[tod_data['time']] = tod_data.get(
-                        'votes', 0) > 50
-
-            # 結果をまとめる
-            result = {
-                'target_gender': list(set(target_gender)),
-                'main_accords': accords,
-                'seasons': seasons,
-                'time_of_day': time_of_day
-            }
 
+            result = html = None
+            if self.fetch_mode == FETCH_MODE_HTTP:
+                result, html, unchanged = await self._fetch_detail_http(url)
+                if unchanged:
+                    return None
+
+            if result is None:
+                result = self._build_perfume_data(await self._collect_detail_from_page(url))
+                html = await self.page.content() if self.archive else None
+                if self.crawl_state:
+                    # 描画後の本文は広告・トークン等で毎回変わるため、HTTPと同じく抽出結果で比較
+                    pending = self.crawl_state.compare_fetch(url, data=result)
+                    if not pending.changed:
+                        self.crawl_state.commit_fetch(pending)
+                        return None
+                    self._pending_fetches[url] = pending
+
+            if html:
+                await archive_page(self.archive, url, html, meta={'brand': brand})
             self.logger.info("Successfully extracted perfume data")
             self.logger.debug(f"Extracted data: {result}")
 
@@ -310,16 +468,163 @@ class PerfumeDetailScrapingTask(BaseTask):
             traceback.print_exc()
             raise
 
-    async def save_perfume_data(self, perfume: Perfume, brand_name: str) -> None:
-        """香水データの保存"""
-        output_dir = self.brand_data_dir / brand_name
-        output_dir.mkdir(parents=True, exist_ok=True)
-
-        file_path = output_dir / f"{perfume.name}.json"
-        self.logger.info(f"Saving perfume data to {file_path}")
+    async def _fetch_detail_http(self, url: str) -> Tuple[Optional[Dict], Optional[str], bool]:
+        """
+        HTTPで詳細ページを取得し(香水データ, HTML, 前回から変化なしか)を返す
+        差分クロール時は条件付きで取得して抽出結果で変化を判定し、
+        変化のあったページの検証情報は保存の確定まで保留する
+        香水データがNoneならブラウザにフォールバック
+        """
+        try:
+            if not self.crawl_state:
+                html = await self.http_fetcher.fetch_html(url)
+                return (self._extract_detail_html(html) if html else None), html, False
+            result = await self.http_fetcher.fetch_if_changed(
+                url, self.crawl_state, extract=self._extract_detail_html)
+        except Exception as e:
+            self.logger.warning(f"HTTP fetch failed for {url}: {e}")
+            return None, None, False
+        if result.pending:
+            self._pending_fetches[url] = result.pending
+        return result.data, (result.html if result.ok else None), result.unchanged
+
+    def _extract_detail_html(self, html: str) -> Dict:
+        """取得したHTMLから香水データを組み立てる（ブラウザ経路と同じ形）"""
+        with get_metrics().phase(PHASE_EXTRACT):
+            raw = parse_perfume_detail(html)
+        return self._build_perfume_data(raw)
+
+    async def _collect_detail_from_page(self, url: str) -> Dict:
+        """ブラウザで詳細ページを開き生データを取得"""
+        response = await self._goto(url)
+
+        # Cloudflareチェックを試みるが、失敗してもコンテンツの取得を試みる
+        await self._wait_for_challenge(url, response, timeout=30000)
+
+        # ページの読み込みを確実にする
+        with get_metrics().phase(PHASE_LOAD):
+            await self.page.wait_for_load_state('networkidle', timeout=30000)
+        await get_metrics().sleep(get_random_delay(self.delay_min, self.delay_max), 'delay')
+
+        # 1回のevaluateでレコード全体を取得
+        with get_metrics().phase(PHASE_EXTRACT):
+            return await extract_perfume_detail(self.page)
+
+    def _build_perfume_data(self, raw: Dict) -> Dict:
+        """生データから香水データを組み立てる"""
+        # 性別情報の抽出
+        target_gender = []
+        gender_info = raw.get('title')
+
+        if not gender_info:
+            self.logger.warning("No content found, might be blocked")
+            raise Exception("Failed to extract content")
+
+        self.logger.debug(f"Found gender info: {gender_info}")
+        if 'for women' in gender_info.lower():
+            target_gender.append('women')
+        if 'for men' in gender_info.lower():
+            target_gender.append('men')
+
+        # メインアコード（幅は抽出時に数値化済み）
+        accords = []
+        for accord in raw.get('accords', []):
+            strength = int(accord['strength'])
+            accords.append({
+                'name': accord['name'],
+                'strength': strength
+            })
+            self.logger.debug(
+                f"Added accord: {accord['name']} ({strength}%)")
+
+        # シーズン情報
+        seasons = {
+            'spring': False,
+            'summer': False,
+            'fall': False,
+            'winter': False
+        }
+
+        for season_data in raw.get('seasons', []):
+            if season_data.get('season') in seasons:
+                seasons[season_data['season']] = (season_data.get(
+                    'votes') or 0) > 50
+
+        # 時間帯情報
+        time_of_day = {
+            'day': False,
+            'night': False
+        }
+
+        for tod_data in raw.get('time_of_day', []):
+            if tod_data.get('time') in time_of_day:
+                time_of_day[tod_data['time']] = (tod_data.get(
+                    'votes') or 0) > 50
+
+        # 結果をまとめる
+        return {
+            'target_gender': list(set(target_gender)),
+            'main_accords': accords,
+            'seasons': seasons,
+            'time_of_day': time_of_day
+        }
+
+    async def _goto(self, url: str) -> Optional[Response]:
+        """
+        レートリミッター経由でページを開き、応答をフィードバック
+        チャレンジの応答は通過を待ってから_wait_for_challengeで結果をフィードバックする
+        （ブラウザが通過できるチャレンジでレートを下げたり、クリアランスを捨てたりしない）
+        """
+        await self.rate_limiter.acquire(url)
+        try:
+            with get_metrics().phase(PHASE_GOTO, url=url):
+                response = await self.page.goto(url, wait_until='domcontentloaded', timeout=60000)
+            await get_metrics().record_transfer(response)
+        except Exception:
+            self.rate_limiter.record_error(url)
+            self.pool.report(self.lease.context, error=True)
+            raise
 
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(perfume.to_dict(), f, ensure_ascii=False, indent=2)
+        status = response.status if response else None
+        if response and classify_response(status, response.headers) == PAGE_CHALLENGE:
+            return response
+        self.rate_limiter.record_response(
+            url, status,
+            retry_after=parse_retry_after(response.headers.get('retry-after')) if response else None)
+        self.pool.report(self.lease.context, status=status)
+        # チャレンジ（403 + cf-mitigated）は呼び出し側で通過を待つ
+        if response and classify_response(status, response.headers) == PAGE_BLOCKED:
+            raise Exception(f"HTTP {status}")
+        return response
+
+    async def _wait_for_challenge(
+        self,
+        url: str,
+        response: Optional[Response],
+        timeout: int = 60000
+    ) -> bool:
+        """チャレンジの通過を待ち、チャレンジだった場合は最終的な結果をフィードバック"""
+        passed = await self.cloudflare_handler.wait_for_challenge_completion(
+            timeout=timeout, response=response)
+        if response and classify_response(response.status, response.headers) == PAGE_CHALLENGE:
+            if passed:
+                # 通過した場合は最初の応答（403等）ではなく成功として記録
+                self.rate_limiter.record_response(url, 200)
+                self.pool.report(self.lease.context, status=200)
+            else:
+                self.rate_limiter.record_response(url, response.status, challenge=True)
+                self.pool.report(self.lease.context, status=response.status, challenge=True)
+        return passed
+
+    async def save_perfume_data(
+        self,
+        perfume: Perfume,
+        on_commit: Optional[CommitCallback] = None
+    ) -> None:
+        """香水データの保存（書き出し後にon_commitを呼ぶ）"""
+        self.logger.info(f"Saving perfume data for {perfume.brand} / {perfume.name}")
+        with get_metrics().phase(PHASE_SAVE):
+            await self.storage.write(RECORD_PERFUME, perfume.to_dict(), on_commit=on_commit)
 
     async def _get_text(self, selector: str) -> str:
         """指定されたセレクターのテキストを取得"""
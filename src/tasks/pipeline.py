@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from typing import Any, Coroutine, Dict, List, Optional, Sequence, Set, Tuple
+
+from config.constants import LETTER_GROUPS
+from config.settings import CATALOG_CONFIG, PIPELINE_CONFIG
+from core.base_task import BaseTask
+from core.channel import Channel
+from scraper.browser_pool import BrowserPool
+from scraper.http_fetcher import FETCH_MODE_BROWSER, FETCH_MODES
+from storage.base import RECORD_FRAGRANCE_BASIC, STORAGE_BACKEND_SEGMENT, iter_saved_records
+from storage.frontier import DONE
+from tasks.brand_scraping import BrandScrapingTask
+from tasks.fragrance_basic_scraping import FragranceBasicScrapingTask
+from tasks.perfume_detail_scraping import PerfumeDetailScrapingTask
+
+
+class PipelineTask(BaseTask):
+    """
+    ブランド → 香水基本情報 → 香水詳細を1プロセスでつなぐパイプライン
+    各ステージは取得した記録を上限付きのチャネルで次のステージへ流し、全ステージが並行に動く
+    詳細取得は基本情報ステージが最初の香水URLを出した時点で始まり、ブランドページを再訪しない
+    ブラウザプールは全ステージで共有する
+
+    チャネルは詳細取得を早く始めるためのもので、取りこぼしはフロンティアで防ぐ
+    基本情報ステージはブランドの書き出しが確定した時点で、完了の記録と同じコールバックで
+    香水URLを詳細取得のフロンティアに登録する（チャネル上の香水URLがクラッシュで失われても残る）
+    前回までに基本情報ステージで完了済みのブランドは再取得しないため、起動時に保存済みの
+    基本情報から香水URLを詳細取得のフロンティアに登録する（ブランドページは再訪しない）
+    """
+
+    def __init__(
+        self,
+        letter_groups: Sequence[int],
+        worker_count: int = 1,
+        context_count: int = 1,
+        fetch_mode: str = FETCH_MODE_BROWSER,
+        storage_backend: str = STORAGE_BACKEND_SEGMENT,
+        incremental: bool = False,
+        config: Optional[Dict] = None
+    ):
+        if fetch_mode not in FETCH_MODES:
+            raise ValueError(f"Unknown fetch mode for pipeline: {fetch_mode}")
+        self.config = {**PIPELINE_CONFIG, **(config or {})}
+        self.letter_groups = list(letter_groups)
+        self.letters = [letter for group in self.letter_groups for letter in LETTER_GROUPS[group]]
+        self.worker_count = max(1, worker_count)
+        self.context_count = max(1, context_count)
+        self.logger = logging.getLogger(__name__)
+
+        # ブランドのワーカー（コンテキスト数まで）・基本情報のワーカー・詳細取得の1ページ分を貸し出す
+        leases = self.context_count + self.worker_count + 1
+        self.pool: Optional[BrowserPool] = BrowserPool({
+            'contexts_per_browser': self.context_count,
+            'max_pages_per_context': -(-leases // self.context_count),
+        })
+        self.brand_channel = Channel(self.config['brand_channel_size'], name='brands')
+        self.perfume_channel = Channel(self.config['perfume_channel_size'], name='perfumes')
+        self.storage_backend = storage_backend
+
+        self.detail_task = PerfumeDetailScrapingTask(
+            fetch_mode=fetch_mode,
+            storage_backend=storage_backend,
+            incremental=incremental,
+            pool=self.pool)
+        self.brand_task = BrandScrapingTask(
+            self.letter_groups,
+            storage_backend=storage_backend,
+            incremental=incremental,
+            context_count=self.context_count,
+            pool=self.pool,
+            brand_sink=self.brand_channel)
+        self.basic_task = FragranceBasicScrapingTask(
+            # フロンティアの種別を単体実行（文字ごと）と分ける
+            letter=''.join(self.letters),
+            worker_count=self.worker_count,
+            context_count=self.context_count,
+            fetch_mode=fetch_mode,
+            storage_backend=storage_backend,
+            incremental=incremental,
+            pool=self.pool,
+            perfume_sink=self.perfume_channel,
+            # 基本情報と詳細取得は同じフロンティアのファイル（brand_data_dir直下）を使う
+            perfume_kind=self.detail_task.perfume_kind)
+        self.stages: List[BaseTask] = [self.brand_task, self.basic_task, self.detail_task]
+
+    async def setup(self) -> None:
+        """共有のブラウザプールを起動し、各ステージをセットアップ"""
+        self.logger.info(
+            f"Setting up pipeline for letter groups {self.letter_groups}: {self.letters}")
+        await self.pool.start()
+        for stage in self.stages:
+            await stage.setup()
+        await self._seed_detail_frontier()
+
+    async def _seed_detail_frontier(self) -> None:
+        """基本情報ステージで完了済みのブランドの香水を、保存済みの基本情報から詳細取得に登録"""
+        done = {
+            payload['name'] for _, payload in self.basic_task.frontier.payloads(
+                self.basic_task.frontier_kind, DONE)
+        }
+        if not done:
+            return
+        # 保存済みレコードの読み込みはスレッドで行い、フロンティアへの登録はこのスレッドで行う
+        items = await asyncio.to_thread(self._saved_perfumes, done)
+        added = self.detail_task.frontier.enqueue_many(self.detail_task.perfume_kind, items)
+        self.logger.info(
+            f"Seeded {added} new perfumes of {len(done)} completed brands "
+            f"from saved basic records ({len(items)} records)")
+
+    def _saved_perfumes(self, brands: Set[str]) -> List[Tuple[str, Dict]]:
+        """保存済みの基本情報のうち、指定したブランドの香水URL"""
+        records = iter_saved_records(
+            self.storage_backend, self.basic_task.output_dir, RECORD_FRAGRANCE_BASIC,
+            catalog_path=self.basic_task.brand_data_dir / CATALOG_CONFIG['filename'])
+        return [(record['url'], {'brand': record['brand_name']})
+                for record in records if record['brand_name'] in brands]
+
+    async def _run_stage(
+        self,
+        coro: Coroutine[Any, Any, None],
+        sink: Optional[Channel]
+    ) -> None:
+        """ステージを実行し、終了時（失敗時も）に出力チャネルを閉じて後続に終端を伝える"""
+        try:
+            await coro
+        finally:
+            if sink:
+                sink.close()
+
+    async def execute(self, **kwargs: Dict[str, Any]) -> None:
+        """全ステージを並行に実行（いずれかが失敗したら残りも止める）"""
+        tasks = [
+            asyncio.create_task(
+                self._run_stage(self.brand_task.execute(), self.brand_channel),
+                name='pipeline:brand'),
+            asyncio.create_task(
+                self._run_stage(
+                    self.basic_task.consume_brands(self.brand_channel), self.perfume_channel),
+                name='pipeline:basic'),
+            asyncio.create_task(
+                self._run_stage(self.detail_task.consume_perfumes(self.perfume_channel), None),
+                name='pipeline:detail'),
+        ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception():
+                    self.logger.error(f"Pipeline stage {task.get_name()} failed, stopping")
+                    raise task.exception()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.logger.info(
+                f"Pipeline channels: {self.brand_channel.get_stats()}, "
+                f"{self.perfume_channel.get_stats()}")
+
+    async def cleanup(self) -> None:
+        """各ステージのリソースを解放してから共有のプールを閉じる"""
+        for stage in self.stages:
+            await stage.cleanup()
+        self.stages = []
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
@@ -1,17 +1,175 @@
+import atexit
+import copy
+import json
 import logging
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
 
 import colorlog
 
+from config.settings import LOGGING_CONFIG
+from utils.tracing import current_span
 
-def setup_logger():
-    """カラーロギングの設定"""
-    # すでにハンドラが設定されている場合は新しいロガーを作成しない
-    logger = logging.getLogger()
-    if logger.handlers:
-        return logger
+# LogRecordの標準属性（JSON出力でextraと区別する）
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """1行1レコードのJSON（extraで渡した項目もそのまま出力）"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created))
+                    + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _ColoredFormatter(colorlog.ColoredFormatter):
+    """色付きの1行形式（間引いた件数があれば末尾に付ける）"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        return f"{text} (+{suppressed} similar suppressed)" if suppressed else text
+
+
+class _SiteState:
+    __slots__ = ('window', 'count', 'suppressed')
+
+    def __init__(self):
+        self.window = -1
+        self.count = 0
+        self.suppressed = 0
+
+
+class LogSampler(logging.Filter):
+    """
+    WARNING未満の高頻度ログを間引くフィルター（ログを出した側のスレッドで実行）
+    呼び出し箇所ごとにウィンドウ内の件数を数え、上限を超えた分はsample_every件に1件だけ通す
+    さらにロガーごとのトークンバケットで毎秒の件数を制限する
+    間引いた件数は同じ箇所から次に通るレコードのsuppressedに付ける
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        super().__init__()
+        self.config = {**LOGGING_CONFIG, **(config or {})}
+        self.sites: Dict[Tuple[str, int], _SiteState] = {}
+        self.buckets: Dict[str, Tuple[float, float]] = {}
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        with self._lock:
+            state = self.sites.setdefault((record.pathname, record.lineno), _SiteState())
+            if not self._sample(state) or not self._take_token(record.name):
+                state.suppressed += 1
+                self.dropped += 1
+                return False
+            if state.suppressed:
+                record.suppressed = state.suppressed
+                state.suppressed = 0
+        return True
+
+    def _sample(self, state: _SiteState) -> bool:
+        window = int(time.monotonic() / self.config['sample_window'])
+        if state.window != window:
+            state.window, state.count = window, 0
+        state.count += 1
+        over = state.count - self.config['sample_burst']
+        return over <= 0 or over % self.config['sample_every'] == 0
+
+    def _take_token(self, name: str) -> bool:
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(name, (self.config['logger_burst'], now))
+        tokens = min(self.config['logger_burst'],
+                     tokens + (now - updated) * self.config['logger_rate'])
+        if tokens < 1:
+            self.buckets[name] = (tokens, now)
+            return False
+        self.buckets[name] = (tokens - 1, now)
+        return True
+
+
+class _TraceContextFilter(logging.Filter):
+    """現在のトレーススパンをレコードに付ける（contextvarsは出力スレッドに引き継がれないため）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        span = current_span()
+        if span is not None:
+            record.trace_id = span.trace_id
+            record.span_id = span.span_id
+        return True
+
+
+class _AsyncQueueHandler(QueueHandler):
+    """メッセージの確定だけを行いキューに積む（書式化は出力スレッドで行う）"""
 
-    handler = colorlog.StreamHandler()
-    handler.setFormatter(colorlog.ColoredFormatter(
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class PrintToLogger:
+    """print()の出力を行単位でロギングに流すストリーム"""
+
+    def __init__(self, logger: logging.Logger, level: int = logging.INFO):
+        self.logger = logger
+        self.level = level
+        self._buffer = ''
+
+    def write(self, text: str) -> int:
+        self._buffer += text
+        while '\n' in self._buffer:
+            line, self._buffer = self._buffer.split('\n', 1)
+            if line.strip():
+                # 呼び出し元のprint()の位置で間引けるようにする
+                self.logger.log(self.level, line.rstrip(), stacklevel=2)
+        return len(text)
+
+    def flush(self) -> None:
+        if self._buffer.strip():
+            self.logger.log(self.level, self._buffer.rstrip())
+        self._buffer = ''
+
+    def isatty(self) -> bool:
+        return False
+
+
+_listener: Optional[QueueListener] = None
+_sampler: Optional[LogSampler] = None
+
+
+def _build_handler(config: Dict) -> logging.Handler:
+    # print()を流す場合でも元の標準エラーに出力する
+    if config['format'] == 'json':
+        handler = logging.StreamHandler(sys.__stderr__)
+        handler.setFormatter(JsonFormatter())
+        return handler
+
+    handler = colorlog.StreamHandler(sys.__stderr__)
+    handler.setFormatter(_ColoredFormatter(
         '%(log_color)s%(levelname)s:%(message)s',
         log_colors={
             'DEBUG':    'cyan',
@@ -21,8 +179,53 @@ def setup_logger():
             'CRITICAL': 'red,bg_white',
         }
     ))
+    return handler
+
 
-    logger.addHandler(handler)
-    logger.setLevel(logging.INFO)
+def setup_logger(config: Optional[Dict] = None):
+    """
+    ロギングの設定
+    レコードはキューに積むだけで、書式化と出力はQueueListenerのスレッドが行う
+    """
+    global _listener, _sampler
+    # すでにハンドラが設定されている場合は新しいロガーを作成しない
+    logger = logging.getLogger()
+    if logger.handlers:
+        return logger
+
+    config = {**LOGGING_CONFIG, **(config or {})}
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _AsyncQueueHandler(log_queue)
+    _sampler = LogSampler(config)
+    queue_handler.addFilter(_sampler)
+    queue_handler.addFilter(_TraceContextFilter())
+
+    _listener = QueueListener(log_queue, _build_handler(config), respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    logger.addHandler(queue_handler)
+    logger.setLevel(config['level'])
+
+    if config['capture_prints']:
+        sys.stdout = PrintToLogger(logging.getLogger('print'))
 
     return logger
+
+
+def log_stats() -> None:
+    """間引いたログの件数を出力"""
+    if _sampler and _sampler.dropped:
+        logging.getLogger(__name__).warning(
+            f"Log sampling suppressed {_sampler.dropped} records")
+
+
+def shutdown_logging() -> None:
+    """キューに残ったレコードを出力して出力スレッドを止める"""
+    global _listener
+    if isinstance(sys.stdout, PrintToLogger):
+        sys.stdout.flush()
+        sys.stdout = sys.__stdout__
+    if _listener:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,289 @@
+# utils/metrics.py
+import asyncio
+import bisect
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config.settings import METRICS_CONFIG
+
+from utils.tracing import get_tracer
+
+# 1ページの取得を分解したフェーズ
+PHASE_GOTO = 'goto'            # ナビゲーション・HTTPリクエスト（応答まで）
+PHASE_LOAD = 'load'            # 応答後の描画・本文の読み込み
+PHASE_CHALLENGE = 'challenge'  # Cloudflareチャレンジの通過待ち
+PHASE_EXTRACT = 'extract'      # DOM・HTMLからの抽出
+PHASE_SAVE = 'save'            # ストレージへの書き出し
+FETCH_PHASES = (PHASE_GOTO, PHASE_LOAD, PHASE_CHALLENGE, PHASE_EXTRACT, PHASE_SAVE)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _format_value(value: float) -> str:
+    # 大きな値（転送バイト数等）が指数表記で丸められないようにする
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """ラベルごとの単調増加カウンター"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[LabelValues, float] = defaultdict(float)
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        self.values[self._key(labels)] += amount
+
+    def total(self, **labels) -> float:
+        """指定したラベルに一致する値の合計"""
+        return sum(
+            value for key, value in self.values.items()
+            if all(key[self.labelnames.index(name)] == str(v) for name, v in labels.items()))
+
+    def render(self, const_names: Sequence[str], const_values: Sequence[str]) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for key, value in sorted(self.values.items()):
+            labels = _format_labels(
+                tuple(const_names) + self.labelnames, tuple(const_values) + key)
+            lines.append(f'{self.name}{labels} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """ラベルごとの累積バケット・合計・件数"""
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = METRICS_CONFIG['latency_buckets']
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts: Dict[LabelValues, List[int]] = {}
+        self.sums: Dict[LabelValues, float] = defaultdict(float)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        counts = self.counts.setdefault(key, [0] * (len(self.buckets) + 1))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[key] += value
+
+    def render(self, const_names: Sequence[str], const_values: Sequence[str]) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        names = tuple(const_names) + self.labelnames + ('le',)
+        for key, counts in sorted(self.counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                labels = _format_labels(names, tuple(const_values) + key + (le,))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(names[:-1], tuple(const_values) + key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(self.sums[key])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class ScrapeMetrics:
+    """
+    スクレイピングのメトリクス（フェーズ別の所要時間・ステータス・再試行・待機・ページ数・転送量・
+    新規レコード数）
+    スケジューラが最大化する指標は1リクエストあたりの新規レコード数（records_per_request）
+    全サンプルにタスク名と文字のラベルを付ける
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.started_at = clock()
+        self.logger = logging.getLogger(__name__)
+        self.const_labels: Dict[str, str] = {'task': '', 'letter': ''}
+
+        self.phase_seconds = Histogram(
+            'kanou_fetch_phase_seconds', 'Time spent per fetch phase', ('phase',))
+        self.responses = Counter(
+            'kanou_responses_total', 'Responses by HTTP status', ('status',))
+        self.retries = Counter(
+            'kanou_retries_total', 'Retried attempts by operation', ('operation',))
+        self.sleep_seconds = Counter(
+            'kanou_sleep_seconds_total', 'Time spent sleeping by reason', ('reason',))
+        self.pages = Counter(
+            'kanou_pages_total', 'Processed pages by kind and result', ('kind', 'result'))
+        self.bytes = Counter(
+            'kanou_bytes_total', 'Response body bytes transferred by source', ('source',))
+        self.records = Counter(
+            'kanou_records_total', 'New or changed records saved by kind', ('kind',))
+        self._metrics = (
+            self.phase_seconds, self.responses, self.retries,
+            self.sleep_seconds, self.pages, self.bytes, self.records)
+
+    def set_labels(self, **labels: Optional[str]) -> None:
+        """全サンプルに付けるラベル（task・letter）を設定"""
+        for name, value in labels.items():
+            self.const_labels[name] = value or ''
+
+    @contextmanager
+    def phase(self, phase: str, **attributes) -> Iterator[None]:
+        """with文の所要時間をフェーズとして記録（例外時も記録）。トレースにも同名のスパンを残す"""
+        started = self.clock()
+        try:
+            with get_tracer().span(phase, **attributes):
+                yield
+        finally:
+            self.phase_seconds.observe(self.clock() - started, phase=phase)
+
+    def record_response(self, status: Optional[int]) -> None:
+        self.responses.inc(status=status if status is not None else 'none')
+
+    def record_page(self, kind: str, result: str = 'ok') -> None:
+        self.pages.inc(kind=kind, result=result)
+
+    def record_records(self, kind: str, count: int) -> None:
+        """保存した新規・変更レコード数を記録（変化のない再取得は含めない）"""
+        if count > 0:
+            self.records.inc(count, kind=kind)
+
+    async def record_transfer(self, response, source: str = 'browser') -> None:
+        """Playwrightの応答から転送されたボディのバイト数を記録"""
+        if response is None:
+            return
+        try:
+            sizes = await response.request.sizes()
+            self.bytes.inc(sizes['responseBodySize'], source=source)
+        except Exception as e:
+            # リダイレクト済み・破棄済みの応答ではサイズを取得できない
+            self.logger.debug(f"Could not read transfer size: {e}")
+
+    async def sleep(self, seconds: float, reason: str) -> None:
+        """待機して待機時間を記録"""
+        self.sleep_seconds.inc(seconds, reason=reason)
+        with get_tracer().span('sleep', reason=reason):
+            await asyncio.sleep(seconds)
+
+    def render(self) -> str:
+        """Prometheusのテキスト形式"""
+        names = tuple(self.const_labels)
+        values = tuple(self.const_labels[name] for name in names)
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(names, values))
+        return '\n'.join(lines) + '\n'
+
+    def get_stats(self) -> Dict:
+        """実行全体のページ数・毎分ページ数・フェーズ別の合計時間・リクエストあたりの新規レコード数"""
+        elapsed = self.clock() - self.started_at
+        pages = self.pages.total(result='ok')
+        records = self.records.total()
+        requests = self.responses.total()
+        phase_totals: Dict[str, float] = defaultdict(float)
+        for key, total in self.phase_seconds.sums.items():
+            phase_totals[key[0]] += total
+        return {
+            'elapsed': elapsed,
+            'pages': pages,
+            'pages_per_minute': pages * 60 / elapsed if elapsed > 0 else 0.0,
+            'phase_seconds': dict(phase_totals),
+            'sleep_seconds': {key[0]: value for key, value in self.sleep_seconds.values.items()},
+            'retries': self.retries.total(),
+            'bytes': self.bytes.total(),
+            'records': records,
+            'requests': requests,
+            'records_per_request': records / requests if requests else 0.0,
+        }
+
+    def log_stats(self) -> None:
+        """集計をログに出力"""
+        stats = self.get_stats()
+        phases = ', '.join(
+            f"{phase} {stats['phase_seconds'].get(phase, 0.0):.1f}s" for phase in FETCH_PHASES)
+        sleeps = ', '.join(f"{reason} {seconds:.1f}s"
+                           for reason, seconds in stats['sleep_seconds'].items())
+        self.logger.info(
+            f"Metrics: {stats['pages']:.0f} pages in {stats['elapsed']:.0f}s "
+            f"({stats['pages_per_minute']:.1f}/min), {stats['retries']:.0f} retries, "
+            f"{stats['bytes'] / (1024 * 1024):.1f} MB, {stats['records']:.0f} records "
+            f"({stats['records_per_request']:.2f}/request); phases: {phases}; "
+            f"sleep: {sleeps or 'none'}")
+
+
+class MetricsServer:
+    """GET /metricsでメトリクスを返す最小限のHTTPサーバー"""
+
+    def __init__(
+        self,
+        metrics: ScrapeMetrics,
+        host: Optional[str] = None,
+        port: Optional[int] = None
+    ):
+        self.metrics = metrics
+        self.host = host or METRICS_CONFIG['host']
+        self.port = METRICS_CONFIG['port'] if port is None else port
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.logger = logging.getLogger(__name__)
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 10)
+            # ヘッダーは読み捨てる
+            while await asyncio.wait_for(reader.readline(), 10) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            path = parts[1].split('?', 1)[0] if len(parts) >= 2 else ''
+            if parts[:1] == ['GET'] and path == '/metrics':
+                status, body = '200 OK', self.metrics.render().encode('utf-8')
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            else:
+                status, body, content_type = '404 Not Found', b'not found\n', 'text/plain'
+            writer.write(
+                f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n'
+                f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode('latin-1')
+                + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def close(self) -> None:
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+
+_default_metrics: Optional[ScrapeMetrics] = None
+
+
+def get_metrics() -> ScrapeMetrics:
+    """プロセス共通のメトリクス"""
+    global _default_metrics
+    if _default_metrics is None:
+        _default_metrics = ScrapeMetrics()
+    return _default_metrics
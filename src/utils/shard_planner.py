@@ -0,0 +1,228 @@
+# utils/shard_planner.py
+import argparse
+import hashlib
+import heapq
+import json
+import logging
+import statistics
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+from config.constants import LETTER_GROUPS
+from config.settings import OUTPUT_DIR, SHARD_PLANNER_CONFIG, TRACING_CONFIG
+from utils.logger import setup_logger
+from utils.tracing import load_spans
+
+logger = logging.getLogger(__name__)
+
+
+def brand_slug(url: str) -> str:
+    """
+    ブランドのURL（/designers/Chanel.html）と香水のURL（/perfume/Chanel/...）に共通する識別子
+    """
+    parts = [part for part in urlparse(url).path.split('/') if part]
+    if len(parts) >= 2 and parts[0] == 'designers':
+        return parts[1].rsplit('.', 1)[0]
+    if len(parts) >= 2 and parts[0] == 'perfume':
+        return parts[1]
+    return ''
+
+
+@dataclass
+class CostModel:
+    """
+    ブランドごとの所要時間の見積もり
+    ブランドページ1件と、perfume_count件の詳細ページの合計とする
+    トレースにブランド別の履歴が十分あればその平均を、なければ全体の中央値（履歴もなければ設定値）を使う
+    """
+    brand_seconds: float
+    perfume_seconds: float
+    brand_history: Dict[str, float] = field(default_factory=dict)
+    perfume_history: Dict[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def from_traces(cls, paths: Iterable[Path], config: Optional[Dict] = None) -> 'CostModel':
+        config = {**SHARD_PLANNER_CONFIG, **(config or {})}
+        brand_spans: Dict[str, List[float]] = defaultdict(list)
+        perfume_spans: Dict[str, List[float]] = defaultdict(list)
+        for path in paths:
+            for span in load_spans(path):
+                attributes = span.get('attributes') or {}
+                if span.get('error'):
+                    continue
+                if span['name'] == 'brand' and attributes.get('brand'):
+                    brand_spans[attributes['brand']].append(span['duration'])
+                elif span['name'] == 'perfume' and attributes.get('url'):
+                    perfume_spans[brand_slug(attributes['url'])].append(span['duration'])
+
+        def overall(spans: Dict[str, List[float]], default: float) -> float:
+            durations = [duration for values in spans.values() for duration in values]
+            return statistics.median(durations) if durations else default
+
+        def per_key(spans: Dict[str, List[float]]) -> Dict[str, float]:
+            return {key: statistics.mean(values) for key, values in spans.items()
+                    if key and len(values) >= config['min_samples']}
+
+        return cls(
+            brand_seconds=overall(brand_spans, config['brand_seconds']),
+            perfume_seconds=overall(perfume_spans, config['perfume_seconds']),
+            brand_history=per_key(brand_spans),
+            perfume_history=per_key(perfume_spans),
+        )
+
+    def cost(self, brand: Dict) -> float:
+        page = self.brand_history.get(brand['name'], self.brand_seconds)
+        perfume = self.perfume_history.get(brand_slug(brand['url']), self.perfume_seconds)
+        return page + int(brand.get('perfume_count') or 0) * perfume
+
+
+@dataclass
+class Shard:
+    index: int
+    brands: List[Dict] = field(default_factory=list)
+    cost: float = 0.0
+
+    @property
+    def perfume_count(self) -> int:
+        return sum(int(brand.get('perfume_count') or 0) for brand in self.brands)
+
+
+def load_brands(data_dir: Union[str, Path]) -> List[Tuple[str, Dict]]:
+    """全ブランドファイルを(文字, ブランド)で読み込む（URLの重複は除く）"""
+    brands: Dict[str, Tuple[str, Dict]] = {}
+    for path in sorted(Path(data_dir).glob('fragrantica_brands_*.json')):
+        letter = path.stem.rsplit('_', 1)[-1]
+        with open(path, 'r', encoding='utf-8') as f:
+            for brand in json.load(f):
+                brands.setdefault(brand['url'], (letter, brand))
+    return list(brands.values())
+
+
+def plan_shards(brands: List[Dict], count: int, model: CostModel) -> List[Shard]:
+    """
+    LPT（見積もりの大きい順に、その時点で最も軽いシャードへ割り当てる）
+    最長シャードの所要時間は最適値の4/3倍以内に収まる
+    """
+    shards = [Shard(index) for index in range(count)]
+    heap = [(0.0, shard.index) for shard in shards]
+    costed = sorted(((model.cost(brand), brand['url'], brand) for brand in brands),
+                    key=lambda item: (-item[0], item[1]))
+    for cost, _, brand in costed:
+        load, index = heapq.heappop(heap)
+        shards[index].brands.append(brand)
+        shards[index].cost = load + cost
+        heapq.heappush(heap, (shards[index].cost, index))
+    return shards
+
+
+def plan_id(shards: List[Shard]) -> str:
+    """計画の内容から決まる短いID（計画を作り直したらフロンティアの種別も変わる）"""
+    digest = hashlib.sha1()
+    for shard in shards:
+        for brand in sorted(brand['url'] for brand in shard.brands):
+            digest.update(f"{shard.index}:{brand}\n".encode('utf-8'))
+    return digest.hexdigest()[:8]
+
+
+def write_manifests(shards: List[Shard], dirname: Union[str, Path]) -> List[Path]:
+    """シャードごとのマニフェスト（shard-01-of-04.json等）を書き出す"""
+    dirname = Path(dirname)
+    dirname.mkdir(parents=True, exist_ok=True)
+    plan = plan_id(shards)
+    width = len(str(len(shards)))
+    paths = []
+    for shard in shards:
+        label = f"shard-{shard.index + 1:0{width}d}-of-{len(shards):0{width}d}"
+        path = dirname / f"{label}.json"
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'plan': plan,
+                'label': label,
+                'shard': shard.index + 1,
+                'shards': len(shards),
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'estimated_seconds': round(shard.cost, 1),
+                'perfume_count': shard.perfume_count,
+                'brands': shard.brands,
+            }, f, ensure_ascii=False, indent=2)
+        paths.append(path)
+    return paths
+
+
+def load_manifest(path: Union[str, Path]) -> Dict:
+    """シャードのマニフェストを読み込む"""
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if 'brands' not in manifest or 'label' not in manifest:
+        raise ValueError(f"Not a shard manifest: {path}")
+    return manifest
+
+
+def manifest_kind(manifest: Dict) -> str:
+    """フロンティアの種別に付ける識別子（同じ計画の同じシャードなら同じ）"""
+    return f"{manifest['plan']}:{manifest['label']}"
+
+
+def letter_group_costs(
+    brands: List[Tuple[str, Dict]],
+    model: CostModel
+) -> Dict[int, float]:
+    """比較用: 現在のアルファベットのグループ分けでの見積もり"""
+    group_of = {letter: group for group, letters in LETTER_GROUPS.items() for letter in letters}
+    costs: Dict[int, float] = defaultdict(float)
+    for letter, brand in brands:
+        costs[group_of.get(letter, 0)] += model.cost(brand)
+    return dict(costs)
+
+
+def _hours(seconds: float) -> str:
+    return f"{seconds / 3600:.1f}h"
+
+
+def report(shards: List[Shard], baseline: Dict[int, float]) -> str:
+    lines = [f"{'shard':>6} {'brands':>7} {'perfumes':>9} {'estimated':>10}"]
+    for shard in shards:
+        lines.append(f"{shard.index + 1:>6} {len(shard.brands):>7} {shard.perfume_count:>9} "
+                     f"{_hours(shard.cost):>10}")
+    costs = [shard.cost for shard in shards]
+    mean = statistics.mean(costs) if costs else 0.0
+    lines.append(f"makespan {_hours(max(costs, default=0.0))}, "
+                 f"imbalance {max(costs, default=0.0) / mean if mean else 0.0:.2f}x")
+    if baseline:
+        groups = ', '.join(f"{group}: {_hours(cost)}" for group, cost in sorted(baseline.items()))
+        lines.append(f"letter groups: {groups} "
+                     f"(makespan {_hours(max(baseline.values()))})")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='全ブランドを見積もり所要時間が均等なシャードに分け、マニフェストを書き出す')
+    parser.add_argument('--shards', type=int, required=True, help='シャード数（コンテナ数）')
+    parser.add_argument('--data-dir', default=str(OUTPUT_DIR), help='ブランドファイルのディレクトリ')
+    parser.add_argument('--traces', default=str(TRACING_CONFIG['dirname']),
+                        help='所要時間の履歴に使うトレース（JSONL）のディレクトリ')
+    parser.add_argument('--out', default=str(SHARD_PLANNER_CONFIG['dirname']),
+                        help='マニフェストの出力先')
+    args = parser.parse_args()
+    if args.shards < 1:
+        parser.error('--shards must be at least 1')
+
+    setup_logger()
+    lettered = load_brands(args.data_dir)
+    trace_files = sorted(Path(args.traces).glob('*.jsonl')) if Path(args.traces).is_dir() else []
+    cost_model = CostModel.from_traces(trace_files)
+    logger.info(
+        f"Loaded {len(lettered)} brands; cost model from {len(trace_files)} traces: "
+        f"{cost_model.brand_seconds:.1f}s per brand page, "
+        f"{cost_model.perfume_seconds:.1f}s per perfume, "
+        f"{len(cost_model.brand_history)} brands with history")
+
+    planned = plan_shards([brand for _, brand in lettered], args.shards, cost_model)
+    for manifest_path in write_manifests(planned, args.out):
+        logger.info(f"Wrote {manifest_path}")
+    print(report(planned, letter_group_costs(lettered, cost_model)))
@@ -0,0 +1,296 @@
+# utils/tracing.py
+import argparse
+import contextvars
+import functools
+import json
+import logging
+import os
+import secrets
+import statistics
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, IO, Iterator, List, Optional, Union
+
+from config.settings import TRACING_CONFIG
+
+
+@dataclass
+class Span:
+    """処理区間（開始時刻はUNIX秒、所要時間は秒）"""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    duration: float = 0.0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': self.start,
+            'duration': self.duration,
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    'current_span', default=None)
+
+
+def current_span() -> Optional[Span]:
+    """現在のタスク・スレッドで開いているスパン"""
+    return _current_span.get()
+
+
+class Tracer:
+    """
+    スパンを入れ子で記録しJSONLに書き出すトレーサー
+    親スパンはcontextvarsで引き継ぐため、asyncioのタスクをまたいでも親子関係が保たれる
+    ルートスパン（ブランド・香水1件）が閉じるたびにファイルへ書き出す
+    """
+
+    def __init__(self, path: Union[str, Path, None] = None):
+        self.path = Path(path) if path else None
+        self._file: Optional[IO[str]] = None
+        self.spans_written = 0
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def open(self, path: Union[str, Path]) -> None:
+        """書き出し先を設定（以降のスパンを記録する）"""
+        self.close()
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.logger.info(f"Writing trace spans to {self.path}")
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """with文の区間をスパンとして記録（無効時はNoneを返すだけ）"""
+        if not self.enabled:
+            yield None
+            return
+        parent = _current_span.get()
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else secrets.token_hex(8),
+            span_id=secrets.token_hex(8),
+            parent_id=parent.span_id if parent else None,
+            start=time.time(),
+            attributes=attributes,
+        )
+        started = time.perf_counter()
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.duration = time.perf_counter() - started
+            self._write(span)
+
+    def add_span(self, name: str, duration: float, **attributes: Any) -> None:
+        """終わった区間（今からduration秒前に開始）を現在のスパンの子として記録"""
+        if not self.enabled:
+            return
+        parent = _current_span.get()
+        self._write(Span(
+            name=name,
+            trace_id=parent.trace_id if parent else secrets.token_hex(8),
+            span_id=secrets.token_hex(8),
+            parent_id=parent.span_id if parent else None,
+            start=time.time() - duration,
+            duration=duration,
+            attributes=attributes,
+        ))
+
+    def _write(self, span: Span) -> None:
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + '\n')
+            self.spans_written += 1
+            # ルートスパンの完了時点でファイルに反映（コンテナ停止時の欠損を抑える）
+            if span.parent_id is None:
+                self._file.flush()
+        except OSError as e:
+            self.logger.error(f"Failed to write trace span: {e}")
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def traced(name: Optional[str] = None, **attributes: Any):
+    """非同期関数の呼び出しをスパンとして記録するデコレーター"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with get_tracer().span(span_name, **attributes):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+_default_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """プロセス共通のトレーサー（open()するまで記録しない）"""
+    global _default_tracer
+    if _default_tracer is None:
+        _default_tracer = Tracer()
+    return _default_tracer
+
+
+def trace_path(task_name: str, label: Optional[str] = None) -> Path:
+    """実行ごとのトレースファイルのパス"""
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    suffix = f"-{label}" if label else ''
+    return Path(TRACING_CONFIG['dirname']) / f"{task_name}{suffix}-{stamp}-{os.getpid()}.jsonl"
+
+
+# レポート
+
+def load_spans(path: Union[str, Path]) -> List[Dict]:
+    spans = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                # 書き込み途中で停止した末尾の行
+                continue
+    return spans
+
+
+def summarize(spans: List[Dict]) -> List[Dict]:
+    """
+    スパン名ごとの件数・合計・自己時間（子スパンを除いた時間）
+    自己時間の大きい順に並べる（どこで時間を使ったかのフレーム集計）
+    """
+    child_time: Dict[str, float] = defaultdict(float)
+    for span in spans:
+        if span['parent_id']:
+            child_time[span['parent_id']] += span['duration']
+
+    by_name: Dict[str, List[Dict]] = defaultdict(list)
+    for span in spans:
+        by_name[span['name']].append(span)
+
+    rows = []
+    for name, group in by_name.items():
+        durations = [span['duration'] for span in group]
+        rows.append({
+            'name': name,
+            'count': len(group),
+            'total': sum(durations),
+            # 並行する子スパンで親を超える場合は0とする
+            'self': sum(max(0.0, span['duration'] - child_time[span['span_id']])
+                        for span in group),
+            'median': statistics.median(durations),
+            'max': max(durations),
+            'errors': sum(1 for span in group if span.get('error')),
+        })
+    return sorted(rows, key=lambda row: row['self'], reverse=True)
+
+
+def _label(span: Dict) -> str:
+    attributes = span.get('attributes') or {}
+    detail = ' '.join(f"{key}={value}" for key, value in attributes.items())
+    error = f" !{span['error']}" if span.get('error') else ''
+    return f"{span['name']}{' ' + detail if detail else ''}{error}"
+
+
+def timeline(spans: List[Dict], root: Dict, width: int = 40) -> List[str]:
+    """1つのルートスパン配下をインデントと開始位置付きのバーで表示"""
+    children: Dict[str, List[Dict]] = defaultdict(list)
+    for span in spans:
+        if span['trace_id'] == root['trace_id'] and span['parent_id']:
+            children[span['parent_id']].append(span)
+
+    total = root['duration'] or 1e-9
+    lines = []
+
+    def walk(span: Dict, depth: int) -> None:
+        offset = span['start'] - root['start']
+        begin = min(width - 1, int(offset / total * width))
+        length = max(1, int(span['duration'] / total * width))
+        bar = ' ' * begin + '#' * min(length, width - begin)
+        lines.append(
+            f"{offset:8.2f}s {span['duration']:8.2f}s |{bar:<{width}}| "
+            f"{'  ' * depth}{_label(span)}")
+        for child in sorted(children[span['span_id']], key=lambda s: s['start']):
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    return lines
+
+
+def report(spans: List[Dict], top: int = 5) -> str:
+    """スパン名ごとの集計と、最も時間のかかったルートスパンのタイムライン"""
+    lines = [f"{'span':<40} {'count':>6} {'total':>10} {'self':>10} "
+             f"{'median':>8} {'max':>8} {'errors':>6}"]
+    for row in summarize(spans):
+        lines.append(
+            f"{row['name'][:40]:<40} {row['count']:>6} {row['total']:>9.1f}s "
+            f"{row['self']:>9.1f}s {row['median']:>7.2f}s {row['max']:>7.2f}s {row['errors']:>6}")
+
+    roots = sorted(
+        (span for span in spans if not span['parent_id']),
+        key=lambda span: span['duration'], reverse=True)
+    for root in roots[:top]:
+        lines.append('')
+        lines.extend(timeline(spans, root))
+    return '\n'.join(lines)
+
+
+def to_chrome_trace(spans: List[Dict]) -> Dict:
+    """chrome://tracing・Perfettoで開けるTrace Event形式（ルートスパンごとに別の行）"""
+    lanes: Dict[str, int] = {}
+    events = []
+    for span in sorted(spans, key=lambda s: s['start']):
+        lane = lanes.setdefault(span['trace_id'], len(lanes) + 1)
+        events.append({
+            'name': span['name'],
+            'ph': 'X',
+            'ts': span['start'] * 1e6,
+            'dur': span['duration'] * 1e6,
+            'pid': 1,
+            'tid': lane,
+            'args': {**(span.get('attributes') or {}), 'error': span.get('error')},
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='トレース（JSONL）のスパン集計とタイムラインを表示')
+    parser.add_argument('path', help='例: data/traces/fragrance_basic_scraping-A-....jsonl')
+    parser.add_argument('--top', type=int, default=5, help='タイムラインを表示するルートスパン数')
+    parser.add_argument('--chrome', help='Trace Event形式のJSONを書き出すパス')
+    args = parser.parse_args()
+
+    loaded = load_spans(args.path)
+    print(report(loaded, top=args.top))
+    if args.chrome:
+        with open(args.chrome, 'w', encoding='utf-8') as f:
+            json.dump(to_chrome_trace(loaded), f)
@@ -0,0 +1,6 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+# モジュールはsrc直下をルートとしてimportする（python src/main.pyと同じ）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
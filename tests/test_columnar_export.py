@@ -0,0 +1,52 @@
+# tests/test_columnar_export.py
+import asyncio
+
+from storage.base import RECORD_PERFUME
+from storage.columnar_export import iter_perfume_records, perfume_id
+from storage.file_storage import write_record_file
+from storage.segment_storage import SegmentStorage
+
+
+def perfume(name: str, strength: int) -> dict:
+    return {
+        'brand': 'Chanel',
+        'name': name,
+        'url': f'https://www.fragrantica.com/perfume/Chanel/{name}.html',
+        'main_accords': [{'name': 'floral', 'strength': strength}],
+    }
+
+
+def write_segments(root, records):
+    async def main():
+        async with SegmentStorage(root / 'perfume_info' / 'segments') as storage:
+            await storage.write_many(RECORD_PERFUME, records)
+    asyncio.run(main())
+
+
+def test_segments_are_deduplicated_keeping_the_last_record(tmp_path):
+    # 再取得で同じ香水が追記された状態
+    write_segments(tmp_path, [perfume('No-5', 10), perfume('Coco', 20), perfume('No-5', 30)])
+
+    records = list(iter_perfume_records(tmp_path))
+    assert [(r['name'], r['main_accords'][0]['strength']) for r in records] == \
+        [('Coco', 20), ('No-5', 30)]
+
+
+def test_compat_files_next_to_segments_are_not_counted_twice(tmp_path):
+    write_segments(tmp_path, [perfume('No-5', 10)])
+    write_record_file(tmp_path / 'perfume_info', RECORD_PERFUME, perfume('No-5', 10))
+
+    assert len(list(iter_perfume_records(tmp_path))) == 1
+
+
+def test_file_tree_is_read_when_there_are_no_segments(tmp_path):
+    for name in ('No-5', 'Coco'):
+        write_record_file(tmp_path / 'perfume_info', RECORD_PERFUME, perfume(name, 10))
+
+    assert sorted(r['name'] for r in iter_perfume_records(tmp_path)) == ['Coco', 'No-5']
+
+
+def test_perfume_id_is_stable_per_url():
+    assert perfume_id(perfume('No-5', 10)) == perfume_id(perfume('No-5', 99))
+    assert perfume_id(perfume('No-5', 10)) != perfume_id(perfume('Coco', 10))
+    assert -2 ** 63 <= perfume_id(perfume('No-5', 10)) < 2 ** 63
@@ -0,0 +1,35 @@
+# tests/test_crawl_state.py
+from storage.crawl_state import CrawlStateStore
+
+URL = 'https://www.fragrantica.com/perfume/Chanel/No-5-40069.html'
+RECORD = {'main_accords': [{'name': 'floral', 'strength': 100}], 'target_gender': ['women']}
+
+
+def test_page_noise_does_not_count_as_a_change(tmp_path):
+    store = CrawlStateStore(tmp_path / 'frontier.sqlite3')
+    first = store.compare_fetch(URL, '<html>ad 1 nonce=a</html>', data=RECORD)
+    assert first.changed
+    store.commit_fetch(first)
+
+    # 広告やトークンだけが変わった本文、キー順の違う同じレコード
+    same = store.compare_fetch(
+        URL, '<html>ad 2 nonce=b</html>', data=dict(reversed(list(RECORD.items()))))
+    assert not same.changed
+
+
+def test_record_change_is_detected(tmp_path):
+    store = CrawlStateStore(tmp_path / 'frontier.sqlite3')
+    store.commit_fetch(store.compare_fetch(URL, data=RECORD))
+
+    changed = {**RECORD, 'target_gender': ['women', 'men']}
+    assert store.compare_fetch(URL, data=changed).changed
+
+
+def test_pending_fetch_is_not_recorded_until_committed(tmp_path):
+    store = CrawlStateStore(tmp_path / 'frontier.sqlite3')
+    pending = store.compare_fetch(URL, data=RECORD, headers={'etag': '"v1"'})
+    assert store.get(URL) is None
+
+    store.commit_fetch(pending)
+    assert store.conditional_headers(URL) == {'If-None-Match': '"v1"'}
+    assert not store.compare_fetch(URL, data=RECORD).changed
@@ -0,0 +1,44 @@
+# tests/test_extractor.py
+from scraper.extractor import PERFUME_LIST_SPEC, parse_perfume_list
+from scraper.utils import perfume_urls
+
+BRAND_URL = 'https://www.fragrantica.com/designers/Chanel.html'
+
+BRAND_PAGE = """
+<html><body>
+<div class="cell text-left prefumeHbox">
+  <h3><a href="/perfume/Chanel/No-5-40069.html">No 5<span style="display:none">x</span></a></h3>
+</div>
+<div class="cell text-left prefumeHbox">
+  <h3><a href="https://www.fragrantica.com/perfume/Chanel/Coco-609.html">Coco<script>t()</script></a></h3>
+</div>
+<div class="cell text-left prefumeHbox">
+  <h3><a href="/news/Chanel-launch.html">News</a></h3>
+</div>
+</body></html>
+"""
+
+EXPECTED = [
+    'https://www.fragrantica.com/perfume/Chanel/No-5-40069.html',
+    'https://www.fragrantica.com/perfume/Chanel/Coco-609.html',
+]
+
+
+def test_perfume_list_spec_returns_absolute_urls_and_visible_names():
+    perfumes = parse_perfume_list(BRAND_PAGE, base_url=BRAND_URL)
+    assert perfumes == [
+        {'name': 'No 5', 'url': EXPECTED[0]},
+        {'name': 'Coco', 'url': EXPECTED[1]},
+        {'name': 'News', 'url': 'https://www.fragrantica.com/news/Chanel-launch.html'},
+    ]
+
+
+def test_perfume_urls_keeps_absolute_spec_output():
+    # ブラウザ経路のスペック（new URL(v, document.baseURI).href）と同じ絶対URLの出力
+    perfumes = PERFUME_LIST_SPEC.extract_html(BRAND_PAGE, base_url=BRAND_URL)['perfumes']
+    assert perfume_urls(perfumes) == EXPECTED
+
+
+def test_perfume_urls_accepts_relative_urls():
+    # base_urlなしでは相対URLのまま返り、ホストを補って同じ結果になる
+    assert perfume_urls(parse_perfume_list(BRAND_PAGE)) == EXPECTED
@@ -0,0 +1,49 @@
+# tests/test_frontier.py
+import storage.frontier as frontier
+from storage.crawl_state import CrawlStateStore
+from storage.frontier import CrawlFrontier, journal_mode_for
+
+
+def journal_mode(conn) -> str:
+    return conn.execute('PRAGMA journal_mode').fetchone()[0]
+
+
+def test_local_volume_uses_wal(tmp_path, monkeypatch):
+    monkeypatch.setattr(frontier, 'filesystem_type', lambda path: 'ext4')
+    assert journal_mode(CrawlFrontier(tmp_path / 'frontier.sqlite3').conn) == 'wal'
+
+
+def test_network_volume_falls_back_to_rollback_journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(frontier, 'filesystem_type', lambda path: 'nfs4')
+    path = tmp_path / 'frontier.sqlite3'
+    assert journal_mode(CrawlFrontier(path).conn) == 'delete'
+    # 同じファイルを使う差分クロールの状態もWALに戻さない
+    assert journal_mode(CrawlStateStore(path).conn) == 'delete'
+
+
+def test_explicit_journal_mode_wins(tmp_path, monkeypatch):
+    monkeypatch.setattr(frontier, 'filesystem_type', lambda path: 'nfs4')
+    assert journal_mode_for(tmp_path / 'frontier.sqlite3', 'WAL') == 'WAL'
+
+
+def test_completed_counts_brands_done_at_least_once(tmp_path):
+    store = CrawlFrontier(tmp_path / 'frontier.sqlite3')
+    store.enqueue_many('brand', [('a', {}), ('b', {}), ('c', {})])
+    for entry in store.dequeue('brand', limit=3):
+        if entry.url != 'c':
+            store.mark_done('brand', entry.url)
+        else:
+            store.release('brand', entry.url)
+    store.requeue('brand', ['a'])
+
+    assert store.completed('brand', ['a', 'b', 'c', 'unknown']) == {'a', 'b'}
+
+
+def test_baseline_is_recorded_only_for_completed_brands(tmp_path):
+    state = CrawlStateStore(tmp_path / 'frontier.sqlite3')
+    brands = [{'url': 'done', 'perfume_count': 10}, {'url': 'never', 'perfume_count': 7}]
+
+    assert state.changed_brands('brand', brands, completed={'done'}) == []
+    assert state.perfume_count('brand', 'done') == 10
+    # 未完了のブランドに基準を残すと、初めての完了で新規0件と数えられる
+    assert state.perfume_count('brand', 'never') is None
@@ -0,0 +1,164 @@
+# tests/test_proxy_handler.py
+import asyncio
+from typing import Dict, List
+
+import pytest
+
+from scraper.proxy_handler import (TorCircuitPool, TorControlError, TorController,
+                                   TorProxyHandler)
+
+OK = ['250 OK']
+
+
+class FakeControlPort:
+    """コマンドごとに用意した応答行を返すTorコントロールポートの代わり"""
+
+    def __init__(self, replies: Dict[str, List[str]]):
+        self.replies = replies
+        self.commands: List[str] = []
+        self.server = None
+
+    async def __aenter__(self) -> 'FakeControlPort':
+        self.server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    @property
+    def port(self) -> int:
+        return self.server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while line := await reader.readline():
+            command = line.decode().rstrip('\r\n')
+            self.commands.append(command)
+            if command == 'QUIT':
+                break
+            keyword = ' '.join(command.split()[:2]) if command.startswith(('SIGNAL', 'GETINFO')) \
+                else command.split()[0]
+            reply = self.replies.get(keyword, ['510 Unrecognized command'])
+            # 空の応答は応答せずに切断する
+            if not reply:
+                break
+            for reply_line in reply:
+                writer.write(reply_line.encode() + b'\r\n')
+            await writer.drain()
+        writer.close()
+
+
+def run(replies, scenario):
+    async def main():
+        async with FakeControlPort(replies) as control:
+            await scenario(control)
+    asyncio.run(main())
+
+
+def test_authenticate_with_password_and_newnym():
+    async def scenario(control):
+        controller = TorController('127.0.0.1', control.port, password='pa"ss')
+        await controller.connect()
+        await controller.signal('NEWNYM')
+        await controller.close()
+        assert control.commands[:2] == ['AUTHENTICATE "pa\\"ss"', 'SIGNAL NEWNYM']
+
+    run({'AUTHENTICATE': OK, 'SIGNAL NEWNYM': OK}, scenario)
+
+
+def test_authenticate_with_cookie(tmp_path):
+    cookie = tmp_path / 'control_auth_cookie'
+    cookie.write_bytes(b'\x01\xab')
+
+    async def scenario(control):
+        controller = TorController('127.0.0.1', control.port, cookie_path=str(cookie))
+        await controller.connect()
+        await controller.close()
+        assert control.commands[0] == 'AUTHENTICATE 01ab'
+
+    run({'AUTHENTICATE': OK}, scenario)
+
+
+def test_authentication_failure_raises():
+    async def scenario(control):
+        controller = TorController('127.0.0.1', control.port, password='wrong')
+        with pytest.raises(TorControlError, match='515'):
+            await controller.connect()
+        await controller.close()
+
+    run({'AUTHENTICATE': ['515 Authentication failed: Password did not match']}, scenario)
+
+
+def test_signal_error_reply_raises():
+    async def scenario(control):
+        controller = TorController('127.0.0.1', control.port, password='')
+        await controller.connect()
+        with pytest.raises(TorControlError, match='552'):
+            await controller.signal('NEWNYM')
+        # エラー応答の後も同じ接続でコマンドを続けられる
+        assert await controller.circuit_established()
+        await controller.close()
+
+    run({
+        'AUTHENTICATE': OK,
+        'SIGNAL NEWNYM': ['552 Unrecognized signal'],
+        'GETINFO status/circuit-established': ['250-status/circuit-established=1', '250 OK'],
+    }, scenario)
+
+
+def test_multiline_data_reply():
+    async def scenario(control):
+        controller = TorController('127.0.0.1', control.port, password='')
+        await controller.connect()
+        assert await controller.get_info('circuit-status') == '\n1 BUILT $A~a\n2 BUILT $B~b'
+        await controller.close()
+
+    run({
+        'AUTHENTICATE': OK,
+        'GETINFO circuit-status': [
+            '250+circuit-status=', '1 BUILT $A~a', '2 BUILT $B~b', '.', '250 OK'],
+    }, scenario)
+
+
+def test_closed_connection_raises():
+    async def scenario(control):
+        controller = TorController('127.0.0.1', control.port, password='')
+        await controller.connect()
+        with pytest.raises(TorControlError, match='closed'):
+            await controller.signal('NEWNYM')
+        await controller.close()
+
+    run({'AUTHENTICATE': OK, 'SIGNAL NEWNYM': []}, scenario)
+
+
+def test_proxy_handler_new_identity():
+    async def scenario(control):
+        assert await TorProxyHandler(control_port=control.port).new_identity()
+        assert control.commands[:2] == ['AUTHENTICATE', 'SIGNAL NEWNYM']
+
+    run({'AUTHENTICATE': OK, 'SIGNAL NEWNYM': OK}, scenario)
+
+
+def test_proxy_handler_new_identity_reports_error_reply():
+    async def scenario(control):
+        assert not await TorProxyHandler(control_port=control.port).new_identity()
+
+    run({'AUTHENTICATE': OK, 'SIGNAL NEWNYM': ['552 Unrecognized signal']}, scenario)
+
+
+def test_circuit_pool_newnym_rotates_identities_and_respects_interval():
+    async def scenario(control):
+        pool = TorCircuitPool(2, {'newnym_interval': 3600})
+        pool.controller = TorController('127.0.0.1', control.port, password='')
+        await pool.controller.connect()
+        usernames = [identity.username for identity in pool.identities]
+
+        assert await pool.new_identity_all()
+        assert [identity.generation for identity in pool.identities] == [1, 1]
+        assert all(i.username != u for i, u in zip(pool.identities, usernames))
+        # 最短間隔内の2回目は送らない
+        assert not await pool.new_identity_all()
+        assert control.commands.count('SIGNAL NEWNYM') == 1
+        await pool.close()
+
+    run({'AUTHENTICATE': OK, 'SIGNAL NEWNYM': OK}, scenario)
@@ -0,0 +1,149 @@
+# tests/test_rate_limiter.py
+import asyncio
+from types import SimpleNamespace
+from typing import Dict, List, Tuple
+
+import pytest
+from playwright.async_api import async_playwright
+
+from scraper.http_fetcher import HttpFetcher
+from scraper.rate_limiter import HostRateLimiter, scale_rate_config
+
+CONFIG = {
+    'initial_rate': 1.0,
+    'min_rate': 0.1,
+    'max_rate': 1.2,
+    'host_max_rate': None,
+    'burst': 1,
+    'additive_increase': 0.1,
+    'multiplicative_decrease': 0.5,
+    'jitter': 0,
+    'cooldown': {429: 60, 403: 45, 'challenge': 30, 'error': 10},
+}
+
+
+class FakeClock:
+    """sleepで時刻を進めるだけの時計（待機時間をそのまま検証できる）"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps: List[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class StubServer:
+    """用意した(ステータス, ヘッダー)を順に返すローカルHTTPサーバー"""
+
+    def __init__(self, responses: List[Tuple[int, Dict[str, str]]]):
+        self.responses = list(responses)
+        self.requests = 0
+        self.server = None
+
+    async def __aenter__(self) -> 'StubServer':
+        self.server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/designers/a.html"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        status, headers = self.responses.pop(0)
+        self.requests += 1
+        body = b'<html><head><title>ok</title></head></html>'
+        head = [f"HTTP/1.1 {status} Stub", f"Content-Length: {len(body)}", "Connection: close"]
+        head += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + body)
+        await writer.drain()
+        writer.close()
+
+
+def run_against_stub(responses, scenario):
+    """スタブサーバーとHttpFetcher（ブラウザ不要のAPIリクエスト）でシナリオを実行"""
+    async def main():
+        clock = FakeClock()
+        limiter = HostRateLimiter(CONFIG, clock=clock, sleep=clock.sleep)
+        async with StubServer(responses) as server, async_playwright() as playwright:
+            request = await playwright.request.new_context()
+            try:
+                fetcher = HttpFetcher(SimpleNamespace(request=request), rate_limiter=limiter)
+                await scenario(fetcher, limiter, clock, server)
+            finally:
+                await request.dispose()
+    asyncio.run(main())
+
+
+def test_429_halves_rate_and_blocks_for_cooldown():
+    async def scenario(fetcher, limiter, clock, server):
+        result = await fetcher.fetch(server.url)
+        assert result.status == 429
+        bucket = limiter._bucket(server.url)
+        assert bucket.rate == pytest.approx(0.5)
+        assert bucket.tokens == 0
+        assert bucket.blocked_until == pytest.approx(clock.now + 60)
+
+        # 次のリクエストはクールダウンが明けるまで送られない
+        throttled_at = clock.now
+        result = await fetcher.fetch(server.url)
+        assert result.status == 200
+        assert clock.now - throttled_at == pytest.approx(60)
+        assert server.requests == 2
+
+    run_against_stub([(429, {}), (200, {})], scenario)
+
+
+def test_retry_after_extends_but_never_shortens_cooldown():
+    async def scenario(fetcher, limiter, clock, server):
+        bucket = limiter._bucket(server.url)
+        await fetcher.fetch(server.url)
+        assert bucket.blocked_until == pytest.approx(clock.now + 120)
+
+        clock.now = bucket.blocked_until
+        await fetcher.fetch(server.url)
+        assert bucket.blocked_until == pytest.approx(clock.now + 60)
+        assert bucket.rate == pytest.approx(0.25)
+
+    run_against_stub([(429, {'Retry-After': '120'}), (429, {'Retry-After': '5'})], scenario)
+
+
+def test_challenge_uses_challenge_cooldown():
+    async def scenario(fetcher, limiter, clock, server):
+        result = await fetcher.fetch(server.url)
+        assert result.challenge
+        bucket = limiter._bucket(server.url)
+        assert bucket.rate == pytest.approx(0.5)
+        assert bucket.blocked_until == pytest.approx(clock.now + 30)
+
+    run_against_stub([(403, {'Server': 'cloudflare'})], scenario)
+
+
+def test_success_increases_rate_additively_up_to_max_rate():
+    async def scenario(fetcher, limiter, clock, server):
+        bucket = limiter._bucket(server.url)
+        await fetcher.fetch(server.url)
+        assert bucket.rate == pytest.approx(1.1)
+        await fetcher.fetch(server.url)
+        await fetcher.fetch(server.url)
+        assert bucket.rate == pytest.approx(1.2)
+        # 1トークンずつ補充を待つ（バケット容量1、初回はトークンあり）
+        assert clock.sleeps == [pytest.approx(1 / 1.1), pytest.approx(1 / 1.2)]
+
+    run_against_stub([(200, {})] * 3, scenario)
+
+
+def test_scale_rate_config_caps_at_host_max_rate():
+    assert scale_rate_config(1, {'max_rate': 1.0, 'host_max_rate': 2.5})['max_rate'] == 1.0
+    assert scale_rate_config(2, {'max_rate': 1.0, 'host_max_rate': 2.5})['max_rate'] == 2.0
+    assert scale_rate_config(4, {'max_rate': 1.0, 'host_max_rate': 2.5})['max_rate'] == 2.5